@@ -1,9 +1,215 @@
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, render_template, request, redirect, url_for, jsonify, stream_with_context, abort, g
+from werkzeug.exceptions import RequestEntityTooLarge
+import hashlib
 import json
-from objects import CompactSurface
-from classification import surface_classification_printing, classification_2, compute_homology_groups
+import logging
+import os
+import queue
+import socket
+import time
+from array import array
+import metrics
+from payloads import surface_from_payload, surface_from_line, read_binary_word, BINARY_MIMETYPE
+from notation import parse_word
+from streams import iter_json_values, read_limited, PayloadTooLarge
+from words import SignedWord, as_word
+from execution import ClassificationPool, ClassificationCancelled
+from jobs import JobQueue
+from incremental import SessionStore
+from result_cache import ResultCache, surface_key
+from homology import check_homology
+from presentation import polygon_presentation
+from classification import classification_message, compute_homology_groups, fundamental_group_presentation
 
 app = Flask(__name__)
+# classification engine used by the web app, one of classification.ENGINES
+app.config["CLASSIFICATION_ENGINE"] = os.environ.get("CLASSIFICATION_ENGINE", "reduction")
+# classifications never change, so API responses can be cached for a long time
+app.config["API_CACHE_MAX_AGE"] = int(os.environ.get("API_CACHE_MAX_AGE", 86400))
+# surfaces with more edges than INLINE_LIMIT are classified in a pool of POOL_WORKERS processes,
+# and every classification is cancelled after CLASSIFICATION_DEADLINE seconds
+app.config["INLINE_LIMIT"] = int(os.environ.get("INLINE_LIMIT", 2000))
+app.config["POOL_WORKERS"] = int(os.environ.get("POOL_WORKERS", os.cpu_count() or 1))
+app.config["CLASSIFICATION_DEADLINE"] = float(os.environ.get("CLASSIFICATION_DEADLINE", 30))
+
+pool = ClassificationPool(max_workers=app.config["POOL_WORKERS"], inline_limit=app.config["INLINE_LIMIT"])
+
+# polygons being edited in the input page, reclassified incrementally after every edit. They are
+# stored in the SQLite file SESSION_STORE, in the instance folder by default, so that any worker of
+# the app can take the next edit of a session
+app.config["MAX_SESSIONS"] = int(os.environ.get("MAX_SESSIONS", 1000))
+app.config["SESSION_STORE"] = os.environ.get("SESSION_STORE", os.path.join(app.instance_path, "sessions.sqlite3"))
+sessions = SessionStore(app.config["SESSION_STORE"], max_sessions=app.config["MAX_SESSIONS"])
+
+# with VERIFY_HOMOLOGY=1 every classification of a surface with at most INLINE_LIMIT edges is checked
+# against the homology computed from the chain complex of the submitted polygon, and responses
+# carry the result of the check
+app.config["VERIFY_HOMOLOGY"] = os.environ.get("VERIFY_HOMOLOGY", "0") not in ("", "0")
+
+# classifications are cached in the SQLite file RESULT_CACHE shared by all the worker processes of
+# the app, in the instance folder by default, and RESULT_CACHE="" turns the cache off. With
+# RESULT_CACHE_WARM_UP=1 the common surfaces are stored at startup
+app.config["RESULT_CACHE"] = os.environ.get("RESULT_CACHE", os.path.join(app.instance_path, "results.sqlite3"))
+app.config["RESULT_CACHE_ENTRIES"] = int(os.environ.get("RESULT_CACHE_ENTRIES", 100000))
+app.config["RESULT_CACHE_WARM_UP"] = os.environ.get("RESULT_CACHE_WARM_UP", "0") not in ("", "0")
+results = None
+if app.config["RESULT_CACHE"]:
+    results = ResultCache(app.config["RESULT_CACHE"], max_entries=app.config["RESULT_CACHE_ENTRIES"])
+    if app.config["RESULT_CACHE_WARM_UP"]:
+        results.warm_up()
+
+# surfaces submitted to /api/jobs are classified in the background by a pool of JOB_WORKERS
+# processes of their own, so they never compete with the requests for the pool above. At most
+# JOB_QUEUE_SIZE jobs wait in every worker of the app, further ones are refused with 503, and a job
+# fails after JOB_DEADLINE seconds. The job records are kept in the SQLite file JOB_STORE, in the
+# instance folder by default, so the status of a job can be polled from any worker
+app.config["JOB_WORKERS"] = int(os.environ.get("JOB_WORKERS", 1))
+app.config["JOB_QUEUE_SIZE"] = int(os.environ.get("JOB_QUEUE_SIZE", 100))
+app.config["JOB_DEADLINE"] = float(os.environ.get("JOB_DEADLINE", 3600))
+app.config["JOB_STORE"] = os.environ.get("JOB_STORE", os.path.join(app.instance_path, "jobs.sqlite3"))
+jobs = JobQueue(
+    app.config["JOB_STORE"],
+    ClassificationPool(max_workers=app.config["JOB_WORKERS"], inline_limit=0),
+    workers=app.config["JOB_WORKERS"],
+    max_pending=app.config["JOB_QUEUE_SIZE"],
+    timeout=app.config["JOB_DEADLINE"],
+    cache=results,
+)
+
+# bodies larger than MAX_BODY_BYTES are refused with 413, before they are read when they say their
+# length, and as soon as they go past it otherwise. Flask enforces it on every route, and in the
+# streamed batches every payload is also limited to MAX_JSON_VALUE characters
+app.config["MAX_BODY_BYTES"] = int(os.environ.get("MAX_BODY_BYTES", 64 << 20))
+app.config["MAX_CONTENT_LENGTH"] = app.config["MAX_BODY_BYTES"]
+app.config["MAX_JSON_VALUE"] = int(os.environ.get("MAX_JSON_VALUE", 16 << 20))
+
+logger = logging.getLogger(__name__)
+
+
+def homology_check(surface, classification):
+    # None unless the verification mode is on. The check runs on the request thread, so like the
+    # presentation it is skipped for surfaces too large to be classified inline
+    if not app.config["VERIFY_HOMOLOGY"] or len(as_word(surface)) > app.config["INLINE_LIMIT"]:
+        return None
+    check = check_homology(surface, classification)
+    if not check["agrees"]:
+        logger.warning("Classification %s of %s disagrees with its homology %s", classification, surface, check)
+    return check
+
+
+def presentation_requested():
+    # the presentation read from the polygon is only computed when the request asks for it with
+    # presentation=1, in the query string or in the form
+    return request.values.get("presentation", "0") not in ("", "0")
+
+
+def surface_presentation(surface):
+    # presentations read from the submitted polygon itself, raw and simplified. They are computed
+    # on the request thread, so only for surfaces small enough to be classified inline
+    if len(as_word(surface)) > app.config["INLINE_LIMIT"]:
+        return None
+    return polygon_presentation(surface)
+
+
+# JSON version of the output page, for programmatic clients. The presentation of the surface is
+# only added if presentation is set
+def classification_result(classification, surface=None, presentation=False):
+    orientability, genus = classification
+    result = {
+        "orientability": orientability,
+        "genus": genus,
+        "surface": classification_message(classification),
+        "homology": compute_homology_groups(classification),
+        "fundamental_group": fundamental_group_presentation(classification),
+    }
+    if surface is not None:
+        presentation = surface_presentation(surface) if presentation else None
+        if presentation is not None:
+            result["presentation"] = presentation
+        check = homology_check(surface, classification)
+        if check is not None:
+            result["homology_check"] = check
+    return result
+
+
+def read_body():
+    """
+    The body of the request as bytes, or as a SignedWord if it is a binary word (see payloads.py),
+    which is decoded while it is read. Raises PayloadTooLarge or ValueError.
+    """
+    limit = app.config["MAX_BODY_BYTES"]
+    if request.content_length is not None and request.content_length > limit:
+        raise PayloadTooLarge(f"The body is larger than {limit} bytes")
+    if request.mimetype == BINARY_MIMETYPE:
+        return read_binary_word(request.stream, limit)
+    return read_limited(request.stream, limit)
+
+
+def surface_from_body(body):
+    # the surface of a body read by read_body: a binary word, a word in the notation of
+    # notation.py (text/plain) or a JSON payload
+    if isinstance(body, SignedWord):
+        return body
+    if request.mimetype == "text/plain":
+        return parse_word(body.decode("utf-8"))
+    return surface_from_payload(json.loads(body))
+
+
+# the WSGI servers we use put the client socket in the environ, so we can notice that the client
+# went away while its surface is still being classified
+def client_disconnected(environ):
+    sock = environ.get("werkzeug.socket") or environ.get("gunicorn.socket")
+    if sock is None:
+        return False
+    try:
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+    except (BlockingIOError, InterruptedError):
+        return False
+    except OSError:
+        return True
+
+
+# classification of the surface of a request, from the result cache or off the request thread
+# if it is large. The lookup of a large surface in the cache also runs in the pool
+def run_classification(surface, environ):
+    return pool.classify(
+        surface,
+        app.config["CLASSIFICATION_ENGINE"],
+        timeout=app.config["CLASSIFICATION_DEADLINE"],
+        cancelled=lambda: client_disconnected(environ),
+        cache=results,
+    )
+
+
+# latency of every request, by route and status, when metrics are enabled
+@app.before_request
+def start_timer():
+    if metrics.enabled:
+        g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_latency(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.request_seconds.observe(time.perf_counter() - start, endpoint, response.status_code)
+    return response
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def body_too_large(e):
+    # the API answers in JSON like for PayloadTooLarge, the pages with the default error page
+    if request.path.startswith("/api/"):
+        return jsonify(error=f"The body is larger than {app.config['MAX_BODY_BYTES']} bytes"), 413
+    return e
+
+
+@app.route('/metrics')
+def metrics_page():
+    # Prometheus text format, the counters stay at zero unless SURFACE_METRICS is set
+    return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 
 @app.route('/')
 def input_page():
@@ -12,57 +218,42 @@ def input_page():
 @app.route('/output', methods=['POST'])
 def output_page():
     if request.method == 'POST':
-        # Get the surface data from the form input
-        surface_data = request.form['surface_input']
-
-        # Parse the JSON string into a Python dictionary
-        surface_data = json.loads(surface_data)
-
-        # Extract vertices, edges, and pairs from the surface data
-        vertices = int(surface_data['vertices'])  # Ensure it's an integer
-        edges = surface_data['edges']  # List of edge pairs
-        pairs = surface_data['pairs']  # List of edge pairings
-
-        # Convert edges and pairs into sets of tuples for CompactSurface
-        EDGES = set()
-        gluing = set()
-
-        # Create a set of edges
-        for edge in edges:
-            u, v = edge[0], edge[1]
-            EDGES.add((u, v))  # Add the edge as a tuple (u, v)
+        if request.form.get('word'):
+            # the word typed in the input page, for example a b a^-1 b^-1
+            try:
+                surface = parse_word(request.form['word'])
+            except ValueError as e:
+                abort(400, str(e))
+        else:
+            # Get the surface data from the form input
+            surface_data = request.form['surface_input']
 
-        # Create the gluing (pairing) set
-        for pair in pairs:
-            edge1 = pair[0]
-            edge2 = pair[1]
-            u, v = edge1[0], edge1[1]
-            x, y = edge2[0], edge2[1]
-            gluing.add(((u, v), (x, y)))  # Add the paired edges as a tuple of tuples
+            try:
+                # Parse the JSON string into a Python dictionary
+                surface_data = json.loads(surface_data)
 
-        # Create a CompactSurface object with the vertices, edges, and gluing data
-        surface = CompactSurface(vertices, EDGES, gluing)
+                # Build the surface from the payload
+                surface = surface_from_payload(surface_data)
+            except (KeyError, IndexError, TypeError, ValueError, OverflowError) as e:
+                abort(400, str(e))
 
-        # Classify the surface (e.g., find its genus, orientability, etc.)
-        classified_surface = surface_classification_printing(surface)
+        # classify returns a tuple with orientability and genus info
+        try:
+            surface1 = run_classification(surface, request.environ)
+        except TimeoutError:
+            abort(503, "The classification of this surface took too long")
+        except ClassificationCancelled:
+            # the client closed the connection, nobody will read the page
+            return "", 499
 
-        # classification_2 returns a tuple with orientability and genus info
-        surface1 = classification_2(surface)
+        # Describe the classified surface (e.g., its genus, orientability, etc.)
+        classified_surface = classification_message(surface1)
 
         # Compute the homology groups based on the classified surface
         homology = compute_homology_groups(surface1)
 
         # Determine the fundamental group based on the surface type and genus
-        orientability, genus = surface1
-        if orientability == 1:
-            # Orientable surface fundamental group
-            if genus == 0:
-                fundamental_group = "{1}"  # Trivial group for the sphere
-            else:
-                fundamental_group = "⟨ a_1, b_1, ..., a_{g}, b_{g} | [a_1, b_1]...[a_{g}, b_{g}] = 1 ⟩"
-        else:
-            # Non-orientable surface fundamental group
-            fundamental_group = "⟨ a_1, a_2, ..., a_{g} | a_1^2...a_{g}^2 = 1 ⟩"
+        fundamental_group = fundamental_group_presentation(surface1)
 
         # Render the output page and pass the computed data to the template
         return render_template(
@@ -70,8 +261,258 @@ def output_page():
             classified_surface=classified_surface,
             homology=homology,
             fundamental_group=fundamental_group,
-            surface1=surface1  # Pass surface1 to the template
+            surface1=surface1,  # Pass surface1 to the template
+            homology_check=homology_check(surface, surface1),
+            presentation=surface_presentation(surface) if presentation_requested() else None
         )
 
+
+def classify_request(surface):
+    # (classification, None), or (None, error response) if the classification was stopped
+    try:
+        return run_classification(surface, request.environ), None
+    except TimeoutError as e:
+        return None, (jsonify(error=str(e)), 503)
+    except ClassificationCancelled as e:
+        return None, (jsonify(error=str(e)), 499)
+
+
+@app.route('/api/classify', methods=['POST'])
+def api_classify():
+    try:
+        surface = surface_from_body(read_body())
+    except PayloadTooLarge as e:
+        return jsonify(error=str(e)), 413
+    except (KeyError, IndexError, TypeError, ValueError, OverflowError) as e:
+        return jsonify(error=str(e)), 400
+    classification, error = classify_request(surface)
+    if error is not None:
+        return error
+    return jsonify(classification_result(classification, surface, presentation_requested()))
+
+
+@app.route('/api/classify', methods=['GET'])
+def api_classify_query():
+    """
+    GET /api/classify?word=a b a^-1 b^-1, with the word in the notation of notation.py or as signed
+    labels (1 2 -1 -2). The response only depends on the surface, so it can be cached by shared
+    caches and the ETag is its canonical key: rotating, reflecting or relabeling the word gives
+    the same tag, and a matching If-None-Match is answered with 304. With presentation=1 the
+    response has the presentation read from this very word, and the tag also covers the word.
+    """
+    try:
+        surface = surface_from_line(request.args["word"])
+    except KeyError:
+        return jsonify(error="The word of the surface must be given in the word parameter"), 400
+    except (IndexError, TypeError, ValueError, OverflowError) as e:
+        return jsonify(error=str(e)), 400
+    presentation = presentation_requested()
+    etag = surface_key(surface).hex()
+    if presentation:
+        etag += "-" + hashlib.sha256(array("i", as_word(surface)).tobytes()).hexdigest()[:32]
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        classification, error = classify_request(surface)
+        if error is not None:
+            return error
+        response = jsonify(classification_result(classification, surface if presentation else None, presentation))
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config["API_CACHE_MAX_AGE"]
+    return response
+
+
+@app.route('/api/classify/batch', methods=['POST'])
+def api_classify_batch():
+    # the body is a JSON array or NDJSON of payloads, answered with one NDJSON line per payload
+    # as soon as it is classified, so the upload is never held in memory as a whole
+    stream = request.stream
+    environ = request.environ
+    presentation = presentation_requested()
+    max_value = app.config["MAX_JSON_VALUE"]
+
+    def results():
+        values = enumerate(iter_json_values(stream, max_value))
+        while True:
+            try:
+                index, surface_data = next(values)
+            except StopIteration:
+                return
+            except RequestEntityTooLarge:
+                # the response has started, the error can only be the last line
+                yield json.dumps({"error": f"The body is larger than {app.config['MAX_BODY_BYTES']} bytes"}) + "\n"
+                return
+            try:
+                if isinstance(surface_data, Exception):
+                    raise surface_data
+                surface = surface_from_payload(surface_data)
+                surface1 = run_classification(surface, environ)
+                result = {"index": index, **classification_result(surface1, surface, presentation)}
+            except (KeyError, IndexError, TypeError, ValueError, OverflowError, TimeoutError) as e:
+                result = {"index": index, "error": str(e)}
+            except ClassificationCancelled:
+                # nobody is listening anymore
+                return
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return app.response_class(stream_with_context(results()), mimetype="application/x-ndjson")
+
+
+@app.route('/api/pool')
+def api_pool():
+    # queue depth and usage of the process pool
+    return jsonify(pool.stats())
+
+
+@app.route('/api/cache')
+def api_cache():
+    # hits, misses, entries and evictions of the result cache, added up over all the workers
+    if results is None:
+        return jsonify(error="The result cache is disabled"), 404
+    return jsonify(results.stats())
+
+
+@app.route('/api/jobs', methods=['POST'])
+def api_submit_job():
+    # for surfaces too large to classify within a request: returns the id of a background job
+    try:
+        surface = surface_from_body(read_body())
+    except PayloadTooLarge as e:
+        return jsonify(error=str(e)), 413
+    except (KeyError, IndexError, TypeError, ValueError, OverflowError) as e:
+        return jsonify(error=str(e)), 400
+    try:
+        job_id = jobs.submit(surface, app.config["CLASSIFICATION_ENGINE"])
+    except queue.Full as e:
+        response = jsonify(error=f"Too many jobs are waiting: {e}")
+        response.status_code = 503
+        response.headers["Retry-After"] = "60"
+        return response
+    response = jsonify(
+        id=job_id,
+        status_url=url_for('api_job_status', job_id=job_id),
+        result_url=url_for('api_job_result', job_id=job_id),
+    )
+    response.status_code = 202
+    response.headers["Location"] = url_for('api_job_status', job_id=job_id)
+    return response
+
+
+@app.route('/api/jobs/<job_id>')
+def api_job_status(job_id):
+    status = jobs.status(job_id)
+    if status is None:
+        return jsonify(error="Unknown job"), 404
+    return jsonify(status)
+
+
+@app.route('/api/jobs/<job_id>/result')
+def api_job_result(job_id):
+    status = jobs.status(job_id, with_result=True)
+    if status is None:
+        return jsonify(error="Unknown job"), 404
+    result = status.pop("result")
+    if status["status"] == "failed":
+        return jsonify(error=status["error"]), 422
+    if status["status"] != "done":
+        # not finished yet, the client should poll again
+        return jsonify(status), 202
+    return jsonify(classification_result(result))
+
+
+def session_summary(session_id, session):
+    # the classification of a session and its counts, which take O(1) after an edit
+    classification = session.classification()
+    return {
+        "id": session_id,
+        "version": session.version,
+        "edges": len(session.labels),
+        "vertex_classes": session.vertex_classes,
+        "orientability": classification[0],
+        "genus": classification[1],
+        "surface": classification_message(classification),
+    }
+
+
+def session_state(session_id, session):
+    # the summary with the word and the whole classification result, which take O(n)
+    word = session.word()
+    return {**session_summary(session_id, session), "word": word,
+            **classification_result(session.classification(), word, presentation_requested())}
+
+
+def parse_edits(edits, size):
+    # a list of edits {"flip": position} or {"swap": [position, position]}, checked before any
+    # of them is applied so that a bad request leaves the session as it was
+    if isinstance(edits, dict):
+        edits = [edits]
+    if not isinstance(edits, list):
+        raise TypeError("Edits must be an object or a list of objects")
+    parsed = []
+    for edit in edits:
+        if not isinstance(edit, dict) or len(edit) != 1:
+            raise ValueError("Every edit must be either {\"flip\": position} or {\"swap\": [position, position]}")
+        (operation, positions), = edit.items()
+        if operation == "flip":
+            positions = [positions]
+        elif operation != "swap" or not isinstance(positions, list) or len(positions) != 2:
+            raise ValueError("Every edit must be either {\"flip\": position} or {\"swap\": [position, position]}")
+        for position in positions:
+            if isinstance(position, bool) or not isinstance(position, int) or not 0 <= position < size:
+                raise IndexError(f"Position {position!r} is not an edge of the polygon")
+        parsed.append((operation, positions))
+    return parsed
+
+
+@app.route('/api/sessions', methods=['POST'])
+def api_create_session():
+    try:
+        session_id, session = sessions.create(surface_from_body(read_body()))
+    except PayloadTooLarge as e:
+        return jsonify(error=str(e)), 413
+    except (KeyError, IndexError, TypeError, ValueError, OverflowError) as e:
+        return jsonify(error=str(e)), 400
+    with session.lock:
+        response = jsonify(session_summary(session_id, session))
+    response.status_code = 201
+    response.headers["Location"] = url_for('api_session', session_id=session_id)
+    return response
+
+
+@app.route('/api/sessions/<session_id>', methods=['GET', 'DELETE'])
+def api_session(session_id):
+    # the word of the session and the whole classification result
+    if request.method == 'DELETE':
+        if not sessions.delete(session_id):
+            return jsonify(error="Unknown session"), 404
+        return "", 204
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify(error="Unknown session"), 404
+    with session.lock:
+        return jsonify(session_state(session_id, session))
+
+
+@app.route('/api/sessions/<session_id>/edits', methods=['POST'])
+def api_edit_session(session_id):
+    # applies the edits in order and answers with the new classification and counts only, the
+    # word is at GET /api/sessions/<id>
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify(error="Unknown session"), 404
+    try:
+        # edits never change the number of edges
+        edits = parse_edits(json.loads(read_limited(request.stream, app.config["MAX_BODY_BYTES"])), len(session.labels))
+    except PayloadTooLarge as e:
+        return jsonify(error=str(e)), 413
+    except (IndexError, TypeError, ValueError, OverflowError) as e:
+        return jsonify(error=str(e)), 400
+    session = sessions.edit(session_id, edits)
+    if session is None:
+        return jsonify(error="Unknown session"), 404
+    with session.lock:
+        return jsonify(session_summary(session_id, session))
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,159 @@
+import numpy as np
+
+# operations on many surfaces at once.
+# A batch of surfaces is a collection of signed words (see words.py) stored either as a 2D array,
+# one word per row, or as a ragged pair (offsets, values) where the word of surface k is
+# values[offsets[k]:offsets[k + 1]]. In a batch the labels of a word with n letters must be
+# 1, ..., n/2, each used exactly twice, and the sign of a letter gives the direction of its edge.
+
+
+def as_ragged(words, offsets=None):
+    # returns the batch as (offsets, values) arrays
+    if offsets is None:
+        words = np.asarray(words)
+        if words.ndim != 2:
+            raise ValueError("A batch of words must be a 2D array or an (offsets, values) pair")
+        count, length = words.shape
+        return np.arange(count + 1, dtype=np.int64) * length, words.reshape(-1)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    values = np.asarray(words).reshape(-1)
+    if offsets.ndim != 1 or len(offsets) == 0 or offsets[0] != 0 or offsets[-1] != len(values) or np.any(np.diff(offsets) < 0):
+        raise ValueError("Offsets must increase from 0 to the number of values")
+    return offsets, values
+
+
+def validate_batch(words, offsets=None):
+    """
+    Validates a whole batch of signed words with vectorized operations instead of building a
+    SignedWord or a CompactSurface for each of them.
+    Returns a dictionary {index: error message} with the first error of every invalid surface,
+    so an empty dictionary means that the whole batch is valid.
+    """
+    offsets, values = as_ragged(words, offsets)
+    count = len(offsets) - 1
+    lengths = np.diff(offsets)
+    rows = np.repeat(np.arange(count), lengths)
+    labels = np.abs(values).astype(np.int64)
+
+    # checks in the order in which they are reported, each one a boolean per surface
+    bad_length = (lengths <= 0) | (lengths % 2 != 0)
+    bad_zero = np.bincount(rows, weights=(values == 0), minlength=count) > 0
+    out_of_range = labels > (lengths // 2)[rows]
+    bad_range = np.bincount(rows, weights=out_of_range, minlength=count) > 0
+
+    # count how many times every (surface, label) appears, with labels in range
+    halves = lengths // 2
+    starts = np.concatenate(([0], np.cumsum(halves)))
+    valid = (values != 0) & ~out_of_range
+    keys = starts[rows[valid]] + labels[valid] - 1
+    uses = np.bincount(keys, minlength=starts[-1])
+    label_rows = np.repeat(np.arange(count), halves)
+    bad_uses = np.bincount(label_rows, weights=(uses != 2), minlength=count) > 0
+
+    checks = [
+        (bad_length, "A signed word must have an even positive number of letters"),
+        (bad_zero, "Labels of a signed word must be nonzero integers"),
+        (bad_range, "Labels of a word with n letters must be in range(1, n/2 + 1)"),
+        (bad_uses, "Each label must appear exactly twice"),
+    ]
+    errors = {}
+    for failed, message in checks:
+        for index in np.flatnonzero(failed):
+            errors.setdefault(int(index), message)
+    return errors
+
+
+def _components(size, u, v):
+    # connected components of the graph on range(size) with edges (u[i], v[i]), as an array
+    # giving for every node the smallest node of its component. Every round hooks the root of
+    # each edge endpoint to the smaller of the two roots and then jumps pointers until every
+    # node points to a root, so the number of rounds grows like the log of the component size
+    parent = np.arange(size)
+    while True:
+        root_u = parent[u]
+        root_v = parent[v]
+        low = np.minimum(root_u, root_v)
+        hooked = parent.copy()
+        np.minimum.at(hooked, root_u, low)
+        np.minimum.at(hooked, root_v, low)
+        while True:
+            jumped = hooked[hooked]
+            if np.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+        if np.array_equal(hooked, parent):
+            return parent
+        parent = hooked
+
+
+# letters classified together by classify_batch: the surfaces are independent, so working on
+# groups small enough to stay in cache is about twice as fast as one pass over the whole batch
+CHUNK_LETTERS = 1 << 16
+
+
+def classify_batch(words, offsets=None, validate=True):
+    """
+    Classifies a whole batch of signed words (a 2D array or an (offsets, values) pair) with
+    vectorized NumPy operations.
+    Returns three arrays with one entry per surface: the orientability and the genus, as in the
+    tuple returned by classification_2, and the number of vertex classes of the polygon.
+    """
+    offsets, values = as_ragged(words, offsets)
+    if validate:
+        errors = validate_batch(values, offsets)
+        if errors:
+            index = min(errors)
+            raise ValueError(f"Surface {index}: {errors[index]}")
+
+    count = len(offsets) - 1
+    orientability = np.empty(count, dtype=np.int8)
+    genus = np.empty(count, dtype=np.int64)
+    vertex_classes = np.empty(count, dtype=np.int64)
+    first = 0
+    while first < count:
+        # at least one surface per chunk, however long it is
+        last = max(first + 1, int(np.searchsorted(offsets, offsets[first] + CHUNK_LETTERS, side="right")) - 1)
+        last = min(last, count)
+        chunk_offsets = offsets[first:last + 1] - offsets[first]
+        chunk_values = values[offsets[first]:offsets[last]]
+        orientability[first:last], genus[first:last], vertex_classes[first:last] = _classify_chunk(chunk_values, chunk_offsets)
+        first = last
+    return orientability, genus, vertex_classes
+
+
+def _classify_chunk(values, offsets):
+    # classify_batch on a ragged batch that was already validated
+    count = len(offsets) - 1
+    lengths = np.diff(offsets)
+    rows = np.repeat(np.arange(count), lengths)
+    positions = np.arange(len(values))
+    signs = values > 0
+
+    # the edge at position i goes between the polygon vertices i and i+1 of the same surface
+    following = positions + 1
+    following[offsets[1:][lengths > 0] - 1] = offsets[:-1][lengths > 0]
+    tails = np.where(signs, positions, following)
+    heads = np.where(signs, following, positions)
+
+    # sort the letters by (surface, label) so that the two letters of every pair are adjacent
+    halves = lengths // 2
+    starts = np.concatenate(([0], np.cumsum(halves)))
+    keys = starts[rows] + np.abs(values).astype(np.int64) - 1
+    order = np.argsort(keys, kind="stable")
+    first, second = order[0::2], order[1::2]
+
+    # a pair with both letters of the same sign is a cross-cap
+    crosscaps = np.bincount(rows[first], weights=(signs[first] == signs[second]), minlength=count)
+    orientability = (crosscaps == 0).astype(np.int8)
+
+    # the gluing identifies the tails and the heads of the two edges of every pair
+    parent = _components(
+        len(values),
+        np.concatenate((tails[first], heads[first])),
+        np.concatenate((tails[second], heads[second])),
+    )
+    vertex_classes = np.bincount(rows, weights=(parent == positions), minlength=count).astype(np.int64)
+
+    euler = vertex_classes - halves + 1
+    genus = np.where(orientability == 1, (2 - euler) // 2, 2 - euler)
+    return orientability, genus, vertex_classes
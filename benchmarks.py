@@ -0,0 +1,270 @@
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+from batch import classify_batch
+from classification import (remove_adjacent_edges, remove_projective_plane, identify_torus, remove_torus,
+                            surface_classification)
+from invariants import invariant_classification
+from reduction import reduce_surface
+from words import SignedWord
+
+# benchmarks of the steps of the reduction and of the classification engines.
+# Every benchmark runs on seeded families of polygons, at sizes growing geometrically from
+# 4 to 10^5 edges, and reports the best time of a few repetitions and the peak memory
+# allocated by one run. The exponent k of time ~ size^k is fitted on the larger sizes.
+# Results can be saved as a JSON baseline and compared with a later run:
+#   python benchmarks.py --save baseline.json
+#   python benchmarks.py --compare baseline.json > bench_output.txt
+# Slow functions stop growing once one run takes longer than --budget seconds.
+
+SIZES = (4, 16, 64, 256, 1024, 4096, 16384, 65536, 100000)
+
+
+# seeded generators of signed words with n edges, see words.py
+
+def sphere_word(n, rng):
+    # a1 a2 ... ak ak^-1 ... a1^-1, only one pair is adjacent at a time
+    k = n // 2
+    return list(range(1, k + 1)) + [-label for label in range(k, 0, -1)]
+
+
+def orientable_word(n, rng):
+    # product of n/4 commutators a b a^-1 b^-1
+    word = []
+    for label in range(1, n // 4 * 2, 2):
+        word += [label, label + 1, -label, -label - 1]
+    return word
+
+
+def nonorientable_word(n, rng):
+    # product of n/2 cross-caps a a
+    return [label for label in range(1, n // 2 + 1) for _ in (0, 1)]
+
+
+def random_word(n, rng):
+    # random pairing of the edges with random orientations
+    labels = [label for label in range(1, n // 2 + 1) for _ in (0, 1)]
+    rng.shuffle(labels)
+    return [label if rng.random() < 0.5 else -label for label in labels]
+
+
+def random_orientable_word(n, rng):
+    # random pairing where the two edges of every pair have opposite orientations
+    labels = [label for label in range(1, n // 2 + 1) for _ in (0, 1)]
+    rng.shuffle(labels)
+    seen = set()
+    word = []
+    for label in labels:
+        word.append(-label if label in seen else label)
+        seen.add(label)
+    return word
+
+
+FAMILIES = {
+    "sphere": sphere_word,
+    "orientable": orientable_word,
+    "nonorientable": nonorientable_word,
+    "random": random_word,
+    "random_orientable": random_orientable_word,
+}
+
+
+# each benchmark has a setup, which builds the input from a signed word and is not timed,
+# the function that is timed, and the families it is run on
+
+def _surface(word):
+    return SignedWord(word).to_surface()
+
+
+def _split_input(word):
+    # the surface and four edges spread along the boundary, in the order split_edges_general needs
+    surface = _surface(word)
+    sorted_edges = surface.edges_sorted_by_max()
+    n = len(sorted_edges)
+    return surface, [sorted_edges[i * n // 4] for i in range(4)]
+
+
+def _batch_input(word):
+    return np.array(word, dtype=np.int32), np.array([0, len(word)], dtype=np.int64)
+
+
+def _classify_batch(values_offsets):
+    return classify_batch(*values_offsets)
+
+
+BENCHMARKS = {
+    "remove_adjacent_edges": (_surface, remove_adjacent_edges, ("sphere", "random")),
+    "remove_projective_plane": (_surface, remove_projective_plane, ("nonorientable", "random")),
+    "identify_torus": (_surface, identify_torus, ("orientable", "random_orientable")),
+    "remove_torus": (_surface, remove_torus, ("orientable", "random_orientable")),
+    "edges_sorted_by_max": (_surface, lambda surface: surface.edges_sorted_by_max(), ("random",)),
+    "split_edges_general": (_split_input, lambda args: args[0].split_edges_general(*args[1]), ("random",)),
+    "surface_classification": (_surface, surface_classification, tuple(FAMILIES)),
+    "reduce_surface": (list, reduce_surface, tuple(FAMILIES)),
+    "invariant_classification": (list, invariant_classification, tuple(FAMILIES)),
+    "classify_batch": (_batch_input, _classify_batch, tuple(FAMILIES)),
+}
+
+
+def measure(function, argument, repeat=3, min_time=0.05):
+    """
+    Best time of one call over repeat measurements, each of them looping for at least
+    min_time seconds, and the peak memory in bytes allocated by one more call.
+    """
+    # number of calls per measurement, so that fast functions are not lost in the timer resolution
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            function(argument)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 10
+    best = elapsed / loops
+
+    # a single slow call is measured once, repeating it would only waste time
+    if loops > 1 or elapsed < min_time * 10:
+        for _ in range(repeat - 1):
+            start = time.perf_counter()
+            for _ in range(loops):
+                function(argument)
+            best = min(best, (time.perf_counter() - start) / loops)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        function(argument)
+        peak = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def fit_exponent(points, min_size=64):
+    # least squares slope of log(time) against log(size), on the sizes large enough to
+    # not be dominated by constant overhead, None with fewer than three of them
+    points = [(size, seconds) for size, seconds in points if seconds > 0]
+    large = [point for point in points if point[0] >= min_size]
+    if len(large) >= 3:
+        points = large
+    if len(points) < 3:
+        return None
+    xs = [math.log(size) for size, _ in points]
+    ys = [math.log(seconds) for _, seconds in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+
+def run(names=None, families=None, sizes=SIZES, seed=0, budget=2.0, repeat=3, out=sys.stdout):
+    """
+    Runs the benchmarks and returns the results as a dictionary that can be saved as a baseline:
+    results[benchmark][family] = {"sizes": [...], "seconds": [...], "peak_bytes": [...], "exponent": k}
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        setup, function, supported = BENCHMARKS[name]
+        for family in supported:
+            if families is not None and family not in families:
+                continue
+            rows = {"sizes": [], "seconds": [], "peak_bytes": []}
+            for size in sizes:
+                # the same seed gives the same polygons for every benchmark and every version
+                rng = random.Random(f"{seed}-{family}-{size}")
+                word = FAMILIES[family](size, rng)
+                if not word:
+                    continue
+                argument = setup(word)
+                seconds, peak = measure(function, argument, repeat)
+                rows["sizes"].append(len(word))
+                rows["seconds"].append(seconds)
+                rows["peak_bytes"].append(peak)
+                print(f"{name:<26} {family:<18} {len(word):>7} {seconds * 1e3:>12.4f} ms {peak / 1024:>12.1f} KiB",
+                      file=out, flush=True)
+                if seconds > budget:
+                    print(f"{name:<26} {family:<18} larger sizes skipped, over the budget of {budget} s",
+                          file=out, flush=True)
+                    break
+            rows["exponent"] = fit_exponent(zip(rows["sizes"], rows["seconds"]))
+            results.setdefault(name, {})[family] = rows
+    return results
+
+
+def summary(results, out=sys.stdout):
+    print(f"\n{'benchmark':<26} {'family':<18} {'max size':>8} {'exponent':>9}", file=out)
+    for name, by_family in results.items():
+        for family, rows in by_family.items():
+            exponent = "-" if rows["exponent"] is None else f"{rows['exponent']:.2f}"
+            max_size = rows["sizes"][-1] if rows["sizes"] else "-"
+            print(f"{name:<26} {family:<18} {max_size:>8} {exponent:>9}", file=out)
+
+
+def compare(results, baseline, threshold=1.25, out=sys.stdout):
+    """
+    Prints the ratio of the times of results to those of baseline, for the sizes present in both,
+    and returns the list of (benchmark, family, size, ratio) slower than threshold.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<26} {'family':<18} {'size':>7} {'ratio':>8}", file=out)
+    for name, by_family in results.items():
+        for family, rows in by_family.items():
+            old = baseline.get("results", {}).get(name, {}).get(family)
+            if old is None:
+                continue
+            old_seconds = dict(zip(old["sizes"], old["seconds"]))
+            for size, seconds in zip(rows["sizes"], rows["seconds"]):
+                if size not in old_seconds or old_seconds[size] <= 0:
+                    continue
+                ratio = seconds / old_seconds[size]
+                flag = "  slower" if ratio > threshold else "  faster" if ratio < 1 / threshold else ""
+                print(f"{name:<26} {family:<18} {size:>7} {ratio:>8.2f}{flag}", file=out)
+                if ratio > threshold:
+                    regressions.append((name, family, size, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the reduction steps and the classification engines.")
+    parser.add_argument("--benchmark", action="append", choices=list(BENCHMARKS),
+                        help="benchmark to run, can be repeated, all of them by default")
+    parser.add_argument("--family", action="append", choices=list(FAMILIES),
+                        help="family of polygons, can be repeated, all of them by default")
+    parser.add_argument("--max-size", type=int, default=SIZES[-1], help="largest number of edges")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--budget", type=float, default=2.0,
+                        help="stop growing a benchmark once one call takes longer than this many seconds")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", metavar="PATH", help="save the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare with a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="time ratio above which a comparison is reported as a regression")
+    args = parser.parse_args(argv)
+
+    sizes = [size for size in SIZES if size <= args.max_size]
+    results = run(args.benchmark, args.family, sizes, args.seed, args.budget, args.repeat)
+    summary(results)
+
+    if args.save:
+        baseline = {"python": platform.python_version(), "platform": platform.platform(),
+                    "seed": args.seed, "results": results}
+        with open(args.save, "w") as f:
+            json.dump(baseline, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} measurements slower than {args.threshold}x the baseline")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# canonical form of a polygon gluing.
+# The same surface can be given by many polygons: we can rotate the polygon, reflect it, rename the
+# pairs or reverse the direction of both edges of a pair. None of this changes the combinatorics
+# of the gluing, so we want a key that is the same for all of them.
+#
+# The idea is to forget the labels: for every position i of the boundary word we only remember
+# - the distance d from i to the position of the other edge of its pair (going forwards), and
+# - whether both edges of the pair run in the same direction along the boundary.
+# This sequence does not change when we relabel or reverse pairs, and rotating the polygon just
+# rotates it. Reflecting the polygon reverses the sequence and replaces every d by n - d.
+# So the canonical key is the least rotation of the sequence or of its reflection, which we find
+# in linear time with Booth's algorithm, written back as a signed word with labels 1, 2, 3, ...
+# in order of first appearance.
+
+
+def least_rotation(sequence):
+    # Booth's algorithm: index where the lexicographically least rotation of the sequence starts
+    doubled = list(sequence) + list(sequence)
+    failure = [-1] * len(doubled)
+    k = 0
+    for j in range(1, len(doubled)):
+        current = doubled[j]
+        i = failure[j - k - 1]
+        while i != -1 and current != doubled[k + i + 1]:
+            if current < doubled[k + i + 1]:
+                k = j - i - 1
+            i = failure[i]
+        if current != doubled[k + i + 1]:
+            # here i == -1
+            if current < doubled[k]:
+                k = j
+            failure[j - k] = -1
+        else:
+            failure[j - k] = i + 1
+    return k
+
+
+def gluing_sequence(word):
+    # encodes position i as 2 * d + s, where d is the offset to its partner and s is 1 if both
+    # edges of the pair have the same direction (a cross-cap) and 0 otherwise
+    n = len(word)
+    first = {}
+    partner = [0] * n
+    for i, label in enumerate(word):
+        key = abs(label)
+        if key in first:
+            j = first.pop(key)
+            partner[i] = j
+            partner[j] = i
+        else:
+            first[key] = i
+    if first:
+        raise ValueError("Every label of the word must appear exactly twice")
+
+    return [2 * ((partner[i] - i) % n) + (1 if word[i] == word[partner[i]] else 0) for i in range(n)]
+
+
+def canonical_word(word):
+    """
+    Returns the canonical signed word of a polygon word, as a tuple of nonzero integers
+    where a and a^-1 are encoded as label and -label.
+    Two words give the same canonical word if and only if they differ by a rotation, a reflection,
+    a relabeling of the pairs or reversing the direction of some pairs.
+    """
+    n = len(word)
+    if n == 0:
+        return ()
+    sequence = gluing_sequence(word)
+    # reflection: position i goes to n - 1 - i and the offset d becomes n - d
+    reflected = [2 * ((n - code // 2) % n) + code % 2 for code in reversed(sequence)]
+
+    start = least_rotation(sequence)
+    reflected_start = least_rotation(reflected)
+    candidate = sequence[start:] + sequence[:start]
+    reflected_candidate = reflected[reflected_start:] + reflected[:reflected_start]
+    if reflected_candidate < candidate:
+        candidate = reflected_candidate
+
+    # write the sequence back as a word, labelling pairs in order of first appearance
+    labels = [0] * n
+    next_label = 1
+    for i, code in enumerate(candidate):
+        if labels[i] != 0:
+            continue
+        j = (i + code // 2) % n
+        labels[i] = next_label
+        labels[j] = next_label if code % 2 else -next_label
+        next_label += 1
+    return tuple(labels)
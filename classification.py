@@ -1,11 +1,108 @@
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import metrics
+from canonical import canonical_word
 from objects import CompactSurface
+from invariants import invariant_classification
+from words import as_surface, as_word, find_interleaved_pair
+from reduction import reduce_surface, Budget, ReductionStalled
+from payloads import surface_from_line
 
 # this program asks the user for a compact surface and classifies it according to the
-# classification of compact surfaces theorem
-
-def main():
-    surface = CompactSurface.get()
-    print(surface_classification_printing(surface))
+# classification of compact surfaces theorem.
+# Given files (or - for stdin) with one surface per line, it classifies all of them instead and
+# writes one result per line, as NDJSON or CSV:
+#   python classification.py corpus.txt --format csv --jobs 4 > results.csv
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify compact surfaces given as polygons with their edges glued in pairs.")
+    parser.add_argument("files", nargs="*",
+                        help="files with one surface per line, as JSON or as signed words, - for stdin. "
+                             "Without files the surface is asked interactively")
+    parser.add_argument("--format", choices=("ndjson", "csv"), default="ndjson", help="output format")
+    parser.add_argument("--engine", choices=ENGINES, default="reduction", help="classification engine")
+    parser.add_argument("--jobs", type=int, default=1, help="number of processes classifying surfaces")
+    args = parser.parse_args(argv)
+
+    if not args.files:
+        surface = CompactSurface.get()
+        print(surface_classification_printing(surface))
+        return
+
+    results = classify_lines(read_lines(args.files), args.engine, args.jobs)
+    if args.format == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=["index", "orientability", "genus", "surface", "error"])
+        writer.writeheader()
+        writer.writerows(results)
+    else:
+        for result in results:
+            sys.stdout.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+# the batch mode is a lazy pipeline: lines are read, classified and written one at a time,
+# so the size of the input does not matter
+
+def read_lines(paths):
+    # non blank lines of the files, skipping comments starting with #
+    for path in paths:
+        stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        try:
+            for line in stream:
+                if line.strip() and not line.lstrip().startswith("#"):
+                    yield line
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+def classify_line(index, line, engine):
+    try:
+        classification = classify(surface_from_line(line), engine)
+    except (KeyError, IndexError, TypeError, ValueError, OverflowError) as e:
+        return {"index": index, "error": str(e)}
+    return {"index": index, "orientability": classification[0], "genus": classification[1],
+            "surface": classification_message(classification)}
+
+
+def _classify_lines_chunk(start, lines, engine):
+    return [classify_line(start + i, line, engine) for i, line in enumerate(lines)]
+
+
+def classify_lines(lines, engine="reduction", jobs=1, chunk_size=256):
+    """
+    Classifies an iterable of lines with one surface each, yielding the results in order.
+    With jobs > 1 chunks of lines are classified by a pool of processes, with at most
+    2 * jobs chunks in flight so that the memory does not grow with the input.
+    """
+    if jobs <= 1:
+        for index, line in enumerate(lines):
+            yield classify_line(index, line, engine)
+        return
+
+    lines = iter(lines)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        start = 0
+        while True:
+            while len(pending) < 2 * jobs:
+                chunk = list(islice(lines, chunk_size))
+                if not chunk:
+                    break
+                pending.append(executor.submit(_classify_lines_chunk, start, chunk, engine))
+                start += len(chunk)
+            if not pending:
+                return
+            yield from pending.popleft().result()
 
 
 
@@ -13,6 +110,7 @@ def main():
 # In the following functions we will encode each of the steps in the classification of surfaces algorithm
 
 # Step 1: remove spheres
+@metrics.timed(metrics.step_seconds, "remove_adjacent_edges")
 def remove_adjacent_edges(surface):
     if not isinstance(surface, CompactSurface):
         raise TypeError("Input not a compact surface")
@@ -69,7 +167,7 @@ def remove_adjacent_edges(surface):
                     new_pair.append((new_u % new_vertices, new_v % new_vertices))
                 new_gluing.add(tuple(new_pair))
             # Return the new CompactSurface object
-            return CompactSurface(new_vertices, new_edges, new_gluing)
+            return CompactSurface.trusted(new_vertices, new_edges, new_gluing)
 
     # If no adjacent edges satisfying the condition are found, return the original surface
     return surface
@@ -128,6 +226,7 @@ def reverse_list(input_list):
 
 # Step 2: removoe projective planes
 
+@metrics.timed(metrics.step_seconds, "remove_projective_plane")
 def remove_projective_plane(surface):
     if not isinstance(surface, CompactSurface):
         raise TypeError("Input not a compact surface")
@@ -214,16 +313,18 @@ def remove_projective_plane(surface):
     remaining_gluing = surface.gluing.copy()  # Make a copy of the gluing set
     remaining_gluing.remove(rplane)           # Remove the projective plane pair
 
-# Now, iterate over the remaining pairs in the gluing set
+    # Now, iterate over the remaining pairs in the gluing set, looking the edges up in a position
+    # map instead of searching list4 for every one of them
+    position = {edge: i for i, edge in enumerate(list4)}
     for pair in remaining_gluing:
         edge1, edge2 = pair
-        index1 = list4.index(edge1)
-        index2 = list4.index(edge2)
+        index1 = position[edge1]
+        index2 = position[edge2]
         new_gluing.add((list5[index1], list5[index2]))
 
 
 
-    return CompactSurface(new_vertices, new_edges, new_gluing)
+    return CompactSurface.trusted(new_vertices, new_edges, new_gluing)
 
 
 # Step 3: remove torus
@@ -232,6 +333,7 @@ def remove_projective_plane(surface):
 # in the final one: remove_torus()
 
 
+@metrics.timed(metrics.step_seconds, "identify_torus")
 def identify_torus(surface):
     if not isinstance(surface, CompactSurface):
         raise TypeError("Input not a compact surface")
@@ -266,45 +368,27 @@ def identify_torus(surface):
             return None
 
 
-    # search for edges forming a torus
-    torus1 = None
-    torus2 = None
+    # search for edges forming a torus: two torus pairs whose edges alternate in the sorted list
+    # of edges, min1 < min2 < max1 < max2. We write every torus pair at the positions of its
+    # two edges and sweep the positions once, so we never compare all the pairs with each other
     sorted_edges = surface.edges_sorted_by_max()
+    position = {edge: i for i, edge in enumerate(sorted_edges)}
+    sequence = [None] * len(sorted_edges)
     for pair in surface.gluing:
-        torus1 = find_torus_pair(pair)
-
-        if torus1 is None:
-            continue
-        # we move into finding the second pair
-        else:
-            remaining_gluing = surface.gluing.copy()  # Make a copy of the gluing set
-            remaining_gluing.remove(torus1)
-
-            for pair1 in remaining_gluing:
-                torus2 = find_torus_pair(pair1)
-
-                if torus2 is None:
-                    continue
-                else:
-                    # Extract edges from torus1 and torus2
-                    min_torus1, max_torus1 = min_tuple(torus1[0], torus1[1]), max_tuple(torus1[0], torus1[1])
-                    min_torus2, max_torus2 = min_tuple(torus2[0], torus2[1]), max_tuple(torus2[0], torus2[1])
+        if find_torus_pair(pair) is not None:
+            sequence[position[pair[0]]] = pair
+            sequence[position[pair[1]]] = pair
 
-                    # Check the ordering criteria
-                    min_torus1_pos = sorted_edges.index(min_torus1)
-                    min_torus2_pos = sorted_edges.index(min_torus2)
-                    max_torus1_pos = sorted_edges.index(max_torus1)
-                    max_torus2_pos = sorted_edges.index(max_torus2)
-
-                    if (min_torus1_pos < min_torus2_pos < max_torus1_pos < max_torus2_pos):
-                        return torus1, torus2
-                    elif (min_torus2_pos < min_torus1_pos < max_torus2_pos < max_torus1_pos):
-                        return torus2, torus1
-
-    return None
+    positions = find_interleaved_pair(sequence)
+    if positions is None:
+        return None
+    torus1 = sequence[positions[0]]
+    torus2 = sequence[positions[1]]
+    return torus1, torus2
 
 
 
+@metrics.timed(metrics.step_seconds, "remove_torus")
 def remove_torus(surface):
     torus_pair = identify_torus(surface)
     if torus_pair is None:
@@ -312,13 +396,14 @@ def remove_torus(surface):
     else:
         torus1, torus2 = torus_pair
 
-    edge1, edge3 = torus1
-    edge2, edge4 = torus2
+    # the edges of a pair can be stored in any order, split_edges_4 needs them sorted
+    edge1, edge3 = min_tuple(torus1[0], torus1[1]), max_tuple(torus1[0], torus1[1])
+    edge2, edge4 = min_tuple(torus2[0], torus2[1]), max_tuple(torus2[0], torus2[1])
 
     list1, list2, list3, list4 = surface.split_edges_4(edge1, edge2, edge3, edge4)
 
-
-    list5 = list3 + list4 + list2 + list1
+    # a X b Y a^-1 Z b^-1 W is the connected sum of a torus and Z Y X W
+    list5 = list3 + list2 + list1 + list4
 
     new_vertices = len(list5)
 
@@ -350,17 +435,18 @@ def remove_torus(surface):
     remaining_gluing.remove(torus1)
     remaining_gluing.remove(torus2)         # Remove the projective plane pair
 
-    # Now, iterate over the remaining pairs in the gluing set
+    # Now, iterate over the remaining pairs in the gluing set, with a position map of list5
+    position = {edge: i for i, edge in enumerate(list5)}
     for pair in remaining_gluing:
         edge1, edge2 = pair
-        index1 = list5.index(edge1)
-        index2 = list5.index(edge2)
+        index1 = position[edge1]
+        index2 = position[edge2]
         new_gluing.add((list6[index1], list6[index2]))
 
     if new_vertices == 0:
         return None
     else:
-        return CompactSurface(new_vertices, new_edges, new_gluing)
+        return CompactSurface.trusted(new_vertices, new_edges, new_gluing)
 
 
 # the previous functions are the core of the algorithm: the idea of the algorithm
@@ -370,9 +456,22 @@ def remove_torus(surface):
 # remove a sphere. If not, we move into trying to remove a torus. And so on, until we run out of vertices
 
 
-def surface_classification(surface):
-    if not isinstance(surface, CompactSurface):
-        raise TypeError("Input not a compact surface")
+# the budgets of the loop are those of reduction.py. When the reduction stalls, classify falls back
+# to the invariant engine and records the fallback in recent_fallbacks, in the log and, with
+# SURFACE_FALLBACK_LOG, as a line of JSON appended to that file. The input is not kept, only its
+# length, its first FALLBACK_PREFIX letters and the hash of its canonical word, which is the key
+# of result_cache.py and the ETag of GET /api/classify, so the surface can be found again.
+fallback_log = os.environ.get("SURFACE_FALLBACK_LOG", "")
+recent_fallbacks = deque(maxlen=100)
+FALLBACK_PREFIX = 16
+
+
+# progress, if given, is called before every step with the number of steps done so far
+# and the number of vertices left. max_steps and max_seconds default to the budgets of reduction.py
+def surface_classification(surface, progress=None, max_steps=None, max_seconds=None):
+    # the reduction works on the edges and the gluing, so signed words are converted first
+    surface = as_surface(surface)
+    budget = Budget(max_steps, max_seconds)
 
     projective_planes = 0
     tori = 0
@@ -387,31 +486,42 @@ def surface_classification(surface):
             return projective_planes, tori, sphere
 
     while surface.vertices > 2:
+        steps = sphere + projective_planes + tori
+        if progress is not None:
+            progress(steps, surface.vertices)
+        budget.check(steps, surface.vertices)
         # Attempt to remove spheres
         new_surface = remove_adjacent_edges(surface)
-        if new_surface != surface:
+        if new_surface is not surface:
             sphere += 1
-            surface = new_surface
+            if metrics.enabled:
+                metrics.steps.inc("sphere")
+            surface = _progressed(surface, new_surface, steps)
             continue
         # Attempt to remove a projective plane
         new_surface = remove_projective_plane(surface)
-        if new_surface != surface:
+        if new_surface is not surface:
             projective_planes += 1
-            surface = new_surface
+            if metrics.enabled:
+                metrics.steps.inc("projective_plane")
+            surface = _progressed(surface, new_surface, steps)
             continue
 
         # Attempt to remove a torus
         new_surface = remove_torus(surface)
-        if new_surface != surface:
+        if new_surface is not surface:
             tori += 1
-            if new_surface == None:
+            if metrics.enabled:
+                metrics.steps.inc("torus")
+            if new_surface is None:
                 break
             else:
-                surface = new_surface
+                surface = _progressed(surface, new_surface, steps)
                 continue
+        raise ReductionStalled("stalled", "No reduction step applies to the surface", steps, surface.vertices)
 
     if surface.vertices == 2:
-        if (surface.edges == {(0,1)} and surface.gluing == {(0, 1), (0, 1)}) or (surface.edges == {(1, 0)} and surface.gluing == {((1, 0), (1, 0))}):
+        if (surface.edges == {(0,1)} and surface.gluing == {((0, 1), (0, 1))}) or (surface.edges == {(1, 0)} and surface.gluing == {((1, 0), (1, 0))}):
             sphere += 1
             return projective_planes, tori, sphere
         else:
@@ -420,11 +530,43 @@ def surface_classification(surface):
 
     return projective_planes, tori, sphere
 
+def _progressed(surface, new_surface, steps):
+    # every step must leave fewer vertices, otherwise the loop could go on forever
+    if new_surface.vertices >= surface.vertices:
+        raise ReductionStalled("stalled", "A reduction step removed no vertex", steps, surface.vertices)
+    return new_surface
+
+
 # this function returns a tuple where the first entry indicates wether the suurface is orientable
 # or not, and the second entry indicates the genus
-def classification_2(surface):
-    projective_planes, tori, sphere = surface_classification(surface)
-
+def classification_2(surface, progress=None):
+    try:
+        projective_planes, tori, sphere = surface_classification(surface, progress)
+    except ReductionStalled as e:
+        return _fallback(surface, e)
+    return classification_from_counts(projective_planes, tori)
+
+
+def _fallback(surface, error):
+    # the invariant engine does not loop, it reads the classification from the vertex classes
+    # and the orientability of the gluing
+    classification = invariant_classification(surface)
+    word = as_word(surface)
+    record = {"length": len(word), "key": hashlib.sha256(array("i", canonical_word(word)).tobytes()).hexdigest(),
+              "prefix": list(word[:FALLBACK_PREFIX]), "reason": error.reason, "steps": error.steps,
+              "vertices": error.vertices, "classification": list(classification)}
+    recent_fallbacks.append(record)
+    logger.warning("%s, classifying the surface with %d edges and key %s with the invariant engine",
+                   error, record["length"], record["key"])
+    if metrics.enabled:
+        metrics.fallbacks.inc(error.reason)
+    if fallback_log:
+        with open(fallback_log, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    return classification
+
+# the same conversion for any (projective_planes, tori) counts, for example the ones of reduction.py
+def classification_from_counts(projective_planes, tori):
     # Convert each torus and projective plane pair to 3 projective planes using Dyck's theorem
     if tori > 0 and projective_planes > 0:
         projective_planes += 2 * tori
@@ -467,6 +609,77 @@ def surface_classification_printing(surface):
             return f"This is a connected sum of {tori} tori"
 
 
+# the same surface can be classified by several engines: the reduction algorithm above, the same
+# algorithm working in place on a linked word (reduction.py), or the invariant engine in
+# invariants.py which reads the Euler characteristic and the orientability directly from the
+# gluing. The crosscheck engine runs the reduction and the invariant engines and flags any
+# disagreement.
+ENGINES = ("reduction", "in_place", "invariant", "crosscheck")
+
+logger = logging.getLogger(__name__)
+
+
+# progress is passed on to the reduction engines, see surface_classification
+def classify(surface, engine="reduction", progress=None):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown classification engine {engine!r}, must be one of {ENGINES}")
+    if not metrics.enabled:
+        return _classify(surface, engine, progress)
+
+    metrics.input_edges.observe(surface.vertices if hasattr(surface, "vertices") else len(surface), engine)
+    start = time.perf_counter()
+    try:
+        return _classify(surface, engine, progress)
+    finally:
+        metrics.classification_seconds.observe(time.perf_counter() - start, engine)
+
+
+def _classify(surface, engine, progress):
+
+    if engine == "reduction":
+        return classification_2(surface, progress)
+    if engine == "in_place":
+        try:
+            projective_planes, tori, sphere = reduce_surface(surface, progress)
+        except ReductionStalled as e:
+            return _fallback(surface, e)
+        return classification_from_counts(projective_planes, tori)
+    if engine == "invariant":
+        return invariant_classification(surface)
+
+    expected = invariant_classification(surface)
+    try:
+        result = classification_2(surface, progress)
+    except Exception as e:
+        logger.warning("Reduction engine failed on %s: %r, invariant engine gives %s", surface, e, expected)
+        return expected
+    if result != expected:
+        logger.warning("Classification engines disagree on %s: reduction gives %s, invariant gives %s",
+                       surface, result, expected)
+    # the invariant engine does not depend on the order of the reduction steps, so we trust it
+    return expected
+
+
+# same messages as surface_classification_printing, but built from the (orientability, genus)
+# tuple so that it works with any engine
+def classification_message(classification):
+    orientability, genus = classification
+    if orientability == 1:
+        if genus == 0:
+            return "This is a sphere"
+        elif genus == 1:
+            return "This is a torus"
+        else:
+            return f"This is a connected sum of {genus} tori"
+    else:
+        if genus == 1:
+            return "This is a projective plane"
+        elif genus == 2:
+            return "This is a Klein Bottle"
+        else:
+            return f"This is a connected sum of {genus} projective planes"
+
+
 
 def compute_homology_groups(surface):
     a, b = surface[0], surface[1]
@@ -476,6 +689,20 @@ def compute_homology_groups(surface):
         return (0, 1, b, 0)
 
 
+# presentation of the fundamental group of the surface from its (orientability, genus) tuple
+def fundamental_group_presentation(surface):
+    orientability, genus = surface[0], surface[1]
+    if orientability == 1:
+        if genus == 0:
+            return "{1}"  # Trivial group for the sphere
+        generators = ", ".join(f"a_{i}, b_{i}" for i in range(1, genus + 1))
+        relator = "".join(f"[a_{i}, b_{i}]" for i in range(1, genus + 1))
+    else:
+        generators = ", ".join(f"a_{i}" for i in range(1, genus + 1))
+        relator = " ".join(f"a_{i}^2" for i in range(1, genus + 1))
+    return f"⟨ {generators} | {relator} = 1 ⟩"
+
+
 if __name__ == "__main__":
     main()
 
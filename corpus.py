@@ -0,0 +1,172 @@
+import argparse
+import mmap
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+import numpy as np
+from batch import validate_batch
+from payloads import surface_from_payload
+from streams import iter_json_values
+from words import as_word, compact_labels
+
+# binary format for large collections of surfaces, so that a job does not have to parse a whole
+# JSON corpus and build sets of tuples before classifying anything.
+# All numbers are little endian:
+#   header   8 bytes magic b"SURFCORP", uint32 version, uint32 reserved,
+#            uint64 number of surfaces, uint64 number of labels
+#   offsets  (number of surfaces + 1) uint64, surface n is labels[offsets[n]:offsets[n + 1]]
+#   labels   int32 signed words (see words.py), relabeled 1, ..., n/2 in order of appearance
+# The reader memory-maps the file, so opening a corpus reads only the header and surface n is
+# found in O(1) as a view of the mapped file, without copying it.
+
+MAGIC = b"SURFCORP"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQ")
+# write_corpus validates the surfaces in chunks of about this many labels
+CHUNK_LABELS = 1 << 20
+
+
+class Corpus:
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise ValueError("Surface corpora can only be memory-mapped on little endian machines")
+        with open(path, "rb") as file:
+            try:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # an empty file cannot be mapped
+                raise ValueError(f"{path} is not a surface corpus")
+
+        try:
+            magic, version, _, count, total = HEADER.unpack_from(self._map, 0)
+        except struct.error:
+            magic, version, count, total = None, None, 0, 0
+        labels_start = HEADER.size + 8 * (count + 1)
+        if magic != MAGIC or version != VERSION or len(self._map) != labels_start + 4 * total:
+            self.close()
+            raise ValueError(f"{path} is not a surface corpus of version {VERSION}")
+
+        self._count = count
+        view = memoryview(self._map)
+        self.offsets = view[HEADER.size:labels_start].cast("Q")
+        self.labels = view[labels_start:].cast("i")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # views handed out by the corpus stay valid after it is closed, in that case the
+        # file is unmapped only when the last of them is garbage collected
+        for name in ("offsets", "labels"):
+            view = self.__dict__.pop(name, None)
+            try:
+                view.release()
+            except (AttributeError, BufferError):
+                pass
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        # signed word of surface index, as a memoryview of int32 into the mapped file
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("Surface index out of range")
+        return self.labels[self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+    def batch(self, start=0, stop=None):
+        """
+        Surfaces start, ..., stop - 1 as a ragged (values, offsets) pair of NumPy arrays, ready for
+        batch.classify_batch(values, offsets). The values are a view of the mapped file.
+        """
+        stop = self._count if stop is None else min(stop, self._count)
+        offsets = np.frombuffer(self.offsets, dtype="<u8", count=stop - start + 1, offset=8 * start).astype(np.int64)
+        values = np.frombuffer(self.labels, dtype="<i4", count=int(offsets[-1] - offsets[0]), offset=4 * int(offsets[0]))
+        return values, offsets - offsets[0]
+
+
+def write_corpus(path, surfaces):
+    """
+    Writes an iterable of surfaces (anything classification.classify accepts) to a corpus file.
+    The labels are written to a temporary file while the offsets are collected, since the
+    offsets table goes first, so the surfaces are never all in memory. They are checked with
+    batch.validate_batch in chunks, and an invalid surface raises ValueError before the corpus
+    file is created.
+    Returns the number of surfaces written.
+    """
+    offsets = array("Q", [0])
+    with tempfile.TemporaryFile() as labels:
+        chunk = []
+        size = 0
+
+        def flush():
+            values = np.concatenate(chunk)
+            errors = validate_batch(values, np.cumsum([0] + [len(word) for word in chunk]))
+            if errors:
+                index = min(errors)
+                raise ValueError(f"Surface {len(offsets) - 1 + index}: {errors[index]}")
+            for word in chunk:
+                offsets.append(offsets[-1] + len(word))
+            labels.write(values.astype("<i4").tobytes())
+            chunk.clear()
+
+        for surface in surfaces:
+            chunk.append(np.array(compact_labels(as_word(surface)), dtype=np.int32))
+            size += len(chunk[-1])
+            if size >= CHUNK_LABELS:
+                flush()
+                size = 0
+        if chunk:
+            flush()
+
+        count, total = len(offsets) - 1, offsets[-1]
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        with open(path, "wb") as output:
+            output.write(HEADER.pack(MAGIC, VERSION, 0, count, total))
+            output.write(offsets.tobytes())
+            labels.seek(0)
+            shutil.copyfileobj(labels, output)
+    return count
+
+
+def convert_json(json_path, corpus_path):
+    # converts a JSON array or NDJSON file of app.py payloads into a corpus
+    def surfaces(stream):
+        for index, surface_data in enumerate(iter_json_values(stream)):
+            try:
+                if isinstance(surface_data, Exception):
+                    raise surface_data
+                yield surface_from_payload(surface_data)
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                raise ValueError(f"Surface {index}: {e}")
+
+    with open(json_path, "rb") as stream:
+        return write_corpus(corpus_path, surfaces(stream))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a JSON or NDJSON collection of surfaces into a binary corpus.")
+    parser.add_argument("json_path")
+    parser.add_argument("corpus_path")
+    args = parser.parse_args(argv)
+    count = convert_json(args.json_path, args.corpus_path)
+    print(f"Wrote {count} surfaces to {args.corpus_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fractions import Fraction
+
+# exact counts of the surfaces given by all the gluings of a 2n-gon.
+# A gluing pairs the edges and says for every pair whether it is twisted (a ... a, a cross-cap)
+# or not (a ... a^-1), so a 2n-gon has (2n - 1)!! * 2^n gluings, and (2n - 1)!! orientable ones
+# (the Harer-Zagier numbers). Flipping both edges of a pair gives the same surface, so the
+# directions themselves are not enumerated.
+#
+# The pairs are added one at a time, always pairing the first free edge, and the vertex classes
+# are kept in a union-find with undo, so the Euler characteristic of a gluing is known as soon
+# as its last pair is added, without building any surface.
+#
+# Rotations of the polygon give the same surface, so only the gluings where the chord of edge 0
+# is one of the shortest are enumerated: once edge 0 is paired at distance L, every other chord
+# must be at least as long, which prunes whole subtrees. Such a gluing H stands for 2n / k(H)
+# gluings, where k(H) is the number of ways to rotate a shortest chord of H to edge 0.
+#
+# The search tree is split into tasks run by a pool of processes, and the finished tasks can be
+# saved to a checkpoint file, so a long run can be stopped and resumed:
+#   python enumeration.py 14 --jobs 8 --checkpoint run14.json --output table14.json
+
+
+class RollbackUnionFind:
+    # union-find without path compression, so the last unions can be undone in O(1)
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size = [1] * size
+        self.classes = size
+        self.history = []
+
+    def find(self, x):
+        while self.parent[x] != x:
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            self.history.append(None)
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        self.classes -= 1
+        self.history.append(b)
+
+    def undo(self):
+        b = self.history.pop()
+        if b is None:
+            return
+        a = self.parent[b]
+        self.parent[b] = b
+        self.size[a] -= self.size[b]
+        self.classes += 1
+
+
+class _Search:
+    """
+    Depth first search over the gluings of a polygon with the given number of edges.
+    counts[(twisted, vertex classes, k)] is the number of gluings reached with that many
+    twisted pairs (capped at 1, we only need to know if there is one), vertex classes and
+    shortest chords k.
+    """
+
+    def __init__(self, edges, orientable):
+        self.edges = edges
+        self.twists = (0,) if orientable else (0, 1)
+        self.partner = [-1] * edges
+        self.classes = RollbackUnionFind(edges)
+        self.shortest = None
+        self.twisted = 0
+        self.minimal = 0
+        self.counts = {}
+
+    def chord(self, i, j):
+        return min(j - i, self.edges - j + i)
+
+    def add(self, i, j, twist):
+        n = self.edges
+        self.partner[i] = j
+        self.partner[j] = i
+        # edge i goes from vertex i to i + 1, edge j goes backwards unless the pair is twisted,
+        # and the gluing identifies the tails and the heads of the two edges
+        if twist:
+            self.classes.union(i, j)
+            self.classes.union((i + 1) % n, (j + 1) % n)
+        else:
+            self.classes.union(i, (j + 1) % n)
+            self.classes.union((i + 1) % n, j)
+        self.twisted += twist
+        # a chord of length n/2 can be rotated to edge 0 from both of its ends
+        if self.chord(i, j) == self.shortest:
+            self.minimal += 2 if 2 * self.shortest == n else 1
+
+    def remove(self, i, j, twist):
+        if self.chord(i, j) == self.shortest:
+            self.minimal -= 2 if 2 * self.shortest == self.edges else 1
+        self.twisted -= twist
+        self.classes.undo()
+        self.classes.undo()
+        self.partner[i] = self.partner[j] = -1
+
+    def choices(self, i):
+        # partners and twists of the first free edge i
+        for j in range(i + 1, self.edges):
+            if self.partner[j] < 0 and self.chord(i, j) >= self.shortest:
+                for twist in self.twists:
+                    yield j, twist
+
+    def first_free(self, start):
+        while start < self.edges and self.partner[start] >= 0:
+            start += 1
+        return start
+
+    def replay(self, prefix):
+        # applies the pairs of a task, the first of which pairs edge 0 and fixes the shortest chord
+        for index, (i, j, twist) in enumerate(prefix):
+            if index == 0:
+                self.shortest = self.chord(i, j)
+            self.add(i, j, twist)
+
+    def prefixes(self, depth, start=0, prefix=()):
+        # the tasks: the lists of the first depth pairs, or of all of them for small polygons
+        i = self.first_free(start)
+        if depth == 0 or i == self.edges:
+            yield list(prefix)
+            return
+        if i == 0:
+            first = [(j, twist) for j in range(1, self.edges // 2 + 1) for twist in self.twists]
+        else:
+            first = list(self.choices(i))
+        for j, twist in first:
+            if i == 0:
+                self.shortest = j
+            self.add(i, j, twist)
+            yield from self.prefixes(depth - 1, i + 1, prefix + ((i, j, twist),))
+            self.remove(i, j, twist)
+        if i == 0:
+            self.shortest = None
+
+    def run(self, start=0):
+        i = self.first_free(start)
+        if i == self.edges:
+            key = (min(self.twisted, 1), self.classes.classes, self.minimal)
+            self.counts[key] = self.counts.get(key, 0) + 1
+            return
+        for j, twist in self.choices(i):
+            self.add(i, j, twist)
+            self.run(i + 1)
+            self.remove(i, j, twist)
+
+
+def _run_task(edges, orientable, prefix):
+    search = _Search(edges, orientable)
+    search.replay(prefix)
+    search.run()
+    return [[*key, count] for key, count in search.counts.items()]
+
+
+def surface_table(edges, counts):
+    """
+    Turns the raw counts of the search into the number of gluings giving each surface, as a
+    dictionary {(orientability, genus): count} with the conventions of classification_2.
+    """
+    pairs = edges // 2
+    table = {}
+    for twisted, vertex_classes, minimal, count in counts:
+        euler = vertex_classes - pairs + 1
+        key = (1, (2 - euler) // 2) if twisted == 0 else (0, 2 - euler)
+        table[key] = table.get(key, 0) + Fraction(count * edges, minimal)
+    for key, count in table.items():
+        if count.denominator != 1:
+            raise RuntimeError("The symmetry weights of the enumeration do not add up to an integer")
+        table[key] = int(count)
+    return dict(sorted(table.items(), key=lambda item: (-item[0][0], item[0][1])))
+
+
+def enumerate_gluings(edges, orientable=False, jobs=1, split_depth=2, checkpoint=None, progress=None):
+    """
+    Counts the gluings of a polygon with the given even number of edges giving each surface,
+    only the orientable ones with orientable. Returns {(orientability, genus): count}.
+    With a checkpoint path, the finished tasks are saved there after every task and a run with
+    the same arguments resumes from it. progress, if given, is called with (tasks done, tasks).
+    """
+    if edges <= 0 or edges % 2 != 0:
+        raise ValueError("The polygon must have an even positive number of edges")
+    if split_depth < 1:
+        raise ValueError("Every task must fix at least the pair of edge 0")
+    tasks = list(_Search(edges, orientable).prefixes(split_depth))
+    run_id = {"edges": edges, "orientable": orientable, "split_depth": split_depth}
+
+    done = {}
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            saved = json.load(f)
+        if saved["run"] != run_id:
+            raise ValueError(f"The checkpoint {checkpoint} belongs to a different run: {saved['run']}")
+        done = {int(index): counts for index, counts in saved["done"].items()}
+
+    def finish(index, counts):
+        done[index] = counts
+        if checkpoint is not None:
+            # write the new checkpoint next to the old one and swap them, so that a run
+            # interrupted while saving still has a valid checkpoint
+            with open(checkpoint + ".tmp", "w") as f:
+                json.dump({"run": run_id, "done": done}, f)
+            os.replace(checkpoint + ".tmp", checkpoint)
+        if progress is not None:
+            progress(len(done), len(tasks))
+
+    remaining = [index for index in range(len(tasks)) if index not in done]
+    if jobs <= 1:
+        for index in remaining:
+            finish(index, _run_task(edges, orientable, tasks[index]))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(_run_task, edges, orientable, tasks[index]): index for index in remaining}
+            for future in as_completed(futures):
+                finish(futures[future], future.result())
+
+    return surface_table(edges, [row for counts in done.values() for row in counts])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count the gluings of a polygon giving each compact surface.")
+    parser.add_argument("edges", type=int, help="even number of edges of the polygon")
+    parser.add_argument("--orientable", action="store_true", help="only the orientable gluings (Harer-Zagier)")
+    parser.add_argument("--jobs", type=int, default=1, help="number of processes")
+    parser.add_argument("--split-depth", type=int, default=2, help="pairs fixed by each task of the search")
+    parser.add_argument("--checkpoint", help="file where the finished tasks are saved and resumed from")
+    parser.add_argument("--output", help="write the table as JSON to this file")
+    args = parser.parse_args(argv)
+
+    table = enumerate_gluings(args.edges, args.orientable, args.jobs, args.split_depth, args.checkpoint)
+    print(f"{'surface':<28} {'gluings':>20}")
+    for (orientability, genus), count in table.items():
+        name = f"orientable, genus {genus}" if orientability == 1 else f"non-orientable, genus {genus}"
+        print(f"{name:<28} {count:>20}")
+    print(f"{'total':<28} {sum(table.values()):>20}")
+    if args.output:
+        rows = [{"orientability": o, "genus": g, "count": count} for (o, g), count in table.items()]
+        with open(args.output, "w") as f:
+            json.dump({"edges": args.edges, "orientable": args.orientable, "surfaces": rows}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from result_cache import cached_classify
+from words import SignedWord, as_word
+
+# execution layer for the web app.
+# Small surfaces are classified inline, on the thread that handles the request. Larger ones are
+# sent to a pool of worker processes, so a huge polygon can't hold a Flask worker for long:
+# every classification has a deadline, and the work is cancelled when the deadline passes or
+# when the client goes away. Each worker process has its own pipe, so a job that has to be
+# cancelled is stopped by terminating its worker, which is then replaced by a fresh one.
+# The workers are started with forkserver (spawn where it is missing), never forked from the web
+# process: they are started from request threads of a multithreaded server, and a forked child
+# would inherit the locks those threads hold (logging, metrics, sqlite connections).
+# The lookup in the result cache runs with the classification, in the worker for large surfaces,
+# so computing the canonical key of a huge polygon is also bound by the deadline.
+# A caller that follows the reduction (jobs.py) gets its progress from the worker as messages on
+# the same pipe, at most one every PROGRESS_INTERVAL seconds.
+
+PROGRESS_INTERVAL = 0.5
+
+
+class ClassificationCancelled(Exception):
+    pass
+
+
+def _reporter(connection):
+    # progress callback of the reduction that sends ("progress", steps, vertices) to the caller
+    last = time.monotonic()
+
+    def progress(steps, vertices):
+        nonlocal last
+        now = time.monotonic()
+        if now - last >= PROGRESS_INTERVAL:
+            last = now
+            connection.send(("progress", steps, vertices))
+    return progress
+
+
+def _serve(connection):
+    # loop of a worker process: receives (word, engine, cache, report) and sends back
+    # ("result", ok, classification or exception), after the progress messages if report is set
+    while True:
+        try:
+            word, engine, cache, report = connection.recv()
+        except EOFError:
+            return
+        progress = _reporter(connection) if report else None
+        try:
+            connection.send(("result", True, cached_classify(word, engine, cache, progress)))
+        except Exception as e:
+            connection.send(("result", False, e))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+
+class ClassificationPool:
+    def __init__(self, max_workers=None, inline_limit=2000, poll_interval=0.05):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # surfaces with at most this many edges are classified inline
+        self.inline_limit = inline_limit
+        self.poll_interval = poll_interval
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._workers = 0
+        self._queued = 0
+        self._running = 0
+
+    def stats(self):
+        with self._lock:
+            return {"queued": self._queued, "running": self._running, "workers": self._workers,
+                    "max_workers": self.max_workers}
+
+    def classify(self, surface, engine="reduction", timeout=None, cancelled=None, cache=None, progress=None):
+        """
+        Classifies the surface with the given engine, like classification.classify, looking it up
+        first in the ResultCache cache if given. progress(steps, vertices) is called as in
+        classification.classify, less often for the surfaces classified in a worker.
+        Raises TimeoutError if it takes longer than timeout seconds, and ClassificationCancelled
+        as soon as cancelled() returns True, for example because the client disconnected.
+        """
+        word = as_word(surface)
+        if len(word) <= self.inline_limit:
+            return cached_classify(surface, engine, cache, progress)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # send the compact array instead of the sets of tuples of a CompactSurface
+        word = surface if isinstance(surface, SignedWord) else SignedWord.trusted(word)
+
+        with self._lock:
+            self._queued += 1
+        try:
+            worker = self._acquire(deadline, cancelled)
+        finally:
+            with self._lock:
+                self._queued -= 1
+
+        with self._lock:
+            self._running += 1
+        try:
+            worker.connection.send((word, engine, cache, progress is not None))
+            while True:
+                while not worker.connection.poll(self.poll_interval):
+                    self._check(deadline, cancelled)
+                message = worker.connection.recv()
+                if message[0] == "result":
+                    break
+                progress(*message[1:])
+                self._check(deadline, cancelled)
+            _, ok, result = message
+        except BaseException:
+            # the worker is still busy with the job, the only way to stop it is to terminate it
+            worker.kill()
+            with self._lock:
+                self._workers -= 1
+            raise
+        else:
+            self._idle.put(worker)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+        if not ok:
+            raise result
+        return result
+
+    def _check(self, deadline, cancelled):
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("The classification took longer than the deadline")
+        if cancelled is not None and cancelled():
+            raise ClassificationCancelled("The classification was cancelled")
+
+    def _acquire(self, deadline, cancelled):
+        # an idle worker, or a new one if the pool is not full, otherwise wait for one
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                start = self._workers < self.max_workers
+                if start:
+                    self._workers += 1
+            if start:
+                try:
+                    return _Worker(self._context)
+                except BaseException:
+                    with self._lock:
+                        self._workers -= 1
+                    raise
+            try:
+                return self._idle.get(timeout=self.poll_interval)
+            except queue.Empty:
+                self._check(deadline, cancelled)
+
+    def shutdown(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            worker.kill()
+            with self._lock:
+                self._workers -= 1
@@ -0,0 +1,436 @@
+import random
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from shared import SharedDatabase
+from words import SignedWord, as_word
+
+# incremental classification of a polygon that is edited one change at a time.
+# Every polygon vertex v has two slots: 2v, where the edge v - 1 ends, and 2v + 1, where the
+# edge v starts. The gluing matches the slots of the tails of the two edges of every pair, and
+# the slots of their heads; call this matching mu, and tau the matching 2v <-> 2v + 1 of the
+# slots of the same vertex. The vertex classes of the surface are the cycles of the graph made of
+# both matchings, and each of them gives exactly two cycles of the permutation tau * mu.
+# So the number of vertex classes is half the number of cycles of tau * mu.
+#
+# Editing the polygon changes mu on a few slots, that is, it composes tau * mu with a few
+# transpositions, and composing with a transposition (a b) splits the cycle of a and b in two if
+# they are on the same cycle, or joins their two cycles otherwise. The cycles are kept as
+# sequences in treaps, so each of these takes O(log n) and so does every change of the polygon.
+
+
+class _CycleForest:
+    # the cycles of a permutation of range(size), each one a treap whose in-order sequence
+    # starts anywhere on the cycle and follows the permutation
+    def __init__(self, permutation):
+        size = len(permutation)
+        self.left = [-1] * size
+        self.right = [-1] * size
+        self.parent = [-1] * size
+        self.count = [1] * size
+        self.priority = [random.random() for _ in range(size)]
+        self.cycles = 0
+        seen = [False] * size
+        for start in range(size):
+            if seen[start]:
+                continue
+            self.cycles += 1
+            cycle = []
+            x = start
+            while not seen[x]:
+                seen[x] = True
+                cycle.append(x)
+                x = permutation[x]
+            self._build(cycle)
+
+    def _build(self, sequence):
+        # treap of a sequence in linear time: the Cartesian tree of the priorities, built with a
+        # stack of the right spine
+        stack = []
+        for x in sequence:
+            last = -1
+            while stack and self.priority[stack[-1]] < self.priority[x]:
+                last = stack.pop()
+            self.left[x] = last
+            if stack:
+                self.right[stack[-1]] = x
+            stack.append(x)
+        # sizes and parents from the leaves up
+        order = [stack[0]]
+        for x in order:
+            order.extend(child for child in (self.left[x], self.right[x]) if child >= 0)
+        for x in reversed(order):
+            self._update(x)
+
+    def _update(self, x):
+        self.count[x] = 1
+        for child in (self.left[x], self.right[x]):
+            if child >= 0:
+                self.count[x] += self.count[child]
+                self.parent[child] = x
+
+    def _merge(self, a, b):
+        # concatenation of the sequences of the treaps rooted at a and b
+        if a < 0 or b < 0:
+            root = a if b < 0 else b
+        elif self.priority[a] > self.priority[b]:
+            self.right[a] = self._merge(self.right[a], b)
+            self._update(a)
+            root = a
+        else:
+            self.left[b] = self._merge(a, self.left[b])
+            self._update(b)
+            root = b
+        if root >= 0:
+            self.parent[root] = -1
+        return root
+
+    def _split(self, t, k):
+        # the first k nodes of the sequence of t and the rest
+        if t < 0:
+            return -1, -1
+        left_count = self.count[self.left[t]] if self.left[t] >= 0 else 0
+        if k <= left_count:
+            a, b = self._split(self.left[t], k)
+            self.left[t] = b
+            self._update(t)
+            self.parent[t] = -1
+            if a >= 0:
+                self.parent[a] = -1
+            return a, t
+        a, b = self._split(self.right[t], k - left_count - 1)
+        self.right[t] = a
+        self._update(t)
+        self.parent[t] = -1
+        if b >= 0:
+            self.parent[b] = -1
+        return t, b
+
+    def _root_and_index(self, x):
+        index = self.count[self.left[x]] if self.left[x] >= 0 else 0
+        while self.parent[x] >= 0:
+            p = self.parent[x]
+            if self.right[p] == x:
+                index += 1 + (self.count[self.left[p]] if self.left[p] >= 0 else 0)
+            x = p
+        return x, index
+
+    def _starting_at(self, x):
+        # rotates the sequence of the cycle of x so that it starts at x
+        root, index = self._root_and_index(x)
+        a, b = self._split(root, index)
+        return self._merge(b, a)
+
+    def compose(self, a, b):
+        """
+        Replaces the permutation p by p * (a b), that is, a is now followed by what followed b
+        and b by what followed a.
+        """
+        if a == b:
+            return
+        root_a, _ = self._root_and_index(a)
+        root_b, _ = self._root_and_index(b)
+        if root_a == root_b:
+            # a X b Y becomes the cycles a Y and b X
+            cycle = self._starting_at(a)
+            _, index = self._root_and_index(b)
+            first, second = self._split(cycle, index)
+            a, x = self._split(first, 1)
+            b, y = self._split(second, 1)
+            self._merge(a, y)
+            self._merge(b, x)
+            self.cycles += 1
+        else:
+            # a X and b Y become a Y b X
+            a, x = self._split(self._starting_at(a), 1)
+            b, y = self._split(self._starting_at(b), 1)
+            self._merge(self._merge(self._merge(a, y), b), x)
+            self.cycles -= 1
+
+
+class ClassifierSession:
+    """
+    A polygon being edited, which keeps its classification up to date after every change
+    instead of classifying the polygon again.
+    Accepts a CompactSurface, a SignedWord or a sequence of signed labels.
+    """
+
+    def __init__(self, surface):
+        self.labels = list(SignedWord(as_word(surface)).labels)
+        n = len(self.labels)
+        self.partner = [0] * n
+        first = {}
+        for i, label in enumerate(self.labels):
+            if abs(label) in first:
+                j = first.pop(abs(label))
+                self.partner[i], self.partner[j] = j, i
+            else:
+                first[abs(label)] = i
+        self.twisted = sum(1 for i in range(n) if i < self.partner[i] and self._twisted(i))
+
+        self.match = [0] * (2 * n)
+        for i in range(n):
+            self._match(i)
+        self.cycles = _CycleForest([self.match[s] ^ 1 for s in range(2 * n)])
+
+    def _twisted(self, i):
+        # the two edges of the pair of position i run in the same direction: a cross-cap
+        return (self.labels[i] > 0) == (self.labels[self.partner[i]] > 0)
+
+    def _ends(self, i):
+        # slots of the tail and of the head of the edge at position i
+        start, end = 2 * i + 1, 2 * ((i + 1) % len(self.labels))
+        return (start, end) if self.labels[i] > 0 else (end, start)
+
+    def _match(self, i):
+        # matches the slots of the edge at position i with those of its partner
+        for s, t in zip(self._ends(i), self._ends(self.partner[i])):
+            self.match[s] = t
+            self.match[t] = s
+
+    def _rematch(self, positions):
+        """
+        Matches again the slots of the edges at the given positions, after their labels changed,
+        and composes tau * mu with the permutation mu * mu' that takes the old matching to the new.
+        """
+        old = {}
+        for i in positions:
+            for s in self._ends(i):
+                old.setdefault(s, self.match[s])
+                old.setdefault(self.match[s], self.match[self.match[s]])
+        for i in positions:
+            self._match(i)
+        changed = {s: old[self.match[s]] for s in old if self.match[s] != old[s]}
+        # every cycle (c0 c1 ... ck) of mu * mu' is the product of the transpositions
+        # (c0 ck), ..., (c0 c2), (c0 c1) applied in this order
+        done = set()
+        for start in changed:
+            if start in done:
+                continue
+            cycle = [start]
+            while changed[cycle[-1]] != start:
+                cycle.append(changed[cycle[-1]])
+            done.update(cycle)
+            for other in reversed(cycle[1:]):
+                self.cycles.compose(start, other)
+
+    def _pairs_changing(self, positions):
+        # the positions whose edges can change when the letters at positions change
+        return sorted({p for i in positions for p in (i, self.partner[i])})
+
+    def _check(self, position):
+        if not 0 <= position < len(self.labels):
+            raise IndexError(f"Position {position} is not an edge of the polygon")
+
+    def flip(self, position):
+        # reverses the direction of the edge at position
+        self._check(position)
+        self.twisted -= self._twisted(position)
+        self.labels[position] = -self.labels[position]
+        self.twisted += self._twisted(position)
+        self._rematch([position, self.partner[position]])
+
+    def swap(self, i, j):
+        # exchanges the letters at positions i and j, so each edge takes the partner of the other
+        self._check(i)
+        self._check(j)
+        if i == j or self.partner[i] == j:
+            # the same pair, only the directions can change
+            if i != j and self.labels[i] != self.labels[j]:
+                self.labels[i], self.labels[j] = self.labels[j], self.labels[i]
+                self._rematch([i, j])
+            return
+        affected = self._pairs_changing([i, j])
+        self.twisted -= self._twisted(i) + self._twisted(j)
+        pi, pj = self.partner[i], self.partner[j]
+        self.labels[i], self.labels[j] = self.labels[j], self.labels[i]
+        self.partner[i], self.partner[pj] = pj, i
+        self.partner[j], self.partner[pi] = pi, j
+        self.twisted += self._twisted(i) + self._twisted(j)
+        self._rematch(affected)
+
+    def word(self):
+        return list(self.labels)
+
+    @property
+    def vertex_classes(self):
+        return self.cycles.cycles // 2
+
+    def euler_characteristic(self):
+        return self.vertex_classes - len(self.labels) // 2 + 1
+
+    def classification(self):
+        # same output as classification_2
+        chi = self.euler_characteristic()
+        if self.twisted == 0:
+            return (1, (2 - chi) // 2)
+        return (0, 2 - chi)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    word BLOB NOT NULL,
+    base INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_used ON sessions (used);
+CREATE TABLE IF NOT EXISTS edits (
+    session TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    operation TEXT NOT NULL,
+    i INTEGER NOT NULL,
+    j INTEGER,
+    PRIMARY KEY (session, version)
+);
+"""
+
+
+def _apply(session, operation, positions):
+    if operation == "flip":
+        session.flip(*positions)
+    else:
+        session.swap(*positions)
+
+
+class _Replica:
+    # the ClassifierSession of a stored session in this process, None until it is built
+    __slots__ = ("lock", "session")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.session = None
+
+
+class SessionStore:
+    """
+    The sessions of the web app, in the SQLite file at path shared by all its worker processes.
+    A session is stored as its word at version base and the edits made since, numbered base + 1,
+    ..., version. Every process keeps the ClassifierSession of the last max_local sessions it
+    used, and brings it up to date by replaying the edits made by the other processes, so an
+    edit costs O(log n) whichever worker gets it. The word is written again, and the edits
+    dropped, once there are as many edits as letters. Beyond max_sessions the least recently
+    edited sessions are dropped.
+    The sessions handed out have a lock, to be held while they are read, and their version.
+    """
+
+    def __init__(self, path, max_sessions=1000, max_local=100):
+        self.max_sessions = max_sessions
+        self.max_local = max_local
+        self._database = SharedDatabase(path, _SCHEMA)
+        self._replicas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _replica(self, session_id):
+        with self._lock:
+            replica = self._replicas.get(session_id)
+            if replica is None:
+                replica = self._replicas[session_id] = _Replica()
+                while len(self._replicas) > self.max_local:
+                    self._replicas.popitem(last=False)
+            else:
+                self._replicas.move_to_end(session_id)
+            return replica
+
+    def _forget(self, session_id):
+        with self._lock:
+            self._replicas.pop(session_id, None)
+
+    def create(self, surface):
+        session = ClassifierSession(surface)
+        session.version = 0
+        session_id = uuid.uuid4().hex
+        connection = self._database.connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("INSERT INTO sessions VALUES (?, ?, 0, 0, ?)",
+                               (session_id, array("i", session.labels).tobytes(), time.time()))
+            dropped = [row[0] for row in connection.execute(
+                "SELECT id FROM sessions ORDER BY used DESC LIMIT -1 OFFSET ?", (self.max_sessions,))]
+            for old in dropped:
+                connection.execute("DELETE FROM sessions WHERE id = ?", (old,))
+                connection.execute("DELETE FROM edits WHERE session = ?", (old,))
+        for old in dropped:
+            self._forget(old)
+        replica = self._replica(session_id)
+        session.lock = replica.lock
+        replica.session = session
+        return session_id, session
+
+    def _sync(self, connection, session_id, replica):
+        # brings the session of the replica to the stored version, None if it was deleted
+        row = connection.execute("SELECT word, base, version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            replica.session = None
+            return None
+        word, base, version = row
+        session = replica.session
+        if session is None or session.version < base:
+            labels = array("i")
+            labels.frombytes(word)
+            session = ClassifierSession(SignedWord.trusted(labels))
+            session.version = base
+            session.lock = replica.lock
+        if session.version < version:
+            for edit_version, operation, i, j in connection.execute(
+                "SELECT version, operation, i, j FROM edits WHERE session = ? AND version > ? ORDER BY version",
+                (session_id, session.version),
+            ):
+                _apply(session, operation, (i,) if j is None else (i, j))
+                session.version = edit_version
+        replica.session = session
+        return session
+
+    def get(self, session_id):
+        # the session at its latest version, or None
+        replica = self._replica(session_id)
+        with replica.lock:
+            session = self._sync(self._database.connection(), session_id, replica)
+        if session is None:
+            self._forget(session_id)
+        return session
+
+    def edit(self, session_id, edits):
+        """
+        Applies the edits, pairs ("flip", [position]) or ("swap", [i, j]), in order and returns
+        the session, or None if it does not exist.
+        """
+        replica = self._replica(session_id)
+        connection = self._database.connection()
+        with replica.lock:
+            try:
+                with connection:
+                    connection.execute("BEGIN IMMEDIATE")
+                    session = self._sync(connection, session_id, replica)
+                    if session is None:
+                        return None
+                    for operation, positions in edits:
+                        _apply(session, operation, positions)
+                        session.version += 1
+                        connection.execute("INSERT INTO edits VALUES (?, ?, ?, ?, ?)",
+                                           (session_id, session.version, operation, positions[0],
+                                            positions[1] if len(positions) > 1 else None))
+                    base = connection.execute("SELECT base FROM sessions WHERE id = ?", (session_id,)).fetchone()[0]
+                    if session.version - base >= len(session.labels):
+                        connection.execute("UPDATE sessions SET word = ?, base = ? WHERE id = ?",
+                                           (array("i", session.labels).tobytes(), session.version, session_id))
+                        connection.execute("DELETE FROM edits WHERE session = ?", (session_id,))
+                    connection.execute("UPDATE sessions SET version = ?, used = ? WHERE id = ?",
+                                       (session.version, time.time(), session_id))
+            except BaseException:
+                # the stored session was left as it was, the replica is built again next time
+                replica.session = None
+                raise
+            return session
+
+    def delete(self, session_id):
+        connection = self._database.connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            deleted = connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+            connection.execute("DELETE FROM edits WHERE session = ?", (session_id,))
+        self._forget(session_id)
+        return deleted > 0
@@ -0,0 +1,90 @@
+from words import as_word
+
+# this module classifies a compact surface from its invariants instead of reducing the polygon.
+# Gluing the edges of a 2n-gon in pairs gives a cell complex with one face, n edges and as many
+# vertices as there are classes of polygon vertices after the identifications. So the Euler
+# characteristic is V - n + 1, and together with the orientability (a pair of edges running in
+# the same direction along the boundary is a cross-cap) it determines the surface completely.
+# Everything is read from the boundary word in one pass, so the whole computation is O(n α(n)).
+
+
+class UnionFind:
+    # disjoint set forest with path halving and union by size
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size = [1] * size
+        self.classes = size
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, x, y):
+        x = self.find(x)
+        y = self.find(y)
+        if x == y:
+            return False
+        if self.size[x] < self.size[y]:
+            x, y = y, x
+        self.parent[y] = x
+        self.size[x] += self.size[y]
+        self.classes -= 1
+        return True
+
+
+def vertex_classes(surface):
+    """
+    Returns a UnionFind over the vertices of the polygon where two vertices are in the same
+    class if and only if they are identified by the gluing.
+    Accepts a CompactSurface, a SignedWord or a sequence of signed labels.
+    """
+    word = as_word(surface)
+    n = len(word)
+    classes = UnionFind(n)
+    # tail and head of the first edge seen of every pair
+    first = {}
+    for i, label in enumerate(word):
+        if label > 0:
+            tail, head = i, (i + 1) % n
+        else:
+            tail, head = (i + 1) % n, i
+        if abs(label) in first:
+            # the gluing identifies the tails and the heads of both edges
+            other_tail, other_head = first.pop(abs(label))
+            classes.union(tail, other_tail)
+            classes.union(head, other_head)
+        else:
+            first[abs(label)] = (tail, head)
+    return classes
+
+
+def is_orientable(surface):
+    # a pair of edges running in the same direction along the boundary is a cross-cap
+    signs = {}
+    for label in as_word(surface):
+        if abs(label) in signs:
+            if signs.pop(abs(label)) == (label > 0):
+                return False
+        else:
+            signs[abs(label)] = label > 0
+    return True
+
+
+def euler_characteristic(surface):
+    word = as_word(surface)
+    # one face, len(word)/2 edge classes and the vertex classes found by the gluing
+    return vertex_classes(word).classes - len(word) // 2 + 1
+
+
+# same output as classification_2: a tuple where the first entry indicates wether the surface is
+# orientable (1) or not (0), and the second entry is the genus
+def invariant_classification(surface):
+    word = as_word(surface)
+    chi = euler_characteristic(word)
+    if is_orientable(word):
+        return (1, (2 - chi) // 2)
+    else:
+        return (0, 2 - chi)
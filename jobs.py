@@ -0,0 +1,131 @@
+import queue
+import threading
+import time
+import uuid
+from shared import SharedDatabase
+
+# asynchronous classification jobs for surfaces too large to classify within an HTTP request.
+# Jobs wait in a bounded queue of the process that accepted them, and are handed by its
+# dispatcher threads to a ClassificationPool (execution.py): the reduction runs in a worker
+# process, under a deadline, and reports its progress (steps done and vertices left) as it goes.
+# The job records live in a SQLite file shared by all the worker processes of the app, so the
+# status of a job can be polled from any of them. Only the latest finished jobs are kept.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    steps INTEGER NOT NULL,
+    vertices INTEGER NOT NULL,
+    initial_vertices INTEGER NOT NULL,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    error TEXT,
+    orientability INTEGER,
+    genus INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished);
+"""
+
+_FIELDS = ("id", "status", "engine", "steps", "vertices", "initial_vertices", "submitted", "started",
+           "finished", "error")
+
+
+class JobQueue:
+    """
+    Jobs classified by pool, with their records in the SQLite file at path. At most max_pending
+    jobs wait in the queue, submit raises queue.Full beyond that, and a job that runs longer than
+    timeout seconds fails. cache is the ResultCache looked up by the workers, if any.
+    """
+
+    def __init__(self, path, pool, workers=1, max_pending=100, max_finished=1000, timeout=None, cache=None):
+        self.pool = pool
+        self.workers = workers
+        self.max_finished = max_finished
+        self.timeout = timeout
+        self.cache = cache
+        self._database = SharedDatabase(path, _SCHEMA)
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def submit(self, surface, engine="reduction"):
+        # returns the id of the new job, or raises queue.Full if too many jobs are waiting
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            if self._queue.full():
+                raise queue.Full(f"{self._queue.maxsize} jobs are already waiting")
+            with self._database.connection() as connection:
+                connection.execute(
+                    "INSERT INTO jobs (id, status, engine, steps, vertices, initial_vertices, submitted) "
+                    "VALUES (?, 'queued', ?, 0, ?, ?, ?)",
+                    (job_id, engine, surface.vertices, surface.vertices, time.time()),
+                )
+            self._start_workers()
+            self._queue.put_nowait((job_id, surface, engine))
+        return job_id
+
+    def status(self, job_id, with_result=False):
+        """
+        The job record, or None if the job does not exist. With with_result it also has the
+        classification of a finished job as "result" (None until then), read in the same query,
+        so a job dropped meanwhile can't be seen as done without its result.
+        """
+        row = self._database.connection().execute(
+            f"SELECT {', '.join(_FIELDS)}, orientability, genus FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(_FIELDS, row))
+        if with_result:
+            job["result"] = tuple(row[-2:]) if job["status"] == "done" else None
+        return job
+
+    def pending(self):
+        # jobs waiting in the queue of this process
+        return self._queue.qsize()
+
+    def _start_workers(self):
+        # called with the lock held
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _update(self, job_id, **fields):
+        with self._database.connection() as connection:
+            connection.execute(
+                f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+
+    def _work(self):
+        while True:
+            job_id, surface, engine = self._queue.get()
+            self._update(job_id, status="running", started=time.time())
+
+            def progress(steps, vertices):
+                self._update(job_id, steps=steps, vertices=vertices)
+
+            try:
+                orientability, genus = self.pool.classify(surface, engine, timeout=self.timeout,
+                                                          cache=self.cache, progress=progress)
+            except Exception as e:
+                self._update(job_id, status="failed", error=str(e), finished=time.time())
+            else:
+                self._update(job_id, status="done", orientability=orientability, genus=genus,
+                             vertices=0, finished=time.time())
+            self._forget_old()
+            self._queue.task_done()
+
+    def _forget_old(self):
+        # drop the oldest finished jobs beyond max_finished
+        with self._database.connection() as connection:
+            connection.execute(
+                "DELETE FROM jobs WHERE finished <= (SELECT finished FROM jobs WHERE finished IS NOT NULL "
+                "ORDER BY finished DESC LIMIT 1 OFFSET ?)",
+                (self.max_finished,),
+            )
@@ -0,0 +1,229 @@
+import argparse
+import json
+import re
+import numpy as np
+from batch import _components
+
+# classification of closed triangle meshes, read from OBJ or OFF files.
+# A mesh is handled as an (F, 3) array of vertex indices, never as Python objects per face:
+# - the edges are found by sorting the keys of the 3F half-edges, and in a closed surface every
+#   edge must be shared by exactly two faces,
+# - every vertex must have a single fan of faces around it (no two cones touching at a point),
+# - the connected components, the orientability and the fans are connected components of
+#   graphs on the faces, on the two orientations of every face and on the corners of the faces,
+#   found with the vectorized union of batch.py,
+# - per component, V - E + F and the orientability give the surface, as in classification_2.
+# The files are parsed in chunks of lines, so the memory used is a few arrays of F entries.
+
+CHUNK_LINES = 1 << 18
+
+_attributes = re.compile(rb"/[^\s]*")
+
+
+def _chunks(stream):
+    # lists of at most CHUNK_LINES lines of a binary stream
+    lines = []
+    for line in stream:
+        lines.append(line)
+        if len(lines) == CHUNK_LINES:
+            yield lines
+            lines = []
+    if lines:
+        yield lines
+
+
+def _triangulate(counts, indices):
+    # fans of triangles of polygons given by their vertex counts and concatenated indices
+    counts = np.asarray(counts, dtype=np.int64)
+    if np.any(counts < 3):
+        raise ValueError("Every face of a mesh must have at least 3 vertices")
+    if np.all(counts == 3):
+        return indices.reshape(-1, 3)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    triangles = counts - 2
+    first = np.repeat(starts, triangles)
+    # j = 1, ..., k - 2 within every polygon
+    j = np.arange(triangles.sum()) - np.repeat(np.cumsum(triangles) - triangles, triangles) + 1
+    return np.stack((indices[first], indices[first + j], indices[first + j + 1]), axis=1)
+
+
+def read_obj(stream):
+    """
+    Reads the faces of an OBJ file (a binary stream) as an (F, 3) array of zero based vertex
+    indices, triangulating larger faces as fans. Texture and normal indices are ignored.
+    """
+    chunks = []
+    for lines in _chunks(stream):
+        faces = [line[2:] for line in lines if line.startswith(b"f ") or line.startswith(b"f\t")]
+        if not faces:
+            continue
+        text = _attributes.sub(b"", b" ".join(faces))
+        indices = np.fromstring(text, dtype=np.int64, sep=" ")
+        counts = [len(face.split()) for face in faces]
+        if len(indices) != sum(counts):
+            raise ValueError("Malformed face in the OBJ file")
+        if np.any(indices <= 0):
+            raise ValueError("OBJ faces must use positive vertex indices")
+        chunks.append(_triangulate(counts, indices - 1))
+    return np.concatenate(chunks) if chunks else np.empty((0, 3), dtype=np.int64)
+
+
+def read_off(stream):
+    # reads the faces of an OFF file (a binary stream), like read_obj
+    header = []
+    vertices = faces = None
+    skipped = 0
+    chunks = []
+    for lines in _chunks(stream):
+        rows = []
+        for line in lines:
+            line = line.split(b"#", 1)[0].strip()
+            if not line:
+                continue
+            if vertices is None:
+                # the OFF keyword and the counts, maybe on the same line
+                header += line.split()
+                if header[0] != b"OFF":
+                    raise ValueError("Not an OFF file")
+                if len(header) >= 3:
+                    vertices, faces = int(header[1]), int(header[2])
+                continue
+            if skipped < vertices:
+                skipped += 1
+                continue
+            rows.append(line)
+        if not rows:
+            continue
+        # every face line is a vertex count followed by the indices, maybe followed by a color
+        counts = []
+        indices = []
+        for row in rows:
+            tokens = row.split()
+            counts.append(int(tokens[0]))
+            indices.append(b" ".join(tokens[1:1 + counts[-1]]))
+        chunks.append(_triangulate(counts, np.fromstring(b" ".join(indices), dtype=np.int64, sep=" ")))
+    triangles = np.concatenate(chunks) if chunks else np.empty((0, 3), dtype=np.int64)
+    if vertices is None:
+        raise ValueError("Not an OFF file")
+    return triangles
+
+
+def read_mesh(path):
+    # faces of an .obj or .off file
+    with open(path, "rb") as stream:
+        if path.lower().endswith(".off"):
+            return read_off(stream)
+        return read_obj(stream)
+
+
+def classify_mesh(faces):
+    """
+    Checks that the triangles of an (F, 3) array of vertex indices form a closed surface and
+    classifies each of its connected components.
+    Returns a dictionary with the manifold checks and, if the mesh is a closed surface, a list
+    with the number of faces and vertices, the Euler characteristic, the orientability and the
+    genus of every component (the last two as in classification_2).
+    """
+    faces = np.asarray(faces)
+    if faces.ndim != 2 or faces.shape[1] != 3:
+        raise ValueError("A mesh must be an (F, 3) array of vertex indices")
+    # number the vertices used by the faces 0, ..., V - 1
+    count = len(faces)
+    used, faces = np.unique(faces.reshape(-1), return_inverse=True)
+    faces = faces.reshape(count, 3).astype(np.int64)
+    vertices = len(used)
+
+    # half-edge h = 3f + k goes from faces[f, k] to faces[f, k + 1]
+    tails = faces.reshape(-1)
+    heads = faces[:, [1, 2, 0]].reshape(-1)
+    del faces
+    degenerate = int(np.count_nonzero(tails == heads))
+    keys = np.minimum(tails, heads) * vertices + np.maximum(tails, heads)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    sharing = np.diff(np.append(starts, len(keys)))
+    del keys
+
+    report = {
+        "faces": count,
+        "vertices": vertices,
+        "edges": len(starts),
+        "degenerate_faces": degenerate,
+        "boundary_edges": int(np.count_nonzero(sharing == 1)),
+        "nonmanifold_edges": int(np.count_nonzero(sharing > 2)),
+        "nonmanifold_vertices": 0,
+        "manifold": False,
+        "components": [],
+    }
+    if degenerate or np.any(sharing != 2):
+        return report
+
+    # the two half-edges of every edge and the faces on both sides
+    first, second = order[0::2], order[1::2]
+    del order
+    faces_first, faces_second = first // 3, second // 3
+    # the faces are oriented consistently along the edge if it runs in opposite directions
+    opposite = tails[first] == heads[second]
+
+    def following(h):
+        return h - h % 3 + (h % 3 + 1) % 3
+
+    # fans: the corners of the faces (corner h is at the tail of half-edge h) around the same
+    # vertex, joined across the edges they share, must form a single cycle
+    corner_u = np.concatenate((first, following(first)))
+    corner_v = np.concatenate((np.where(opposite, following(second), second),
+                               np.where(opposite, second, following(second))))
+    corners = _components(3 * count, corner_u, corner_v)
+    del corner_u, corner_v
+    roots = np.flatnonzero(corners == np.arange(3 * count))
+    fans = np.bincount(tails[roots], minlength=vertices)
+    del corners, roots
+    report["nonmanifold_vertices"] = int(np.count_nonzero(fans > 1))
+    if report["nonmanifold_vertices"]:
+        return report
+    report["manifold"] = True
+
+    # connected components of the faces
+    component = _components(count, faces_first, faces_second)
+    labels, component = np.unique(component, return_inverse=True)
+
+    # orientation cover: node 2f is face f as given and 2f + 1 the face reversed. Neighbouring
+    # faces keep their orientations if the edge runs in opposite directions and swap one of them
+    # otherwise. A component is orientable if and only if its two orientations stay apart
+    cover = _components(
+        2 * count,
+        np.concatenate((2 * faces_first, 2 * faces_first + 1)),
+        np.concatenate((2 * faces_second + ~opposite, 2 * faces_second + opposite)),
+    )
+    twisted = np.bincount(component, weights=(cover[0::2] == cover[1::2]), minlength=len(labels)) > 0
+    del cover
+
+    # every vertex belongs to one component, the one of any face around it
+    first_corner = np.unique(tails, return_index=True)[1]
+    vertex_counts = np.bincount(component[first_corner // 3], minlength=len(labels))
+    face_counts = np.bincount(component, minlength=len(labels))
+    for index in range(len(labels)):
+        euler = int(vertex_counts[index] - face_counts[index] * 3 // 2 + face_counts[index])
+        orientability = 0 if twisted[index] else 1
+        genus = (2 - euler) // 2 if orientability == 1 else 2 - euler
+        report["components"].append({
+            "faces": int(face_counts[index]),
+            "vertices": int(vertex_counts[index]),
+            "euler_characteristic": euler,
+            "orientability": orientability,
+            "genus": genus,
+        })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify the closed triangle meshes of OBJ or OFF files.")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args(argv)
+    for path in args.files:
+        print(json.dumps({"file": path, **classify_mesh(read_mesh(path))}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import bisect
+import functools
+import os
+import threading
+import time
+
+# counters and histograms of what the classification spends its time on, rendered in the
+# Prometheus text format by the /metrics endpoint of app.py.
+# Recording is off unless the module flag is set (or the app runs with SURFACE_METRICS=1), and
+# then every instrumented call only pays for one check of the flag.
+# The metrics live in the memory of the process: classifications done by the worker processes of
+# execution.ClassificationPool are only seen through the request latencies of the web process.
+enabled = os.environ.get("SURFACE_METRICS", "0") not in ("", "0")
+
+# upper bounds of the buckets of the histograms, in seconds and in edges
+TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+SIZE_BUCKETS = (4, 16, 64, 256, 1024, 4096, 16384, 65536, 262144)
+
+_lock = threading.Lock()
+registry = []
+
+
+class Counter:
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+        registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, labels=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # for every combination of labels: the count of each bucket (not cumulative), sum and count
+        self.values = {}
+        registry.append(self)
+
+    def observe(self, value, *labels):
+        with _lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+            counts[0][bisect.bisect_left(self.buckets, value)] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, (buckets, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ("+Inf",), buckets):
+                cumulative += bucket
+                le = _labels(self.labels + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {count}")
+        return lines
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def timed(histogram, *labels):
+    # decorator recording the duration of every call of the function in the histogram
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *labels)
+        return wrapper
+    return decorator
+
+
+def render():
+    with _lock:
+        lines = [line for metric in registry for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        for metric in registry:
+            metric.values.clear()
+
+
+# metrics of the classification
+
+steps = Counter("surface_reduction_steps_total",
+                "Spheres, projective planes and tori removed by the reduction algorithm", ("step",))
+step_seconds = Histogram("surface_reduction_step_seconds",
+                         "Duration of the calls to each reduction step, whether it applies or not", ("function",))
+constructions = Counter("compact_surface_constructions_total",
+                        "CompactSurface objects built, validated or trusted", ("kind",))
+validation_seconds = Histogram("compact_surface_validation_seconds",
+                               "Duration of the construction of validated CompactSurface objects")
+classification_seconds = Histogram("surface_classification_seconds",
+                                   "Duration of the classifications, by engine", ("engine",))
+input_edges = Histogram("surface_classification_input_edges",
+                        "Number of edges of the classified polygons, by engine", ("engine",), SIZE_BUCKETS)
+request_seconds = Histogram("http_request_duration_seconds",
+                            "Duration of the requests to the web app", ("endpoint", "status"))
+cache_lookups = Counter("surface_result_cache_lookups_total",
+                        "Lookups in the shared result cache made by this process, by result", ("result",))
+cache_evictions = Counter("surface_result_cache_evictions_total",
+                          "Entries evicted from the shared result cache by this process")
+fallbacks = Counter("surface_reduction_fallbacks_total",
+                    "Reductions stopped by their budgets and classified by the invariant engine", ("reason",))
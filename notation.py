@@ -0,0 +1,170 @@
+import bisect
+import string
+from array import array
+from streams import iter_chunks
+from words import SignedWord
+
+# the usual notation for polygon words: a b a^-1 b^-1 is the torus and c c the projective plane.
+# A letter is an ASCII letter followed by digits or underscores (a, b, x1, a_12), so the letters
+# can also be written without spaces, as in aba^-1b^-1. The inverse of a letter is written a^-1,
+# a^{-1} or a', and the letters can be separated by whitespace or *.
+#
+# The tokenizer is a state machine fed with text chunks, so a word with millions of letters can be
+# read from a stream. It never builds a string per token: a name is kept as the integer with its
+# characters as digits in base 128, and it is turned into a label 1, 2, ... the first time it
+# appears. The labels go straight into the array of a SignedWord.
+
+_LETTERS = frozenset(string.ascii_letters)
+_NAME = frozenset(string.digits + "_")
+_SEPARATORS = frozenset(string.whitespace + "*")
+
+# states of the tokenizer: between letters, in a name, and in the exponents ^-1 and ^{-1}
+_BETWEEN, _IN_NAME, _CARET, _CARET_MINUS, _BRACE, _BRACE_MINUS, _BRACE_ONE = range(7)
+_EXPECTED = {
+    _CARET: "'-' or '{' after '^'",
+    _CARET_MINUS: "'1' after '^-'",
+    _BRACE: "'-' after '^{'",
+    _BRACE_MINUS: "'1' after '^{-'",
+    _BRACE_ONE: "'}' after '^{-1'",
+}
+
+
+class WordSyntaxError(ValueError):
+    # like json.JSONDecodeError, the message says where the error is and the position is kept
+    def __init__(self, message, offset, line, column):
+        super().__init__(f"{message} at line {line}, column {column} (character {offset})")
+        self.offset = offset
+        self.line = line
+        self.column = column
+
+
+def _name(key):
+    # the name of a letter from its integer key
+    characters = []
+    while key:
+        key, code = divmod(key, 128)
+        characters.append(chr(code))
+    return "".join(reversed(characters))
+
+
+class WordParser:
+    """
+    Parses a word in the notation above, fed in chunks of text of any size:
+        parser = WordParser()
+        for chunk in chunks:
+            parser.feed(chunk)
+        word = parser.close()
+    close returns the SignedWord. Errors are raised as WordSyntaxError with the position of the
+    offending character, or of the letter that does not appear exactly twice.
+    """
+
+    def __init__(self):
+        self.labels = array("i")
+        self._keys = {}
+        self._counts = [0]
+        self._first = [0]
+        self._state = _BETWEEN
+        self._key = 0
+        self._start = 0
+        self._offset = 0
+        # offsets where the lines after the first start
+        self._lines = []
+
+    def _error(self, message, offset):
+        line = bisect.bisect_right(self._lines, offset)
+        column = offset - (self._lines[line - 1] if line else 0) + 1
+        raise WordSyntaxError(message, offset, line + 1, column)
+
+    def _letter(self, key, sign, offset):
+        label = self._keys.get(key)
+        if label is None:
+            label = self._keys[key] = len(self._counts)
+            self._counts.append(0)
+            self._first.append(offset)
+        self._counts[label] += 1
+        if self._counts[label] > 2:
+            self._error(f"Letter {_name(key)} appears more than twice", offset)
+        self.labels.append(sign * label)
+
+    def feed(self, text):
+        offset = self._offset
+        newline = text.find("\n")
+        while newline >= 0:
+            self._lines.append(offset + newline + 1)
+            newline = text.find("\n", newline + 1)
+
+        state, key, start = self._state, self._key, self._start
+        for i, c in enumerate(text, offset):
+            if state == _IN_NAME:
+                if c in _NAME:
+                    key = key * 128 + ord(c)
+                    continue
+                if c == "^":
+                    state = _CARET
+                    continue
+                if c == "'":
+                    self._letter(key, -1, start)
+                    state = _BETWEEN
+                    continue
+                # the name ended, c is read again between letters
+                self._letter(key, 1, start)
+                state = _BETWEEN
+            if state == _BETWEEN:
+                if c in _LETTERS:
+                    key, start, state = ord(c), i, _IN_NAME
+                elif c not in _SEPARATORS:
+                    self._error(f"Unexpected character {c!r}", i)
+            elif state == _CARET:
+                if c == "-":
+                    state = _CARET_MINUS
+                elif c == "{":
+                    state = _BRACE
+                else:
+                    self._error(f"Expected {_EXPECTED[state]}, only the exponent -1 is allowed", i)
+            elif (state, c) in ((_CARET_MINUS, "1"), (_BRACE_ONE, "}")):
+                self._letter(key, -1, start)
+                state = _BETWEEN
+            elif (state, c) in ((_BRACE, "-"), (_BRACE_MINUS, "1")):
+                state += 1
+            else:
+                self._error(f"Expected {_EXPECTED[state]}, only the exponent -1 is allowed", i)
+        self._state, self._key, self._start = state, key, start
+        self._offset = offset + len(text)
+
+    def close(self):
+        if self._state == _IN_NAME:
+            self._letter(self._key, 1, self._start)
+        elif self._state != _BETWEEN:
+            self._error(f"Expected {_EXPECTED[self._state]}, the word ended", self._offset)
+        self._state = _BETWEEN
+        if not self.labels:
+            self._error("The word is empty", self._offset)
+        for label, count in enumerate(self._counts):
+            if count == 1:
+                key = next(key for key, value in self._keys.items() if value == label)
+                self._error(f"Letter {_name(key)} appears only once, each letter must appear twice",
+                            self._first[label])
+        # every letter appears twice with labels 1, 2, ..., so the word is valid
+        return SignedWord.trusted(self.labels)
+
+
+def parse_word(text):
+    # SignedWord of a word in the notation above, for example parse_word("a b a^-1 b^-1")
+    parser = WordParser()
+    parser.feed(text)
+    return parser.close()
+
+
+def read_word(stream):
+    # same as parse_word, reading the word from a binary stream in chunks
+    parser = WordParser()
+    for chunk in iter_chunks(stream):
+        parser.feed(chunk)
+    return parser.close()
+
+
+def format_word(word):
+    # a signed word in the notation above, with the letters a, ..., z and then x27, x28, ...
+    def name(label):
+        return string.ascii_lowercase[label - 1] if label <= 26 else f"x{label}"
+    return " ".join(name(label) if label > 0 else f"{name(-label)}^-1" for label in word)
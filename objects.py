@@ -3,16 +3,59 @@
 # undirected graph is an even polygon, with the edges grouped in pairs forming a partition of
 # the edge set. The direction of the edges gives a direction to the gluing, so it is important
 # to keep track of it.
+import os
 import re
+import time
+import metrics
+from canonical import canonical_word
+
+# the surfaces built internally by the algorithm come from surfaces that were already validated,
+# so CompactSurface.trusted() skips the validation. Set this to True (or run with SURFACE_DEBUG=1)
+# to validate them anyway while debugging the algorithm
+debug_validation = os.environ.get("SURFACE_DEBUG", "0") not in ("", "0")
 
 class CompactSurface:
     def __init__(self, vertices, edges, gluing):
+        if metrics.enabled:
+            start = time.perf_counter()
         self.vertices = vertices
         self.edges = edges
         self.gluing = gluing
+        if metrics.enabled:
+            metrics.constructions.inc("validated")
+            metrics.validation_seconds.observe(time.perf_counter() - start)
+
+    @classmethod
+    def trusted(cls, vertices, edges, gluing):
+        """
+        Builds a CompactSurface without running the validation of the setters.
+        Only for internal use, on data derived from a surface that was already validated.
+        Input coming from users must go through the usual constructor.
+        """
+        if debug_validation:
+            return cls(vertices, edges, gluing)
+        if metrics.enabled:
+            metrics.constructions.inc("trusted")
+        surface = cls.__new__(cls)
+        surface._vertices = vertices
+        surface._edges = edges
+        surface._gluing = gluing
+        surface._canonical = None
+        return surface
 
     def __str__(self):
         return f"This surface has {self.vertices} number of vertices, edge set = {self.edges}, and gluing = {self.gluing}"
+
+    # two compact surfaces are equal when their polygons give the same gluing up to rotation,
+    # reflection and relabeling, so that surfaces can be deduplicated and used as keys
+    def __eq__(self, other):
+        if not isinstance(other, CompactSurface):
+            return NotImplemented
+        return self.canonical_form() == other.canonical_form()
+
+    def __hash__(self):
+        return hash(self.canonical_form())
+
     # the set of vertices is not important in our implementation. All the information
     # is encoded in the edges and the gluing, so it can be represented by an even positive integer
     @property
@@ -24,6 +67,7 @@ class CompactSurface:
         if not (isinstance(vertices, int) and vertices > 0 and vertices % 2 == 0):
             raise ValueError("Number of vertices must be an even positive integer")
         self._vertices = vertices
+        self._canonical = None
 
     @property
     def edges(self):
@@ -37,6 +81,7 @@ class CompactSurface:
         if self.vertices == 2:
             if edges == {(0, 1), (0, 1)} or edges == {(1, 0), (1, 0)}:
                 self._edges = edges
+                self._canonical = None
                 return
 
         valid_edges = set()
@@ -73,6 +118,7 @@ class CompactSurface:
                 raise ValueError("Each vertex must appear in exactly two edges")
 
         self._edges = valid_edges
+        self._canonical = None
 
     @property
     def gluing(self):
@@ -87,6 +133,7 @@ class CompactSurface:
         if self.vertices == 2:
             if gluing == {((0, 1), (0, 1))} or gluing == {((1, 0), (1, 0))}:
                 self._gluing = gluing
+                self._canonical = None
                 return
 
         all_glued_edges = set()
@@ -113,6 +160,36 @@ class CompactSurface:
 
 
         self._gluing = gluing
+        self._canonical = None
+
+    def word(self):
+        """
+        Returns the boundary word of the polygon as a list of nonzero integers: position i holds
+        the label of the pair of the edge between i and i+1, with a positive sign if the edge
+        goes from i to i+1 and a negative sign otherwise.
+        For example the torus a b a^-1 b^-1 gives [1, 2, -1, -2].
+        """
+        # the 2-gon is the only polygon where an edge tuple does not determine its position,
+        # the sphere has a single edge tuple and the projective plane has both of them
+        if self.vertices == 2:
+            if len(self.edges) == 2:
+                return [1, 1]
+            return [1, -1] if (0, 1) in self.edges else [-1, 1]
+
+        word = [0] * self.vertices
+        for label, pair in enumerate(self.gluing, 1):
+            for u, v in pair:
+                if v == (u + 1) % self.vertices:
+                    word[u] = label
+                else:
+                    word[v] = -label
+        return word
+
+    def canonical_form(self):
+        # normal signed word, the same for every rotation, reflection and relabeling of the polygon
+        if self._canonical is None:
+            self._canonical = canonical_word(self.word())
+        return self._canonical
 
     def edges_sorted_by_max(self):
     # Identify the special edge
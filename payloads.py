@@ -0,0 +1,121 @@
+import io
+import json
+import struct
+import sys
+from array import array
+import numpy as np
+from objects import CompactSurface
+from words import MAX_LABEL, SignedWord
+from notation import parse_word
+from streams import PayloadTooLarge, read_into
+from batch import validate_batch
+
+# parsing of the surfaces sent to the web app and to the command line
+
+# binary surfaces: a little endian uint32 n followed by the n little endian int32 letters of a
+# signed word, with the labels 1, ..., n/2 of a batch (see batch.py). It costs 4 bytes per edge
+# and needs no parsing at all
+BINARY_MIMETYPE = "application/x-surface-word"
+_COUNT = struct.Struct("<I")
+
+
+def _vertex_count(value):
+    # the number of vertices of a payload, bounded like the length of a word: a polygon has as
+    # many edges as vertices, and the edges are stored as 32-bit labels
+    try:
+        vertices = int(value)
+    except OverflowError:
+        raise ValueError("The number of vertices is out of range") from None
+    if not 0 < vertices <= MAX_LABEL:
+        raise ValueError(f"The number of vertices must be in range(1, {MAX_LABEL + 1})")
+    return vertices
+
+
+# the surface can be given as the vertices, edges and pairs built by input.html,
+# or as a signed word, for example {"word": [1, 2, -1, -2]} or {"word": "a b a^-1 b^-1"} for the torus
+def surface_from_payload(surface_data):
+    if not isinstance(surface_data, dict):
+        raise TypeError("A surface must be given as a JSON object")
+    if "word" in surface_data:
+        if isinstance(surface_data["word"], str):
+            return parse_word(surface_data["word"])
+        return SignedWord(surface_data["word"])
+
+    # Extract vertices, edges, and pairs from the surface data
+    vertices = _vertex_count(surface_data['vertices'])
+    edges = surface_data['edges']  # List of edge pairs
+    pairs = surface_data['pairs']  # List of edge pairings
+
+    # Convert edges and pairs into sets of tuples for CompactSurface
+    EDGES = set()
+    gluing = set()
+
+    # Create a set of edges
+    for edge in edges:
+        u, v = edge[0], edge[1]
+        EDGES.add((u, v))  # Add the edge as a tuple (u, v)
+
+    # Create the gluing (pairing) set
+    for pair in pairs:
+        edge1 = pair[0]
+        edge2 = pair[1]
+        u, v = edge1[0], edge1[1]
+        x, y = edge2[0], edge2[1]
+        gluing.add(((u, v), (x, y)))  # Add the paired edges as a tuple of tuples
+
+    # Create a CompactSurface object with the vertices, edges, and gluing data
+    return CompactSurface(vertices, EDGES, gluing)
+
+
+# one surface per line: a JSON payload as above, a JSON list of signed labels, a word in the
+# notation of notation.py, or the signed labels separated by spaces or commas, for example "1 2 -1 -2"
+def surface_from_line(line):
+    line = line.strip()
+    if line.startswith("{"):
+        return surface_from_payload(json.loads(line))
+    if line.startswith("["):
+        return SignedWord(json.loads(line))
+    if line[:1].isascii() and line[:1].isalpha():
+        return parse_word(line)
+    return SignedWord(int(label) for label in line.replace(",", " ").split())
+
+
+def read_binary_word(stream, max_bytes):
+    """
+    Reads a binary surface from a stream. The length prefix is checked against max_bytes before
+    anything else is read, and the letters are read straight into the array of the SignedWord,
+    then validated with the vectorized checks of batch.py.
+    Raises PayloadTooLarge or ValueError.
+    """
+    header = bytearray(_COUNT.size)
+    read_into(stream, memoryview(header))
+    count, = _COUNT.unpack(header)
+    if _COUNT.size + 4 * count > max_bytes:
+        raise PayloadTooLarge(f"A word of {count} letters is larger than {max_bytes} bytes")
+    labels = array("i", [0]) * count
+    read_into(stream, memoryview(labels).cast("B"))
+    if stream.read(1):
+        raise ValueError(f"The body goes on after the {count} letters of the word")
+    if sys.byteorder == "big":
+        labels.byteswap()
+    errors = validate_batch(np.frombuffer(labels, dtype=np.int32)[np.newaxis, :])
+    if errors:
+        raise ValueError(errors[0])
+    return SignedWord.trusted(labels)
+
+
+def surface_from_binary(data):
+    # same as read_binary_word, from bytes
+    if len(data) >= _COUNT.size:
+        count, = _COUNT.unpack_from(data)
+        if _COUNT.size + 4 * count != len(data):
+            raise ValueError(f"A word of {count} letters takes {_COUNT.size + 4 * count} bytes, not {len(data)}")
+    return read_binary_word(io.BytesIO(data), len(data))
+
+
+def binary_word(surface):
+    # the binary form of a signed word with labels 1, ..., n/2
+    labels = array("i", surface)
+    if sys.byteorder == "big":
+        labels.byteswap()
+    return _COUNT.pack(len(labels)) + labels.tobytes()
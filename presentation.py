@@ -0,0 +1,102 @@
+from canonical import canonical_word
+from invariants import UnionFind, vertex_classes
+from words import as_word
+
+# presentation of the fundamental group of the glued polygon, read from the polygon itself.
+# The polygon is a cell complex with one 2-cell, so its fundamental group is generated by the
+# edge classes (the pairs), with the boundary word as the only relator, once the edges of a
+# spanning tree of the vertex graph are set to 1 (with a single vertex class there are none).
+# The simplification is a sequence of Tietze moves on an array-backed word, each of them linear:
+# - drop the spanning tree edges from the relator,
+# - free and cyclic reduction with a stack,
+# - a generator appearing once in the relator is eliminated together with the relator.
+# Finally the relator is written in the canonical form of canonical.py, so that rotating,
+# inverting or relabeling it gives the same simplified presentation.
+
+
+def raw_presentation(surface):
+    """
+    Returns (generators, relators): generators are the pairs 1, ..., n/2 in order of first
+    appearance, and relators a list of words in them (signed integers). The first relator is
+    the boundary word, the others say that the edges of a spanning tree of the vertices are 1.
+    Accepts a CompactSurface, a SignedWord or a sequence of signed labels.
+    """
+    word = as_word(surface)
+    n = len(word)
+    classes = vertex_classes(word)
+    tree = UnionFind(n)
+
+    generator = {}
+    boundary = []
+    relators = []
+    for i, label in enumerate(word):
+        if abs(label) not in generator:
+            generator[abs(label)] = len(generator) + 1
+            # the edge joins the classes of its two endpoints, it is in the tree if it joins
+            # two parts of the tree that were not connected yet
+            if tree.union(classes.find(i), classes.find((i + 1) % n)):
+                relators.append([generator[abs(label)]])
+        boundary.append(generator[abs(label)] if label > 0 else -generator[abs(label)])
+    return len(generator), [boundary] + relators
+
+
+def free_reduce(word, cyclic=True):
+    # cancels every x x^-1 with a stack, and with cyclic also between the two ends of the word
+    stack = []
+    for letter in word:
+        if stack and stack[-1] == -letter:
+            stack.pop()
+        else:
+            stack.append(letter)
+    if cyclic:
+        start, end = 0, len(stack)
+        while end - start >= 2 and stack[start] == -stack[end - 1]:
+            start += 1
+            end -= 1
+        stack = stack[start:end]
+    return stack
+
+
+def simplify_presentation(generators, relators):
+    """
+    Simplifies a presentation with the boundary relator first and relators x = 1 after it, as
+    given by raw_presentation. Returns (generators, relator) with the remaining generators
+    numbered 1, 2, ... and a single relator, empty if the group is free.
+    """
+    boundary, trivial = relators[0], relators[1:]
+    killed = {relator[0] for relator in trivial}
+    relator = free_reduce([letter for letter in boundary if abs(letter) not in killed])
+
+    # a generator that appears once can be written in terms of the others, and the relator goes
+    uses = {}
+    for letter in relator:
+        uses[abs(letter)] = uses.get(abs(letter), 0) + 1
+    if any(count == 1 for count in uses.values()):
+        return generators - len(killed) - 1, []
+
+    # every generator left in the relator appears twice, so the relator is a polygon word
+    # and has a canonical form, the other generators are free
+    return generators - len(killed), list(canonical_word(relator))
+
+
+def _format_word(word):
+    return " ".join(f"x_{letter}" if letter > 0 else f"x_{-letter}^-1" for letter in word)
+
+
+def format_presentation(generators, relators):
+    # same notation as fundamental_group_presentation
+    if generators == 0:
+        return "{1}"
+    names = ", ".join(f"x_{i}" for i in range(1, generators + 1))
+    equations = ", ".join(f"{_format_word(relator)} = 1" for relator in relators if relator)
+    return f"⟨ {names} | {equations} ⟩"
+
+
+def polygon_presentation(surface):
+    # the raw and the simplified presentations read from the polygon, as strings
+    generators, relators = raw_presentation(surface)
+    simplified_generators, relator = simplify_presentation(generators, relators)
+    return {
+        "raw": format_presentation(generators, relators),
+        "simplified": format_presentation(simplified_generators, [relator]),
+    }
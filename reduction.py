@@ -0,0 +1,247 @@
+import os
+import time
+from words import as_word, find_interleaved_pair
+
+# in place version of the reduction algorithm of classification.py.
+# Instead of building a new CompactSurface after every step, the boundary word is kept in a
+# single doubly linked cyclic list: node i stores its neighbours, the sign of its letter and the
+# node of the other letter of its pair, so no position ever has to be searched for.
+# The three steps of the algorithm become splices of this list:
+# - sphere: an adjacent pair a a^-1 is unlinked in O(1)
+# - projective plane: a Y a Z becomes Y^-1 Z, reversing the shorter of Y and Z in place
+# - torus: a X b Y a^-1 Z b^-1 W becomes Z Y X W, which only relinks the ends of the segments
+# The word is validated once when the list is built.
+# The steps are applied in the same order of preference as in classification.py, but the cross-cap
+# and the torus found at each step can differ, since the reduction of classification.py picks them
+# in the iteration order of a set. So the counts of spheres, projective planes and tori can differ,
+# while the surface they give, (orientability, genus) after classification_from_counts, is the same.
+
+
+# budgets of the reduction loops, here and in surface_classification: every step removes at least
+# one pair of edges, so a loop can't take more steps than pairs, but a step that makes no progress
+# would spin forever. The loops stop with ReductionStalled when no step applies or a step removes
+# nothing, or when they run out of steps (SURFACE_MAX_STEPS) or of time (SURFACE_MAX_SECONDS);
+# 0 means no limit. classification.classify then falls back to the invariant engine.
+step_budget = int(os.environ.get("SURFACE_MAX_STEPS", 0))
+time_budget = float(os.environ.get("SURFACE_MAX_SECONDS", 0))
+
+
+class ReductionStalled(RuntimeError):
+    def __init__(self, reason, message, steps, vertices):
+        super().__init__(f"{message} after {steps} steps, with {vertices} vertices left")
+        self.reason = reason
+        self.steps = steps
+        self.vertices = vertices
+
+
+class Budget:
+    # the budgets of one reduction, max_steps and max_seconds default to step_budget and time_budget
+    def __init__(self, max_steps=None, max_seconds=None):
+        self.max_steps = step_budget if max_steps is None else max_steps
+        max_seconds = time_budget if max_seconds is None else max_seconds
+        self.deadline = time.monotonic() + max_seconds if max_seconds else None
+
+    def check(self, steps, vertices):
+        if self.max_steps and steps >= self.max_steps:
+            raise ReductionStalled("steps", "The reduction ran out of steps", steps, vertices)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise ReductionStalled("time", "The reduction ran out of time", steps, vertices)
+
+
+class CyclicWord:
+    def __init__(self, word):
+        n = len(word)
+        if n == 0 or n % 2 != 0:
+            raise ValueError("A signed word must have an even positive number of letters")
+
+        self.next = [(i + 1) % n for i in range(n)]
+        self.prev = [(i - 1) % n for i in range(n)]
+        self.sign = [0] * n
+        self.partner = [0] * n
+        first = {}
+        for i, label in enumerate(word):
+            if label == 0:
+                raise ValueError("Labels of a signed word must be nonzero integers")
+            self.sign[i] = 1 if label > 0 else -1
+            if abs(label) in first:
+                j = first.pop(abs(label))
+                if j < 0:
+                    raise ValueError(f"Label {abs(label)} appears more than twice, each label must appear exactly twice")
+                self.partner[i] = j
+                self.partner[j] = i
+                # mark the label as used twice
+                first[abs(label)] = -1
+            else:
+                first[abs(label)] = i
+        for label, j in first.items():
+            if j >= 0:
+                raise ValueError(f"Label {label} appears once, each label must appear exactly twice")
+
+        self.size = n
+        self.head = 0
+        # one node of every pair whose two letters have the same sign, that is, every cross-cap
+        self.crosscaps = {min(i, self.partner[i]) for i in range(n) if self.sign[i] == self.sign[self.partner[i]]}
+        # nodes that may be followed by their inverse, checked lazily
+        self.pending = list(range(n))
+
+    def __len__(self):
+        return self.size
+
+    def letters(self):
+        # the current word, starting from the head, as signed partner indices
+        node = self.head
+        for _ in range(self.size):
+            yield node, self.sign[node]
+            node = self.next[node]
+
+    def _link(self, a, b):
+        self.next[a] = b
+        self.prev[b] = a
+
+    def _splice(self, segments):
+        # joins the nonempty segments (first, last) into a cycle, in the given order
+        segments = [segment for segment in segments if segment is not None]
+        for (_, last), (first, _) in zip(segments, segments[1:] + segments[:1]):
+            self._link(last, first)
+            self.pending.append(last)
+        if segments:
+            self.head = segments[0][0]
+
+    def _segment(self, start, end):
+        # nodes strictly between start and end going forwards, as (first, last) or None if empty
+        if self.next[start] == end:
+            return None
+        return self.next[start], self.prev[end]
+
+    def cancel_sphere(self):
+        # removes an adjacent pair a a^-1, returns False if there is none
+        while self.pending:
+            node = self.pending.pop()
+            if self.size <= 2 or self.sign[node] == 0:
+                continue
+            following = self.next[node]
+            if self.partner[node] == following and self.sign[node] != self.sign[following]:
+                self._link(self.prev[node], self.next[following])
+                self.pending.append(self.prev[node])
+                self.sign[node] = self.sign[following] = 0
+                if self.head in (node, following):
+                    self.head = self.next[following]
+                self.size -= 2
+                return True
+        return False
+
+    def remove_crosscap(self):
+        # a Y a Z becomes Y^-1 Z, returns False if the word has no cross-cap
+        if not self.crosscaps:
+            return False
+        p = self.crosscaps.pop()
+        q = self.partner[p]
+        y = self._segment(p, q)
+        z = self._segment(q, p)
+
+        # reversing Y gives Y^-1 Z and reversing Z gives Y Z^-1, which is the same surface,
+        # so we walk both segments at the same time and reverse the shorter one
+        short, long = y, z
+        if y is not None and z is not None:
+            a, b = y[0], z[0]
+            while a != y[1] and b != z[1]:
+                a, b = self.next[a], self.next[b]
+            if a != y[1]:
+                short, long = z, y
+        elif z is None:
+            short, long = z, y
+
+        self.sign[p] = self.sign[q] = 0
+        self.size -= 2
+        if short is None:
+            self._splice([long])
+            return True
+
+        first, last = short
+        node = first
+        touched = []
+        while True:
+            following = self.next[node]
+            self.next[node], self.prev[node] = self.prev[node], self.next[node]
+            self.sign[node] = -self.sign[node]
+            touched.append(node)
+            if node == last:
+                break
+            node = following
+        # pairs with one letter in the reversed segment change from or to a cross-cap
+        for node in touched:
+            rep = min(node, self.partner[node])
+            if self.sign[node] == self.sign[self.partner[node]]:
+                self.crosscaps.add(rep)
+            else:
+                self.crosscaps.discard(rep)
+        self._splice([(last, first), long])
+        return True
+
+    def find_torus(self):
+        # finds a X b Y a^-1 Z b^-1 W in a word without cross-caps, in one pass over the word
+        nodes = []
+
+        def pairs():
+            for node, _ in self.letters():
+                nodes.append(node)
+                yield min(node, self.partner[node])
+
+        positions = find_interleaved_pair(pairs())
+        if positions is None:
+            return None
+        return tuple(nodes[i] for i in positions)
+
+    def remove_torus(self):
+        # a X b Y a^-1 Z b^-1 W becomes Z Y X W, returns False if there is no such pattern
+        torus = self.find_torus()
+        if torus is None:
+            return False
+        a1, b1, a2, b2 = torus
+        x = self._segment(a1, b1)
+        y = self._segment(b1, a2)
+        z = self._segment(a2, b2)
+        w = self._segment(b2, a1)
+        for node in torus:
+            self.sign[node] = 0
+        self.size -= 4
+        self._splice([z, y, x, w])
+        return True
+
+
+def reduce_surface(surface, progress=None, max_steps=None, max_seconds=None):
+    """
+    Removes spheres, projective planes and tori from the word in the same order of preference as
+    surface_classification, and returns how many of each it removed. The counts give the same
+    classification through classification_from_counts, but not always the same counts.
+    Accepts a CompactSurface, a SignedWord or a sequence of signed labels.
+    progress works as in surface_classification, and so do the budgets: raises ReductionStalled
+    if the reduction runs out of steps or of time.
+    """
+    word = CyclicWord(as_word(surface))
+    budget = Budget(max_steps, max_seconds)
+
+    projective_planes = 0
+    tori = 0
+    sphere = 0
+    while len(word) > 2:
+        steps = sphere + projective_planes + tori
+        if progress is not None:
+            progress(steps, len(word))
+        budget.check(steps, len(word))
+        if word.cancel_sphere():
+            sphere += 1
+        elif word.remove_crosscap():
+            projective_planes += 1
+        elif word.remove_torus():
+            tori += 1
+        else:
+            raise ReductionStalled("stalled", "No reduction step applies to the word", steps, len(word))
+
+    if len(word) == 2:
+        (_, sign1), (_, sign2) = word.letters()
+        if sign1 != sign2:
+            sphere += 1
+        else:
+            projective_planes += 1
+    return projective_planes, tori, sphere
@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+import metrics
+from canonical import canonical_word
+from classification import classify
+from invariants import invariant_classification
+from shared import SharedDatabase
+from words import as_word
+
+# cache of classification results shared by all the worker processes of the web app.
+# A classification only depends on the gluing, so the key of a surface is a hash of its canonical
+# word (canonical.py): rotating, reflecting or relabeling the polygon hits the same entry.
+# The entries live in a SQLite file in WAL mode (shared.py), which the processes open on their
+# own, so the surface one gunicorn worker classified is known to all the others, and to the next
+# run of the app if the file is kept. Once there are more than max_entries the least recently
+# used tenth of them is evicted in one statement.
+# A lookup is a plain read, which never waits for a writer. The hits and misses, and the entries
+# that were hit, are kept in memory and written in one transaction every flush_every lookups or
+# flush_interval seconds, and with every new entry. The counts are kept in the same file, so they
+# add up all the processes.
+# The cache is only an optimization: if the file can't be read or written, a lookup is a miss and
+# a new entry is dropped.
+
+logger = logging.getLogger(__name__)
+
+# the examples at the bottom of classification.py and the standard words of a few more surfaces
+COMMON_WORDS = (
+    [1, -1],
+    [1, 1],
+    [1, 2, -1, -2],
+    [1, 2, 1, -2],
+    [1, 2, -1, -2, 3, 4, -3, -4],
+    [1, 2, -1, -2, 3, 4, -3, -4, 5, 6, -5, -6],
+    [1, 1, 2, 2, 3, 3],
+    [1, 1, 2, 2, 3, 3, 4, 4],
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key BLOB PRIMARY KEY,
+    orientability INTEGER NOT NULL,
+    genus INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0), ('entries', 0), ('evictions', 0);
+"""
+
+
+def surface_key(surface):
+    # 32 bytes that are the same for all the polygons with the same canonical word
+    return hashlib.sha256(array("i", canonical_word(as_word(surface))).tobytes()).digest()
+
+
+class ResultCache:
+    """
+    Classifications (orientability, genus) keyed by surface_key, in the SQLite file at path.
+    Surfaces with more than max_edges edges are not cached: their key costs as much as
+    classifying a small surface, and they are rarely submitted twice.
+    """
+
+    def __init__(self, path, max_entries=100000, max_edges=100000, timeout=5.0, flush_every=100,
+                 flush_interval=1.0):
+        if max_entries < 1:
+            raise ValueError("The cache must hold at least one entry")
+        self.path = path
+        self.max_entries = max_entries
+        self.max_edges = max_edges
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._database = SharedDatabase(path, _SCHEMA, timeout)
+        self._reset()
+
+    def _reset(self):
+        # lookups not written yet: the counts, and the time every entry hit was last used
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0}
+        self._used = {}
+        self._flushed = time.monotonic()
+
+    # a cache is sent to the workers of execution.ClassificationPool as its settings, and every
+    # process opens its own connections
+    def __getstate__(self):
+        return {"path": self.path, "max_entries": self.max_entries, "max_edges": self.max_edges,
+                "flush_every": self.flush_every, "flush_interval": self.flush_interval,
+                "_database": self._database}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def key(self, surface):
+        # the key of the surface, or None if it is too large to be cached
+        if len(as_word(surface)) > self.max_edges:
+            return None
+        return surface_key(surface)
+
+    def get(self, key):
+        # the cached classification or None, counting the lookup as a hit or a miss
+        try:
+            row = self._database.connection().execute(
+                "SELECT orientability, genus FROM results WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Result cache lookup failed: %s", e)
+            row = None
+        with self._lock:
+            if row is not None:
+                self._counts["hits"] += 1
+                self._used[key] = time.time()
+            else:
+                self._counts["misses"] += 1
+            flush = (sum(self._counts.values()) >= self.flush_every
+                     or time.monotonic() - self._flushed >= self.flush_interval)
+        if flush:
+            self.flush()
+        if metrics.enabled:
+            metrics.cache_lookups.inc("hit" if row is not None else "miss")
+        return None if row is None else tuple(row)
+
+    def _take_pending(self):
+        with self._lock:
+            counts, used = self._counts, self._used
+            self._counts, self._used = {"hits": 0, "misses": 0}, {}
+            self._flushed = time.monotonic()
+        return counts, used
+
+    def _write_pending(self, connection, counts, used):
+        # called within a write transaction
+        connection.executemany("UPDATE counters SET value = value + ? WHERE name = ?",
+                               [(count, name) for name, count in counts.items() if count])
+        connection.executemany("UPDATE results SET used = ? WHERE key = ?",
+                               [(when, key) for key, when in used.items()])
+
+    def flush(self):
+        # writes the lookups kept in memory
+        counts, used = self._take_pending()
+        if not any(counts.values()):
+            return
+        connection = self._database.connection()
+        try:
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                self._write_pending(connection, counts, used)
+        except sqlite3.Error as e:
+            # the counts are only statistics, they are dropped
+            logger.warning("Result cache flush failed: %s", e)
+
+    def put(self, key, classification):
+        counts, used = self._take_pending()
+        connection = self._database.connection()
+        try:
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                self._write_pending(connection, counts, used)
+                added = connection.execute("INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?)",
+                                           (key, *classification, time.time())).rowcount
+                if not added:
+                    return
+                entries = connection.execute("UPDATE counters SET value = value + 1 WHERE name = 'entries' "
+                                             "RETURNING value").fetchone()[0]
+                if entries > self.max_entries:
+                    self._evict(connection, entries - self.max_entries + self.max_entries // 10)
+        except sqlite3.Error as e:
+            logger.warning("Result cache update failed: %s", e)
+
+    def _evict(self, connection, count):
+        evicted = connection.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used LIMIT ?)", (count,)
+        ).rowcount
+        connection.execute("UPDATE counters SET value = value - ? WHERE name = 'entries'", (evicted,))
+        connection.execute("UPDATE counters SET value = value + ? WHERE name = 'evictions'", (evicted,))
+        if metrics.enabled:
+            metrics.cache_evictions.inc(amount=evicted)
+
+    def warm_up(self, words=COMMON_WORDS):
+        # stores the classifications of the given words (sequences of signed labels)
+        for word in words:
+            key = self.key(word)
+            if key is not None:
+                self.put(key, invariant_classification(word))
+
+    def stats(self):
+        self.flush()
+        counters = dict(self._database.connection().execute("SELECT name, value FROM counters").fetchall())
+        lookups = counters["hits"] + counters["misses"]
+        return {**counters, "max_entries": self.max_entries,
+                "hit_rate": counters["hits"] / lookups if lookups else None}
+
+    def clear(self):
+        self._take_pending()
+        connection = self._database.connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM results")
+            connection.execute("UPDATE counters SET value = 0")
+
+
+def cached_classify(surface, engine="reduction", cache=None, progress=None):
+    # classification.classify, looked up first in the cache and stored there afterwards
+    key = cache.key(surface) if cache is not None else None
+    if key is not None:
+        classification = cache.get(key)
+        if classification is not None:
+            return classification
+    classification = classify(surface, engine, progress)
+    if key is not None:
+        cache.put(key, classification)
+    return classification
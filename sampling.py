@@ -0,0 +1,169 @@
+import argparse
+import json
+import math
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+import numpy as np
+from batch import classify_batch
+
+# Monte Carlo estimate of the distribution of the surfaces given by random gluings of a 2n-gon.
+# The polygons are generated directly as a 2D array of signed words (see batch.py), one chunk at
+# a time, and classified with classify_batch, so no CompactSurface is ever built. The chunks can
+# be spread over a pool of processes; each chunk has its own seed, spawned from the seed of the
+# run, so a run gives the same results whatever the number of processes.
+#   python sampling.py 20 --samples 1000000 --jobs 4 --precision 0.001
+
+
+def random_words(edges, count, rng, orientable=False):
+    """
+    count uniformly random gluings of a polygon with the given even number of edges, as a
+    (count, edges) array of signed words: the pairing of the edges is uniform and so are the
+    directions of the edges, or, with orientable, the two edges of every pair have opposite signs.
+    """
+    if edges <= 0 or edges % 2 != 0:
+        raise ValueError("The polygon must have an even positive number of edges")
+    # a random permutation of the positions, whose consecutive entries are paired
+    positions = rng.permuted(np.tile(np.arange(edges), (count, 1)), axis=1)
+    rows = np.arange(count)[:, None]
+    words = np.empty((count, edges), dtype=np.int32)
+    words[rows, positions] = np.arange(edges) // 2 + 1
+
+    signs = rng.integers(0, 2, size=(count, edges), dtype=np.int32) * 2 - 1
+    if orientable:
+        signs[rows, positions[:, 1::2]] = -signs[rows, positions[:, 0::2]]
+    return words * signs
+
+
+def _sample_chunk(edges, count, seed, orientable):
+    # classifies count random gluings, returns the (orientability, genus) found and their counts
+    words = random_words(edges, count, np.random.default_rng(seed), orientable)
+    orientability, genus, _ = classify_batch(words, validate=False)
+    keys, counts = np.unique(np.stack((orientability.astype(np.int64), genus), axis=1), axis=0, return_counts=True)
+    return [(int(o), int(g)) for o, g in keys], counts.tolist()
+
+
+def wilson_interval(successes, total, z):
+    # Wilson score interval of a proportion, better than the normal one for rare surfaces
+    if total == 0:
+        return 0.0, 1.0
+    p = successes / total
+    denominator = 1 + z * z / total
+    center = (p + z * z / (2 * total)) / denominator
+    half = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def snapshot(histogram, samples, confidence):
+    """
+    The running estimate as a JSON-friendly dictionary: the number of samples and, for every
+    surface seen, its count, estimated probability and confidence interval.
+    The surfaces are identified by (orientability, genus) as in classification_2.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    surfaces = []
+    for (orientability, genus), count in sorted(histogram.items(), key=lambda item: (-item[0][0], item[0][1])):
+        low, high = wilson_interval(count, samples, z)
+        surfaces.append({"orientability": orientability, "genus": genus, "count": count,
+                         "probability": count / samples, "low": low, "high": high})
+    return {"samples": samples, "confidence": confidence, "surfaces": surfaces}
+
+
+def iter_genus_distribution(edges, samples=None, chunk_size=10000, jobs=1, seed=None, orientable=False,
+                            precision=None, confidence=0.95):
+    """
+    Samples random gluings of a polygon with the given number of edges, yielding a snapshot of
+    the running histogram after every chunk.
+    Stops after samples gluings, or as soon as every confidence interval is narrower than
+    2 * precision; at least one of the two must be given.
+    """
+    if samples is None and precision is None:
+        raise ValueError("Give a number of samples, a precision or both")
+    seeds = np.random.SeedSequence(seed)
+
+    def chunks():
+        # (count, seed) of the chunks to classify, endless if only the precision stops the run
+        done = 0
+        while samples is None or done < samples:
+            count = chunk_size if samples is None else min(chunk_size, samples - done)
+            done += count
+            yield count, seeds.spawn(1)[0]
+
+    histogram = {}
+    total = 0
+
+    def add(result, count):
+        nonlocal total
+        for key, value in zip(*result):
+            histogram[key] = histogram.get(key, 0) + value
+        total += count
+        return snapshot(histogram, total, confidence)
+
+    def precise(state):
+        return precision is not None and all(
+            (surface["high"] - surface["low"]) / 2 <= precision for surface in state["surfaces"])
+
+    if jobs <= 1:
+        for count, chunk_seed in chunks():
+            state = add(_sample_chunk(edges, count, chunk_seed, orientable), count)
+            yield state
+            if precise(state):
+                return
+        return
+
+    # keep a bounded number of chunks in flight, taking the results in order so that they do
+    # not depend on the number of processes
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        try:
+            for count, chunk_seed in chunks():
+                pending.append((count, executor.submit(_sample_chunk, edges, count, chunk_seed, orientable)))
+                if len(pending) < 2 * jobs:
+                    continue
+                count, future = pending.popleft()
+                state = add(future.result(), count)
+                yield state
+                if precise(state):
+                    return
+            while pending:
+                count, future = pending.popleft()
+                state = add(future.result(), count)
+                yield state
+                if precise(state):
+                    return
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def sample_genus_distribution(edges, **options):
+    # the final snapshot of iter_genus_distribution
+    state = None
+    for state in iter_genus_distribution(edges, **options):
+        pass
+    return state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate the distribution of the surfaces given by random gluings of a polygon.")
+    parser.add_argument("edges", type=int, help="even number of edges of the polygon")
+    parser.add_argument("--samples", type=int, help="number of random gluings")
+    parser.add_argument("--precision", type=float,
+                        help="stop when every confidence interval has at most this half width")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--jobs", type=int, default=1, help="number of processes")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--orientable", action="store_true", help="only glue edges with opposite orientations")
+    args = parser.parse_args(argv)
+    if args.samples is None and args.precision is None:
+        parser.error("give --samples, --precision or both")
+
+    # one NDJSON snapshot per chunk, the last one is the final estimate
+    for state in iter_genus_distribution(args.edges, args.samples, args.chunk_size, args.jobs, args.seed,
+                                         args.orientable, args.precision, args.confidence):
+        print(json.dumps(state), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+import sqlite3
+import threading
+
+# SQLite files shared by the worker processes of the web app.
+# Every thread of every process opens its own connection: sqlite3 connections can't be shared
+# between threads, and must not be inherited by a forked child. The files are in WAL mode, so
+# readers never wait for the writer. A new file is created readable by its owner only, since it
+# holds what the clients sent; SQLite gives the -wal and -shm files the same permissions.
+
+
+class SharedDatabase:
+    """
+    The SQLite file at path, created with the statements of schema if they are missing.
+    connection() is the connection of the calling thread, in autocommit mode: a transaction is
+    opened with an explicit BEGIN inside "with connection:".
+    """
+
+    def __init__(self, path, schema, timeout=5.0):
+        self.path = path
+        self.schema = schema
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        self.connection().executescript(schema)
+
+    # sent to other processes as its settings, every process opens its own connections
+    def __getstate__(self):
+        return {"path": self.path, "schema": self.schema, "timeout": self.timeout}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
@@ -0,0 +1,171 @@
+import codecs
+import json
+import re
+
+# incremental readers for large inputs, so that a batch of surfaces never has to be held in
+# memory at once. A stream is any binary file-like object with a read(size) method,
+# for example request.stream in app.py or sys.stdin.buffer.
+
+CHUNK_SIZE = 1 << 16
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"\s*")
+# what can follow the prefix of a number that raw_decode took for the whole number, as 1 in 1.5
+_number_tail = re.compile(r"[-+.eE\d]*\Z")
+
+
+class PayloadTooLarge(ValueError):
+    # the web app answers it with 413
+    pass
+
+
+def iter_chunks(stream, chunk_size=CHUNK_SIZE):
+    # decoded text chunks of a binary stream
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            return
+        text = decoder.decode(data)
+        if text:
+            yield text
+
+
+def read_limited(stream, limit):
+    # the whole stream, raising PayloadTooLarge as soon as more than limit bytes have been read
+    data = bytearray()
+    while len(data) <= limit:
+        chunk = stream.read(min(CHUNK_SIZE, limit + 1 - len(data)))
+        if not chunk:
+            return bytes(data)
+        data += chunk
+    raise PayloadTooLarge(f"The body is larger than {limit} bytes")
+
+
+def read_into(stream, view):
+    # fills the writable byte memoryview from the stream, raising ValueError if the stream ends first
+    filled = 0
+    while filled < len(view):
+        chunk = stream.read(min(CHUNK_SIZE, len(view) - filled))
+        if not chunk:
+            raise ValueError(f"The body ended after {filled} of {len(view)} bytes")
+        view[filled:filled + len(chunk)] = chunk
+        filled += len(chunk)
+
+
+def iter_lines(chunks, max_length=None):
+    # lines of a stream of text chunks, without the line breaks. A line longer than max_length
+    # characters raises PayloadTooLarge as soon as it goes past it
+    pending = ""
+    for chunk in chunks:
+        pending += chunk
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            if max_length is not None and len(line) > max_length:
+                raise PayloadTooLarge(f"A line is longer than {max_length} characters")
+            yield line
+        if max_length is not None and len(pending) > max_length:
+            raise PayloadTooLarge(f"A line is longer than {max_length} characters")
+    if pending:
+        yield pending
+
+
+def iter_json_values(stream, max_value=None):
+    """
+    Reads a JSON array or newline delimited JSON (one value per line) from a binary stream,
+    yielding one value at a time.
+    A line of NDJSON that cannot be parsed yields the ValueError instead of the value, so the
+    caller can report it and go on with the next line. A malformed JSON array cannot be resumed,
+    so the error is yielded once and the reading stops.
+    A value (or line) longer than max_value characters yields PayloadTooLarge, and the reading
+    stops too: it is never held in memory as a whole.
+    """
+    chunks = iter_chunks(stream)
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        if buffer.strip():
+            break
+    buffer = buffer.lstrip()
+
+    if not buffer.startswith("["):
+        lines = iter_lines(_prepend(buffer, chunks), max_value)
+        while True:
+            try:
+                line = next(lines)
+            except StopIteration:
+                return
+            except PayloadTooLarge as e:
+                yield e
+                return
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+
+    # JSON array: decode the values one by one, keeping an offset into the buffer
+    # so that the values already decoded are not copied around
+    buffer = buffer[1:]
+    position = 0
+    expect_value = True
+    while True:
+        position = _whitespace.match(buffer, position).end()
+        if buffer.startswith("]", position):
+            return
+        if not expect_value:
+            if buffer.startswith(",", position):
+                position += 1
+                expect_value = True
+                continue
+            if position < len(buffer):
+                yield ValueError(f"Expected ',' or ']' in the JSON array, found {buffer[position:position + 20]!r}")
+                return
+        elif position < len(buffer):
+            try:
+                value, end = _decoder.raw_decode(buffer, position)
+            except ValueError:
+                # the value is not complete yet
+                pass
+            else:
+                if max_value is not None and end - position > max_value:
+                    yield PayloadTooLarge(f"A value of the JSON array is longer than {max_value} characters")
+                    return
+                # a number at the end of the buffer might go on in the next chunk, even if
+                # raw_decode stopped before the end, as in 1.5 cut after the dot
+                number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if end < len(buffer) and not (number and _number_tail.match(buffer, end)):
+                    yield value
+                    position = end
+                    expect_value = False
+                    continue
+
+        # everything after position is the value being read, do not wait for its end
+        if max_value is not None and len(buffer) - position > max_value:
+            yield PayloadTooLarge(f"A value of the JSON array is longer than {max_value} characters")
+            return
+
+        # read at least as much as what is left, so a huge value is decoded only a
+        # logarithmic number of times
+        buffer = buffer[position:]
+        position = 0
+        wanted = max(len(buffer), 1)
+        read = 0
+        for chunk in chunks:
+            buffer += chunk
+            read += len(chunk)
+            if read >= wanted:
+                break
+        if read == 0:
+            yield ValueError("Unexpected end of the JSON array")
+            return
+
+
+def _prepend(first, chunks):
+    yield first
+    yield from chunks
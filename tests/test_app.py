@@ -0,0 +1,155 @@
+import json
+import random
+import struct
+import pytest
+from benchmarks import random_word
+from invariants import invariant_classification
+from notation import format_word
+
+# the routes of the web app through the Flask test client, against the invariant engine
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    # the SQLite files of the app go to a temporary folder, they are opened when app.py is imported
+    directory = tmp_path_factory.mktemp("instance")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("RESULT_CACHE", str(directory / "results.sqlite3"))
+        patch.setenv("JOB_STORE", str(directory / "jobs.sqlite3"))
+        patch.setenv("SESSION_STORE", str(directory / "sessions.sqlite3"))
+        import app
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
+
+
+def classification_of(response):
+    return response.json["orientability"], response.json["genus"]
+
+
+def test_classify_agrees_with_invariants(client):
+    rng = random.Random(11)
+    for _ in range(50):
+        word = random_word(2 * rng.randint(1, 10), rng)
+        expected = invariant_classification(word)
+        assert classification_of(client.post("/api/classify", json={"word": word})) == expected, word
+        response = client.post("/api/classify", data=format_word(word), content_type="text/plain")
+        assert classification_of(response) == expected, word
+        binary = struct.pack(f"<I{len(word)}i", len(word), *word)
+        response = client.post("/api/classify", data=binary, content_type="application/x-surface-word")
+        assert classification_of(response) == expected, word
+        response = client.get("/api/classify", query_string={"word": " ".join(map(str, word))})
+        assert classification_of(response) == expected, word
+
+
+@pytest.mark.parametrize("body", [
+    '{"word": [1, 99999999999, -1, -99999999999]}',
+    '{"word": [1, 2, -1]}',
+    '{"vertices": 1e400, "edges": [], "pairs": []}',
+    '{"edges": []}',
+    '[1, 1]',
+    'not json',
+])
+def test_classify_rejects_bad_payloads(client, body):
+    response = client.post("/api/classify", data=body, content_type="application/json")
+    assert response.status_code == 400
+    assert "error" in response.json
+
+
+@pytest.mark.parametrize("word", ["1 99999999999 -1 -99999999999", "1 2 -1", "a b", ""])
+def test_classify_query_rejects_bad_words(client, word):
+    assert client.get("/api/classify", query_string={"word": word}).status_code == 400
+
+
+def test_classify_query_etag_is_canonical(client):
+    torus = client.get("/api/classify", query_string={"word": "a b a^-1 b^-1"})
+    assert torus.status_code == 200
+    assert torus.cache_control.public
+    # relabeled and rotated: the same surface, the same tag
+    other = client.get("/api/classify", query_string={"word": "y x^-1 y^-1 x"})
+    assert other.headers["ETag"] == torus.headers["ETag"]
+    cached = client.get("/api/classify", query_string={"word": "y x^-1 y^-1 x"},
+                        headers={"If-None-Match": torus.headers["ETag"]})
+    assert cached.status_code == 304
+    klein = client.get("/api/classify", query_string={"word": "a b a b^-1"})
+    assert klein.headers["ETag"] != torus.headers["ETag"]
+
+
+def test_classify_post_is_never_a_conditional_hit(client):
+    torus = client.get("/api/classify", query_string={"word": "a b a^-1 b^-1"})
+    response = client.post("/api/classify", json={"word": [1, 2, -1, -2]},
+                           headers={"If-None-Match": torus.headers["ETag"]})
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+
+
+def test_presentation_only_on_request(client):
+    assert "presentation" not in client.post("/api/classify", json={"word": [1, 1]}).json
+    assert "presentation" in client.post("/api/classify?presentation=1", json={"word": [1, 1]}).json
+
+
+def test_homology_check_only_below_the_inline_limit(app, client):
+    app.app.config["VERIFY_HOMOLOGY"] = True
+    try:
+        response = client.post("/api/classify", json={"word": [1, 2, -1, -2]})
+        assert response.json["homology_check"]["agrees"]
+        large = [x for i in range(1, app.app.config["INLINE_LIMIT"]) for x in (i, -i)]
+        assert "homology_check" not in client.post("/api/classify", json={"word": large}).json
+    finally:
+        app.app.config["VERIFY_HOMOLOGY"] = False
+
+
+def test_batch_reports_errors_per_line(client):
+    lines = ['{"word": [1, 2, -1, -2]}', '{"word": [1, 99999999999, -1, -99999999999]}', 'nonsense',
+             '{"word": "a a b b"}']
+    response = client.post("/api/classify/batch", data="\n".join(lines))
+    results = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert (results[0]["orientability"], results[0]["genus"]) == (1, 1)
+    assert "error" in results[1] and "error" in results[2]
+    assert (results[3]["orientability"], results[3]["genus"]) == (0, 2)
+
+
+def test_bodies_over_the_limit_are_refused(app, client):
+    limit = app.app.config["MAX_CONTENT_LENGTH"]
+    app.app.config["MAX_CONTENT_LENGTH"] = app.app.config["MAX_BODY_BYTES"] = 100
+    try:
+        word = [x for i in range(1, 100) for x in (i, -i)]
+        assert client.post("/api/classify", json={"word": word}).status_code == 413
+        assert client.post("/api/sessions", json={"word": word}).status_code == 413
+        assert client.post("/api/jobs", json={"word": word}).status_code == 413
+    finally:
+        app.app.config["MAX_CONTENT_LENGTH"] = app.app.config["MAX_BODY_BYTES"] = limit
+
+
+def test_output_page(client):
+    assert b"torus" in client.post("/output", data={"word": "a b a^-1 b^-1"}).data
+    assert client.post("/output", data={"word": "a b"}).status_code == 400
+    assert client.post("/output", data={"surface_input": '{"vertices": 1e400, "edges": [], "pairs": []}'}).status_code == 400
+
+
+def test_sessions_follow_their_edits(client):
+    rng = random.Random(13)
+    word = random_word(12, rng)
+    created = client.post("/api/sessions", json={"word": word})
+    assert created.status_code == 201
+    session = created.headers["Location"]
+    for _ in range(30):
+        i, j = rng.randrange(12), rng.randrange(12)
+        edit = {"flip": i} if rng.random() < 0.5 else {"swap": [i, j]}
+        response = client.post(f"{session}/edits", json=edit)
+        assert "word" not in response.json
+        if "flip" in edit:
+            word[i] = -word[i]
+        else:
+            word[i], word[j] = word[j], word[i]
+        assert classification_of(response) == invariant_classification(word), word
+    state = client.get(session).json
+    assert state["word"] == word
+    assert client.post(f"{session}/edits", json={"flip": True}).status_code == 400
+    assert client.post(f"{session}/edits", json={"flip": 12}).status_code == 400
+    assert client.delete(session).status_code == 204
+    assert client.get(session).status_code == 404
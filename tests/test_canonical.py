@@ -0,0 +1,102 @@
+import random
+from benchmarks import random_word, random_orientable_word
+from canonical import canonical_word
+from invariants import invariant_classification
+from presentation import polygon_presentation, raw_presentation, simplify_presentation
+from words import compact_labels
+
+# canonical words against a brute force over all the symmetries of the polygon, and the
+# presentations read from the polygon against the invariant engine
+
+
+def normalized(word):
+    # labels 1, 2, ... in order of first appearance, the first edge of every pair positive
+    labels = {}
+    result = []
+    for label in word:
+        if abs(label) not in labels:
+            labels[abs(label)] = (len(labels) + 1, 1 if label > 0 else -1)
+        new, sign = labels[abs(label)]
+        result.append(new * sign * (1 if label > 0 else -1))
+    return tuple(result)
+
+
+def symmetric_words(word):
+    # the normalized words of all the rotations of the polygon and of its reflection
+    reflected = [-label for label in reversed(word)]
+    return {normalized(w[k:] + w[:k]) for w in (word, reflected) for k in range(len(word))}
+
+
+def test_canonical_word_is_one_of_the_symmetric_words():
+    rng = random.Random(20)
+    for _ in range(300):
+        word = random_word(2 * rng.randint(1, 8), rng)
+        assert canonical_word(word) in symmetric_words(word), word
+
+
+def test_canonical_words_agree_with_the_brute_force():
+    # short words, so that many of the pairs are the same polygon
+    rng = random.Random(21)
+    for _ in range(2000):
+        n = 2 * rng.randint(1, 3)
+        a, b = random_word(n, rng), random_word(n, rng)
+        same = bool(symmetric_words(a) & symmetric_words(b))
+        assert (canonical_word(a) == canonical_word(b)) == same, (a, b)
+
+
+def test_canonical_word_is_invariant():
+    rng = random.Random(22)
+    for _ in range(300):
+        word = random_word(2 * rng.randint(1, 10), rng)
+        expected = canonical_word(word)
+        k = rng.randrange(len(word))
+        flipped = {abs(label) for label in word if rng.random() < 0.5}
+        assert canonical_word(word[k:] + word[:k]) == expected
+        assert canonical_word([-label for label in reversed(word)]) == expected
+        assert canonical_word([-label if abs(label) in flipped else label for label in word]) == expected
+        assert canonical_word(compact_labels(word[::-1])) == canonical_word(word[::-1])
+    assert canonical_word([]) == ()
+
+
+def presentation_classification(generators, relator):
+    # one vertex, the generators as edges and the relator as the only face
+    if not relator:
+        assert generators == 0
+        return (1, 0)
+    # every generator appears twice in the relator, a cross-cap if with the same sign
+    twisted = any(relator.count(label) == 2 for label in relator)
+    return (0, generators) if twisted else (1, generators // 2)
+
+
+def test_simplified_presentation_agrees_with_invariants():
+    rng = random.Random(23)
+    for _ in range(500):
+        n = 2 * rng.randint(1, 12)
+        word = random_word(n, rng) if rng.random() < 0.5 else random_orientable_word(n, rng)
+        generators, relators = raw_presentation(word)
+        assert generators == n // 2
+        assert relators[0] and len(relators[0]) == n
+        simplified = simplify_presentation(generators, relators)
+        assert presentation_classification(*simplified) == invariant_classification(word), word
+        if simplified[1]:
+            assert tuple(simplified[1]) == canonical_word(simplified[1])
+
+
+def test_presentation_does_not_depend_on_the_labels():
+    rng = random.Random(24)
+    for _ in range(100):
+        # rotating the polygon can change the spanning tree, renaming the pairs can't
+        word = random_word(2 * rng.randint(1, 10), rng)
+        names = list(range(1, len(word) // 2 + 1))
+        rng.shuffle(names)
+        renamed = [names[abs(label) - 1] * (1 if label > 0 else -1) for label in word]
+        assert polygon_presentation(renamed) == polygon_presentation(word)
+
+
+def test_standard_presentations():
+    assert polygon_presentation([1, -1])["simplified"] == "{1}"
+    assert polygon_presentation([1, 1])["simplified"] == "⟨ x_1 | x_1 x_1 = 1 ⟩"
+    assert polygon_presentation([1, 2, -1, -2])["simplified"] == "⟨ x_1, x_2 | x_1 x_2 x_1^-1 x_2^-1 = 1 ⟩"
+    # the sphere a b b^-1 a^-1: both edges go to the spanning tree
+    assert polygon_presentation([1, 2, -2, -1]) == {"raw": "⟨ x_1, x_2 | x_1 x_2 x_2^-1 x_1^-1 = 1, x_1 = 1, x_2 = 1 ⟩",
+                                                     "simplified": "{1}"}
@@ -0,0 +1,74 @@
+import json
+import random
+from benchmarks import random_word
+from classification import classification_2, classify_lines, main, remove_torus, surface_classification
+from invariants import invariant_classification
+from objects import CompactSurface
+from words import SignedWord
+
+# the reduction of classification.py on random words and on the cases fixed along the way, and
+# the batch mode of the command line
+
+
+def test_reduction_agrees_with_invariants():
+    rng = random.Random(7)
+    for _ in range(1000):
+        word = random_word(2 * rng.randint(1, 10), rng)
+        assert classification_2(SignedWord(word)) == invariant_classification(word), word
+
+
+def test_two_gons():
+    # the final 2-gon is a sphere if its edges run in opposite directions, whichever way they are stored
+    assert surface_classification(CompactSurface(2, {(0, 1)}, {((0, 1), (0, 1))})) == (0, 0, 1)
+    assert surface_classification(CompactSurface(2, {(1, 0)}, {((1, 0), (1, 0))})) == (0, 0, 1)
+    assert classification_2(SignedWord([1, -1])) == (1, 0)
+    assert classification_2(SignedWord([1, 1])) == (0, 1)
+    # words that end their reduction on a 2-gon
+    assert classification_2(SignedWord([1, 2, 2, -1])) == (0, 1)
+    assert classification_2(SignedWord([1, 2, -2, -1])) == (1, 0)
+
+
+def test_torus_pairs_stored_in_any_order():
+    # a b a^-1 b^-1 with the edges of each pair stored as (max, min) and as (min, max)
+    edges = {(0, 1), (1, 2), (3, 2), (0, 3)}
+    for gluing in ({((0, 1), (3, 2)), ((1, 2), (0, 3))}, {((3, 2), (0, 1)), ((0, 3), (1, 2))}):
+        surface = CompactSurface(4, edges, gluing)
+        assert remove_torus(surface) is None
+        assert classification_2(surface) == (1, 1)
+
+
+def test_torus_reassembly_keeps_the_euler_characteristic():
+    # a X b Y a^-1 Z b^-1 W becomes Z Y X W: genus 2 plus a sphere and a cross-cap inside the segments
+    for word in ([1, 3, 2, -3, -1, 4, 4, -2], [1, 2, 3, -1, -2, -3], [1, 5, 2, 6, -1, -6, -2, -5]):
+        assert classification_2(SignedWord(word)) == invariant_classification(word), word
+
+
+BATCH_LINES = [
+    "1 2 -1 -2",
+    "1 2147483648 -1 -2147483648",
+    "a a b b",
+    '{"vertices": 1e400, "edges": [], "pairs": []}',
+    "[1, 1]",
+    "1 2 -1",
+    '{"word": [1, 2, 3, -1, -2, -3]}',
+]
+
+
+def test_batch_lines_report_errors_per_line():
+    for jobs in (1, 2):
+        results = list(classify_lines(BATCH_LINES, jobs=jobs, chunk_size=2))
+        assert [result["index"] for result in results] == list(range(len(BATCH_LINES)))
+        assert ["error" in result for result in results] == [False, True, False, True, False, True, False]
+        assert (results[0]["orientability"], results[0]["genus"]) == (1, 1)
+        assert (results[2]["orientability"], results[2]["genus"]) == (0, 2)
+        assert (results[4]["orientability"], results[4]["genus"]) == (0, 1)
+        assert (results[6]["orientability"], results[6]["genus"]) == invariant_classification([1, 2, 3, -1, -2, -3])
+
+
+def test_command_line_batch(tmp_path, capsys):
+    path = tmp_path / "surfaces.txt"
+    path.write_text("# a comment\n" + "\n".join(BATCH_LINES) + "\n")
+    main([str(path)])
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(results) == len(BATCH_LINES)
+    assert sum("error" in result for result in results) == 3
@@ -0,0 +1,67 @@
+import json
+import random
+import pytest
+from batch import classify_batch
+from benchmarks import random_word
+from corpus import Corpus, convert_json, write_corpus
+from invariants import invariant_classification
+from words import SignedWord, compact_labels
+
+# binary corpora written and memory-mapped back, and classified in batches
+
+
+def test_corpus_round_trip(tmp_path, monkeypatch):
+    # small chunks, so that the surfaces are validated and written in several of them
+    monkeypatch.setattr("corpus.CHUNK_LABELS", 50)
+    rng = random.Random(40)
+    words = [random_word(2 * rng.randint(1, 20), rng) for _ in range(100)]
+    path = str(tmp_path / "words.corpus")
+    assert write_corpus(path, [SignedWord(word) if i % 2 else word for i, word in enumerate(words)]) == 100
+    with Corpus(path) as corpus:
+        assert len(corpus) == 100
+        assert [list(surface) for surface in corpus] == [compact_labels(word) for word in words]
+        assert list(corpus[-1]) == compact_labels(words[-1])
+        with pytest.raises(IndexError):
+            corpus[100]
+
+        values, offsets = corpus.batch(10, 60)
+        orientability, genus, _ = classify_batch(values, offsets)
+        assert list(zip(orientability.tolist(), genus.tolist())) == [invariant_classification(word) for word in words[10:60]]
+        values, offsets = corpus.batch(90, 1000)
+        assert len(offsets) == 11 and len(values) == sum(len(word) for word in words[90:])
+
+
+def test_invalid_surfaces_are_not_written(tmp_path):
+    path = tmp_path / "bad.corpus"
+    with pytest.raises(ValueError, match="Surface 2"):
+        write_corpus(str(path), [[1, 1], [1, -1], [1, 2, 1]])
+    assert not path.exists()
+
+
+@pytest.mark.parametrize("data", [b"", b"SURFCORP", b"NOTACORP" + bytes(32)])
+def test_other_files_are_refused(tmp_path, data):
+    path = tmp_path / "other.corpus"
+    path.write_bytes(data)
+    with pytest.raises(ValueError):
+        Corpus(str(path))
+
+
+def test_truncated_corpus_is_refused(tmp_path):
+    path = tmp_path / "words.corpus"
+    write_corpus(str(path), [[1, 2, -1, -2]])
+    path.write_bytes(path.read_bytes()[:-4])
+    with pytest.raises(ValueError):
+        Corpus(str(path))
+
+
+def test_convert_json(tmp_path):
+    payloads = [{"word": [1, 2, -1, -2]}, {"word": "a a b b"}]
+    source = tmp_path / "surfaces.ndjson"
+    source.write_text("\n".join(json.dumps(payload) for payload in payloads))
+    assert convert_json(str(source), str(tmp_path / "surfaces.corpus")) == 2
+    with Corpus(str(tmp_path / "surfaces.corpus")) as corpus:
+        assert [list(surface) for surface in corpus] == [[1, 2, -1, -2], [1, 1, 2, 2]]
+
+    source.write_text(json.dumps(payloads + [{"word": [1, 2]}]))
+    with pytest.raises(ValueError, match="Surface 2"):
+        convert_json(str(source), str(tmp_path / "bad.corpus"))
@@ -0,0 +1,117 @@
+import itertools
+import json
+import numpy as np
+import pytest
+from batch import classify_batch, validate_batch
+from enumeration import enumerate_gluings
+from invariants import invariant_classification
+from sampling import iter_genus_distribution, random_words, sample_genus_distribution, wilson_interval
+
+# the exact counts of enumeration.py against classifying every gluing, and the Monte Carlo
+# estimates of sampling.py against the exact counts
+
+
+def pairings(positions):
+    # all the ways to pair the positions
+    if not positions:
+        yield []
+        return
+    first, rest = positions[0], positions[1:]
+    for k, other in enumerate(rest):
+        for pairing in pairings(rest[:k] + rest[k + 1:]):
+            yield [(first, other)] + pairing
+
+
+def brute_force(edges, orientable=False):
+    # every gluing of the polygon, the first edge of every pair positive
+    table = {}
+    for pairing in pairings(list(range(edges))):
+        twists = [(False,) * len(pairing)] if orientable else itertools.product((False, True), repeat=len(pairing))
+        for twist in twists:
+            word = [0] * edges
+            for label, ((i, j), same) in enumerate(zip(pairing, twist), 1):
+                word[i], word[j] = label, label if same else -label
+            key = invariant_classification(word)
+            table[key] = table.get(key, 0) + 1
+    return table
+
+
+@pytest.mark.parametrize("edges", [2, 4, 6, 8])
+def test_counts_agree_with_the_brute_force(edges):
+    assert enumerate_gluings(edges) == brute_force(edges)
+    assert enumerate_gluings(edges, orientable=True) == brute_force(edges, orientable=True)
+
+
+def test_harer_zagier_numbers():
+    # the orientable gluings of a 10-gon and of a 12-gon
+    assert enumerate_gluings(10, orientable=True) == {(1, 0): 42, (1, 1): 420, (1, 2): 483}
+    assert enumerate_gluings(12, orientable=True, split_depth=3) == {(1, 0): 132, (1, 1): 2310, (1, 2): 6468,
+                                                                     (1, 3): 1485}
+
+
+def test_checkpoints_resume_the_same_run(tmp_path):
+    checkpoint = str(tmp_path / "run.json")
+    calls = []
+    table = enumerate_gluings(10, checkpoint=checkpoint, progress=lambda done, tasks: calls.append(done))
+    assert table == brute_force(10)
+    assert calls == list(range(1, len(calls) + 1))
+    with open(checkpoint) as f:
+        assert len(json.load(f)["done"]) == len(calls)
+    # nothing is left to run
+    calls.clear()
+    assert enumerate_gluings(10, checkpoint=checkpoint, progress=lambda done, tasks: calls.append(done)) == table
+    assert calls == []
+    with pytest.raises(ValueError):
+        enumerate_gluings(10, orientable=True, checkpoint=checkpoint)
+
+
+def test_processes_give_the_same_counts():
+    assert enumerate_gluings(10, jobs=2, split_depth=3) == enumerate_gluings(10)
+
+
+def test_random_words_are_valid_gluings():
+    rng = np.random.default_rng(70)
+    words = random_words(12, 500, rng)
+    assert validate_batch(words) == {}
+    orientable = random_words(12, 500, rng, orientable=True)
+    orientability, genus, _ = classify_batch(orientable)
+    assert orientability.all()
+    expected = [invariant_classification(word) for word in words.tolist()]
+    orientability, genus, _ = classify_batch(words)
+    assert list(zip(orientability.tolist(), genus.tolist())) == expected
+    with pytest.raises(ValueError):
+        random_words(5, 1, rng)
+
+
+def test_estimates_cover_the_exact_distribution():
+    exact = brute_force(8)
+    total = sum(exact.values())
+    state = sample_genus_distribution(8, samples=20000, chunk_size=3000, seed=71, confidence=0.999)
+    assert state["samples"] == 20000
+    assert sum(surface["count"] for surface in state["surfaces"]) == 20000
+    for surface in state["surfaces"]:
+        probability = exact[surface["orientability"], surface["genus"]] / total
+        assert surface["low"] <= probability <= surface["high"], surface
+
+
+def test_runs_do_not_depend_on_the_processes():
+    options = {"samples": 5000, "chunk_size": 1000, "seed": 72}
+    assert sample_genus_distribution(10, jobs=2, **options) == sample_genus_distribution(10, **options)
+
+
+def test_precision_stops_the_run():
+    states = list(iter_genus_distribution(6, chunk_size=2000, seed=73, precision=0.02, orientable=True))
+    assert all(surface["orientability"] == 1 for surface in states[-1]["surfaces"])
+    assert all((surface["high"] - surface["low"]) / 2 <= 0.02 for surface in states[-1]["surfaces"])
+    assert len(states) == 1 or any((surface["high"] - surface["low"]) / 2 > 0.02
+                                   for surface in states[-2]["surfaces"])
+    with pytest.raises(ValueError):
+        sample_genus_distribution(6)
+
+
+def test_wilson_interval():
+    assert wilson_interval(0, 0, 1.96) == (0.0, 1.0)
+    low, high = wilson_interval(0, 100, 1.96)
+    assert low == 0.0 and 0 < high < 0.05
+    low, high = wilson_interval(50, 100, 1.96)
+    assert low < 0.5 < high and high - 0.5 == pytest.approx(0.5 - low)
@@ -0,0 +1,41 @@
+import random
+from benchmarks import random_word, random_orientable_word
+from homology import check_homology, expected_homology, homology_groups, mod2_homology
+from invariants import invariant_classification
+
+# the homology of the chain complex of the polygon against the homology of the classified surface
+
+
+def test_homology_agrees_with_the_classification():
+    rng = random.Random(19)
+    for _ in range(500):
+        n = 2 * rng.randint(1, 12)
+        word = random_word(n, rng) if rng.random() < 0.5 else random_orientable_word(n, rng)
+        integral, mod2 = expected_homology(invariant_classification(word))
+        assert homology_groups(word) == integral, word
+        assert mod2_homology(word) == mod2, word
+
+
+def test_homology_of_the_standard_words():
+    assert mod2_homology([1, 1]) == [1, 1, 1]
+    assert homology_groups([1, 1]) == [(1, []), (0, [2]), (0, [])]
+    assert mod2_homology([1, 2, -1, -2]) == [1, 2, 1]
+    assert homology_groups([1, 2, -1, -2]) == [(1, []), (2, []), (1, [])]
+    assert mod2_homology([1, 1, 2, 2]) == [1, 2, 1]
+    assert homology_groups([1, 1, 2, 2]) == [(1, []), (1, [2]), (0, [])]
+
+
+def test_check_homology_scales_to_large_spheres():
+    # the adjacent pairs 1 -1 2 -2 ... took minutes with an elimination over Z/2
+    n = 10 ** 5
+    word = [x for i in range(1, n // 2 + 1) for x in (i, -i)]
+    check = check_homology(word, (1, 0))
+    assert check["agrees"]
+    assert check["mod2"] == [1, 0, 1]
+    nested = list(range(1, n // 2 + 1)) + list(range(-n // 2, 0))
+    assert check_homology(nested, (1, 0))["agrees"]
+
+
+def test_check_homology_notices_a_wrong_classification():
+    assert not check_homology([1, 2, -1, -2], (1, 2))["agrees"]
+    assert not check_homology([1, 1], (1, 0))["agrees"]
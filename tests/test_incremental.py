@@ -0,0 +1,86 @@
+import random
+import pytest
+from benchmarks import random_word
+from incremental import ClassifierSession, SessionStore
+from invariants import invariant_classification, vertex_classes
+
+# the classification kept up to date through random edits, against classifying the edited word
+
+
+def random_edit(rng, n):
+    if rng.random() < 0.4:
+        return "flip", [rng.randrange(n)]
+    return "swap", [rng.randrange(n), rng.randrange(n)]
+
+
+def apply_edit(word, operation, positions):
+    if operation == "flip":
+        word[positions[0]] = -word[positions[0]]
+    else:
+        i, j = positions
+        word[i], word[j] = word[j], word[i]
+
+
+def test_session_follows_random_edits():
+    rng = random.Random(60)
+    for _ in range(30):
+        word = random_word(2 * rng.randint(1, 30), rng)
+        session = ClassifierSession(word)
+        for _ in range(100):
+            operation, positions = random_edit(rng, len(word))
+            getattr(session, operation)(*positions)
+            apply_edit(word, operation, positions)
+            assert session.classification() == invariant_classification(word), word
+            assert session.vertex_classes == vertex_classes(word).classes, word
+        assert session.word() == word
+
+
+def test_positions_are_checked():
+    session = ClassifierSession([1, 2, -1, -2])
+    with pytest.raises(IndexError):
+        session.flip(4)
+    with pytest.raises(IndexError):
+        session.swap(0, -1)
+    assert session.classification() == (1, 1)
+
+
+def test_store_is_shared_by_processes(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store, other = SessionStore(path), SessionStore(path)
+    rng = random.Random(61)
+    word = random_word(10, rng)
+    session_id, session = store.create(word)
+    assert session.version == 0
+    # more edits than letters, so the word is written again on the way
+    for step in range(35):
+        edits = [random_edit(rng, len(word)) for _ in range(rng.randint(1, 3))]
+        session = (store if step % 2 else other).edit(session_id, edits)
+        for operation, positions in edits:
+            apply_edit(word, operation, positions)
+        assert session.classification() == invariant_classification(word)
+    for replica in (store.get(session_id), other.get(session_id)):
+        assert replica.word() == word
+        assert replica.version == session.version
+    assert other.delete(session_id)
+    assert store.get(session_id) is None
+    assert store.edit(session_id, [("flip", [0])]) is None
+    assert not store.delete(session_id)
+
+
+def test_a_failed_edit_leaves_the_session_as_it_was(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.sqlite3"))
+    session_id, _ = store.create([1, 2, -1, -2])
+    with pytest.raises(IndexError):
+        store.edit(session_id, [("flip", [0]), ("flip", [9])])
+    session = store.get(session_id)
+    assert session.word() == [1, 2, -1, -2] and session.version == 0
+
+
+def test_least_recently_used_sessions_are_dropped(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.sqlite3"), max_sessions=3, max_local=2)
+    ids = [store.create([1, 1])[0] for _ in range(3)]
+    store.edit(ids[0], [("flip", [0])])
+    store.create([1, -1])
+    assert store.get(ids[1]) is None
+    assert store.get(ids[0]).classification() == (1, 0)
+    assert store.get(ids[2]).classification() == (0, 1)
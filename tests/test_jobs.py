@@ -0,0 +1,70 @@
+import queue
+import random
+import time
+import pytest
+from benchmarks import random_word
+from execution import ClassificationPool
+from invariants import invariant_classification
+from jobs import JobQueue
+from words import SignedWord
+
+# background jobs run in a process pool, with their records in a SQLite file shared by all the
+# JobQueues that open it
+
+
+@pytest.fixture
+def pool():
+    pool = ClassificationPool(max_workers=2, inline_limit=0)
+    yield pool
+    pool.shutdown()
+
+
+def wait(jobs, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = jobs.status(job_id, with_result=True)
+        if status["status"] in ("done", "failed"):
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_jobs_agree_with_invariants(tmp_path, pool):
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite3"), pool, workers=2)
+    # another process of the app sees the same records
+    other = JobQueue(str(tmp_path / "jobs.sqlite3"), pool)
+    rng = random.Random(10)
+    words = [random_word(2 * rng.randint(1, 20), rng) for _ in range(10)]
+    ids = [jobs.submit(SignedWord(word)) for word in words]
+    for word, job_id in zip(words, ids):
+        status = wait(other, job_id)
+        assert status["status"] == "done"
+        assert status["result"] == invariant_classification(word)
+        assert status["vertices"] == 0
+        assert "result" not in other.status(job_id)
+    assert other.status("unknown") is None
+
+
+def test_failed_jobs_keep_their_error(tmp_path, pool):
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite3"), pool)
+    status = wait(jobs, jobs.submit(SignedWord([1, -1]), engine="no such engine"))
+    assert status["status"] == "failed"
+    assert status["result"] is None
+    assert "engine" in status["error"]
+
+
+def test_the_queue_is_bounded(tmp_path, pool):
+    # no worker is started until the first submit, so the jobs wait
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite3"), pool, workers=0, max_pending=2)
+    jobs.submit(SignedWord([1, 1]))
+    jobs.submit(SignedWord([1, 1]))
+    with pytest.raises(queue.Full):
+        jobs.submit(SignedWord([1, 1]))
+    assert jobs.pending() == 2
+
+
+def test_only_the_latest_finished_jobs_are_kept(tmp_path, pool):
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite3"), pool, max_finished=3)
+    ids = [jobs.submit(SignedWord([1, 2, -1, -2])) for _ in range(6)]
+    wait(jobs, ids[-1])
+    assert [jobs.status(job_id) is not None for job_id in ids] == [False] * 3 + [True] * 3
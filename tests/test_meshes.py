@@ -0,0 +1,82 @@
+import io
+import numpy as np
+import pytest
+from meshes import classify_mesh, read_obj, read_off
+
+# closed triangle meshes of known surfaces, and meshes that are not closed surfaces
+
+TETRAHEDRON = [[0, 1, 2], [0, 3, 1], [0, 2, 3], [1, 3, 2]]
+
+
+def grid(m, n, twisted=False):
+    # triangulated m x n grid with the sides glued: a torus, or a Klein bottle if the
+    # second gluing reverses the direction
+    def vertex(i, j):
+        if i == m:
+            i, j = 0, (-j if twisted else j)
+        return i * n + j % n
+
+    faces = []
+    for i in range(m):
+        for j in range(n):
+            a, b, c, d = vertex(i, j), vertex(i + 1, j), vertex(i + 1, j + 1), vertex(i, j + 1)
+            faces += [[a, b, c], [a, c, d]]
+    return np.array(faces)
+
+
+def surfaces(report):
+    return [(component["orientability"], component["genus"]) for component in report["components"]]
+
+
+def test_closed_surfaces():
+    sphere = classify_mesh(TETRAHEDRON)
+    assert sphere["manifold"] and surfaces(sphere) == [(1, 0)]
+    assert sphere["components"][0]["euler_characteristic"] == 2
+    torus = classify_mesh(grid(4, 5))
+    assert torus["manifold"] and surfaces(torus) == [(1, 1)]
+    assert (torus["vertices"], torus["edges"], torus["faces"]) == (20, 60, 40)
+    assert surfaces(classify_mesh(grid(4, 5, twisted=True))) == [(0, 2)]
+    # reversing a face of the torus does not change the surface
+    flipped = grid(4, 5)
+    flipped[7] = flipped[7][::-1]
+    assert surfaces(classify_mesh(flipped)) == [(1, 1)]
+
+
+def test_components_and_vertex_numbers():
+    # the vertex indices need not start at 0 or be contiguous
+    faces = np.concatenate((np.array(TETRAHEDRON) * 10 + 7, grid(3, 4) + 100))
+    report = classify_mesh(faces)
+    assert sorted(surfaces(report)) == [(1, 0), (1, 1)]
+    assert sorted(component["faces"] for component in report["components"]) == [4, 24]
+
+
+def test_meshes_that_are_not_closed_surfaces():
+    open_mesh = classify_mesh(TETRAHEDRON[:3])
+    assert not open_mesh["manifold"] and open_mesh["boundary_edges"] == 3
+    # two tetrahedra sharing the vertex 0
+    pinched = classify_mesh(TETRAHEDRON + [[0, 4, 5], [0, 6, 4], [0, 5, 6], [4, 6, 5]])
+    assert not pinched["manifold"] and pinched["nonmanifold_vertices"] == 1
+    assert pinched["components"] == []
+    # three triangles on the edge 0 1
+    fin = classify_mesh(TETRAHEDRON + [[0, 1, 4]])
+    assert fin["nonmanifold_edges"] == 1 and not fin["manifold"]
+    assert classify_mesh(TETRAHEDRON + [[0, 0, 1]])["degenerate_faces"] == 1
+    with pytest.raises(ValueError):
+        classify_mesh([[0, 1, 2, 3]])
+
+
+def test_obj_and_off_files():
+    # a cube with quadrilateral faces, as OBJ with texture and normal indices and as OFF
+    quads = [[1, 2, 3, 4], [5, 8, 7, 6], [1, 5, 6, 2], [2, 6, 7, 3], [3, 7, 8, 4], [5, 1, 4, 8]]
+    obj = "v 0 0 0\n# a comment\n" + "".join(
+        "f " + " ".join(f"{v}/{v}/1" for v in face) + "\n" for face in quads)
+    faces = read_obj(io.BytesIO(obj.encode()))
+    assert faces.shape == (12, 3)
+    assert surfaces(classify_mesh(faces)) == [(1, 0)]
+    off = "OFF\n8 6 12\n" + "0 0 0\n" * 8 + "".join(
+        "4 " + " ".join(str(v - 1) for v in face) + " 255 0 0\n" for face in quads)
+    assert np.array_equal(read_off(io.BytesIO(off.encode())), faces)
+    with pytest.raises(ValueError):
+        read_obj(io.BytesIO(b"f 1 2\n"))
+    with pytest.raises(ValueError):
+        read_off(io.BytesIO(b"PLY\n"))
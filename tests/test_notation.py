@@ -0,0 +1,49 @@
+import io
+import random
+import pytest
+from benchmarks import random_word
+from notation import WordParser, WordSyntaxError, format_word, parse_word, read_word
+from words import SignedWord, as_word, compact_labels
+
+# the polygon word notation, against format_word and fed in chunks of any size
+
+
+def test_format_and_parse_round_trip():
+    rng = random.Random(30)
+    for _ in range(200):
+        # more than 26 pairs for the names x27, x28, ...
+        word = random_word(2 * rng.randint(1, 40), rng)
+        text = format_word(word)
+        assert list(as_word(parse_word(text))) == compact_labels(word), text
+        assert list(as_word(read_word(io.BytesIO(text.encode())))) == compact_labels(word), text
+
+
+def test_parser_accepts_any_chunking():
+    text = "a_1 b'\n* a_1^{-1} b12 b^-1 b12"
+    expected = list(as_word(parse_word(text)))
+    assert expected == [1, -2, -1, 3, -2, 3]
+    for size in range(1, len(text) + 1):
+        parser = WordParser()
+        for start in range(0, len(text), size):
+            parser.feed(text[start:start + size])
+        assert list(as_word(parser.close())) == expected
+
+
+@pytest.mark.parametrize("text", ["a b a^-1 b^-1", "aba^-1b^-1", "a*b*a^{-1}*b'", "  a\tb\na'  b^{-1}\n"])
+def test_notations_of_the_torus(text):
+    assert parse_word(text) == SignedWord([1, 2, -1, -2])
+
+
+@pytest.mark.parametrize("text, message, line, column", [
+    ("a b\na^-1 b c", "Letter c appears only once", 2, 8),
+    ("a a a", "Letter a appears more than twice", 1, 5),
+    ("a b a b^2", "Expected '-' or '{' after '^'", 1, 9),
+    ("a\n\n a^{-1", "the word ended", 3, 7),
+    ("a 1 a", "Unexpected character '1'", 1, 3),
+    ("  \n ", "The word is empty", 2, 2),
+])
+def test_syntax_errors_say_where(text, message, line, column):
+    with pytest.raises(WordSyntaxError) as error:
+        parse_word(text)
+    assert message in str(error.value)
+    assert (error.value.line, error.value.column) == (line, column)
@@ -0,0 +1,70 @@
+import io
+import json
+import random
+import pytest
+from benchmarks import random_word
+from invariants import invariant_classification
+from notation import format_word
+from payloads import binary_word, read_binary_word, surface_from_binary, surface_from_line, surface_from_payload
+from streams import PayloadTooLarge
+from words import MAX_LABEL, SignedWord, as_word
+
+# every way of sending a surface gives the same surface, and bad input is a ValueError or a
+# TypeError, never an OverflowError
+
+
+def test_all_forms_give_the_same_surface():
+    rng = random.Random(25)
+    for _ in range(200):
+        word = random_word(2 * rng.randint(1, 10), rng)
+        expected = invariant_classification(word)
+        surface = SignedWord(word).to_surface()
+        polygon = {
+            "vertices": surface.vertices,
+            "edges": [list(edge) for edge in surface.edges],
+            "pairs": [[list(edge1), list(edge2)] for edge1, edge2 in surface.gluing],
+        }
+        forms = [
+            surface_from_payload({"word": word}),
+            surface_from_payload({"word": format_word(word)}),
+            surface_from_payload(polygon),
+            surface_from_line(json.dumps(word)),
+            surface_from_line(" ".join(map(str, word))),
+            surface_from_line(", ".join(map(str, word))),
+            surface_from_line(format_word(word)),
+            surface_from_binary(binary_word(word)),
+        ]
+        for form in forms:
+            assert invariant_classification(as_word(form)) == expected, (word, form)
+
+
+@pytest.mark.parametrize("payload", [
+    {"vertices": 1e400, "edges": [], "pairs": []},
+    {"vertices": -4, "edges": [], "pairs": []},
+    {"vertices": MAX_LABEL + 1, "edges": [], "pairs": []},
+    {"vertices": 4, "edges": [[0, 1], [1, 2], [2, 3], [3, 0]], "pairs": []},
+    {"word": [1, 2 ** 40, -1, -2 ** 40]},
+    {"word": [-2 ** 31, -2 ** 31]},
+    {"word": [1, 2, -1]},
+])
+def test_bad_payloads_raise_value_error(payload):
+    with pytest.raises(ValueError):
+        surface_from_payload(payload)
+
+
+@pytest.mark.parametrize("line", ["1 2147483648 -1 -2147483648", "[1, 99999999999, -1, -99999999999]",
+                                  "1 2 -1", "a b", '{"vertices": 1e400}'])
+def test_bad_lines_raise_value_error(line):
+    with pytest.raises(ValueError):
+        surface_from_line(line)
+
+
+def test_binary_words_are_bounded_and_validated():
+    data = binary_word([1, 2, -1, -2])
+    assert list(read_binary_word(io.BytesIO(data), len(data))) == [1, 2, -1, -2]
+    with pytest.raises(PayloadTooLarge):
+        read_binary_word(io.BytesIO(data), len(data) - 1)
+    with pytest.raises(ValueError):
+        surface_from_binary(binary_word([1, 3, -1, -3]))
+    with pytest.raises(ValueError):
+        surface_from_binary(data + b"\0")
@@ -0,0 +1,59 @@
+import random
+import pytest
+from benchmarks import random_word, random_orientable_word
+import classification
+from classification import classification_2, classification_from_counts, classify, surface_classification
+from invariants import invariant_classification
+from reduction import ReductionStalled, reduce_surface
+from result_cache import surface_key
+from words import SignedWord
+
+# the in place reduction of reduction.py against the invariant engine and the reduction of
+# classification.py, on random words
+
+
+def random_words(count, seed, max_pairs=12):
+    rng = random.Random(seed)
+    for _ in range(count):
+        n = 2 * rng.randint(1, max_pairs)
+        yield random_word(n, rng) if rng.random() < 0.5 else random_orientable_word(n, rng)
+
+
+def test_reduce_surface_agrees_with_the_other_engines():
+    for word in random_words(2000, seed=4):
+        projective_planes, tori, sphere = reduce_surface(word)
+        expected = invariant_classification(word)
+        assert classification_from_counts(projective_planes, tori) == expected, word
+        assert classification_2(SignedWord(word)) == expected, word
+
+
+def test_counts_may_differ_but_not_the_surface():
+    # the two reductions remove different cross-caps from this word
+    word = [5, -6, 8, 8, 4, -2, 1, -3, -3, -2, 5, 1, 7, -4, 6, -7]
+    projective_planes, tori, _ = reduce_surface(word)
+    legacy_planes, legacy_tori, _ = surface_classification(SignedWord(word))
+    assert classification_from_counts(projective_planes, tori) == classification_from_counts(legacy_planes, legacy_tori)
+
+
+def test_reduce_surface_budgets():
+    word = [1, 2, -1, -2, 3, 4, -3, -4, 5, 6, -5, -6]
+    with pytest.raises(ReductionStalled) as stalled:
+        reduce_surface(word, max_steps=1)
+    assert stalled.value.reason == "steps"
+    with pytest.raises(ReductionStalled) as stalled:
+        reduce_surface(word, max_seconds=1e-9)
+    assert stalled.value.reason == "time"
+    assert reduce_surface(word, max_steps=3) == (0, 3, 0)
+
+
+def test_in_place_engine_falls_back(monkeypatch):
+    import reduction
+    monkeypatch.setattr(reduction, "step_budget", 1)
+    word = SignedWord([1, 2, -1, -2, 3, 4, -3, -4])
+    assert classify(word, "in_place") == (1, 2)
+    # the record has the length and the key of the surface, not the whole word
+    record = classification.recent_fallbacks[-1]
+    assert "word" not in record
+    assert record["length"] == 8 and record["prefix"] == list(word)
+    assert record["key"] == surface_key(word).hex()
+    assert record["reason"] == "steps"
@@ -0,0 +1,70 @@
+import random
+from benchmarks import random_word
+from invariants import invariant_classification
+from result_cache import COMMON_WORDS, ResultCache, cached_classify, surface_key
+from words import SignedWord
+
+# the shared cache of classifications, keyed by the canonical word
+
+
+def test_symmetric_polygons_share_their_entry(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    rng = random.Random(50)
+    for _ in range(50):
+        word = random_word(2 * rng.randint(1, 10), rng)
+        expected = invariant_classification(word)
+        assert cached_classify(SignedWord(word), cache=cache) == expected
+        k = rng.randrange(len(word))
+        rotated = [-label for label in reversed(word[k:] + word[:k])]
+        assert surface_key(rotated) == surface_key(word)
+        assert cache.get(cache.key(rotated)) == expected
+    stats = cache.stats()
+    # short words come up again, every miss adds an entry and every rotated lookup hits
+    assert stats["hits"] + stats["misses"] == 100
+    assert stats["misses"] == stats["entries"] < 50
+
+
+def test_processes_share_the_file(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    cache, other = ResultCache(path), ResultCache(path)
+    cache.warm_up()
+    for word in COMMON_WORDS:
+        assert other.get(other.key(word)) == invariant_classification(word)
+    other.flush()
+    assert cache.stats()["hits"] == len(COMMON_WORDS)
+    cache.clear()
+    assert other.get(other.key([1, 1])) is None
+    assert other.stats()["entries"] == 0
+
+
+def test_large_surfaces_are_not_cached(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"), max_edges=4)
+    assert cache.key([1, 2, -1, -2]) is not None
+    assert cache.key([1, 2, 3, -1, -2, -3]) is None
+    assert cached_classify([1, 2, 3, -1, -2, -3], cache=cache) == (1, 1)
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"), max_entries=10)
+    words = [[label for i in range(1, n + 1) for label in (i, -i)] for n in range(1, 12)]
+    for word in words[:10]:
+        cache.put(cache.key(word), (1, 0))
+    # the first word is used again, so the second one is the oldest
+    assert cache.get(cache.key(words[0])) == (1, 0)
+    cache.flush()
+    cache.put(cache.key(words[10]), (1, 0))
+    stats = cache.stats()
+    assert stats["entries"] == 9 and stats["evictions"] == 2
+    assert cache.get(cache.key(words[0])) == (1, 0)
+    assert cache.get(cache.key(words[1])) is None
+
+
+def test_database_errors_are_misses(tmp_path, caplog):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    cache.put(cache.key([1, 1]), (0, 1))
+    cache._database.connection().execute("DROP TABLE results")
+    assert cache.get(cache.key([1, 1])) is None
+    cache.put(cache.key([1, 1]), (0, 1))
+    assert cached_classify([1, 1], cache=cache) == (0, 1)
+    assert "Result cache" in caplog.text
@@ -0,0 +1,81 @@
+import io
+import json
+import pytest
+from streams import PayloadTooLarge, iter_chunks, iter_json_values, iter_lines, read_into, read_limited
+
+# the incremental readers of streams.py, fed a few bytes at a time
+
+
+class Trickle(io.BytesIO):
+    # a stream that never returns more than size bytes at once, like a slow client
+    def __init__(self, data, size=3):
+        super().__init__(data)
+        self.size = size
+
+    def read(self, size=-1):
+        return super().read(self.size if size < 0 else min(size, self.size))
+
+
+VALUES = [{"word": [1, 2, -1, -2]}, [1, 1], 12345678901234567890, "a é \"]\"", None, True, 1.5, -2e-3]
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 1 << 16])
+def test_json_arrays_and_ndjson(size):
+    array = json.dumps(VALUES, indent=1).encode()
+    assert list(iter_json_values(Trickle(b"\n  " + array, size))) == VALUES
+    ndjson = "\n".join(json.dumps(value) for value in VALUES).encode()
+    assert list(iter_json_values(Trickle(ndjson + b"\n\n", size))) == VALUES
+    assert list(iter_json_values(Trickle(b"[]", size))) == []
+    assert list(iter_json_values(Trickle(b"", size))) == []
+
+
+def test_numbers_cut_by_a_chunk():
+    # raw_decode reads 1 out of "1." and 2 out of "2e", the number must wait for the next chunk
+    data = b"[1.25,2e3,-3.5E-1,40]"
+    for size in range(1, len(data) + 1):
+        assert list(iter_json_values(Trickle(data, size))) == [1.25, 2e3, -3.5e-1, 40]
+
+
+def test_bad_ndjson_lines_are_yielded_as_errors():
+    values = list(iter_json_values(Trickle(b'{"word": [1, 1]}\n{"word"\n2\n')))
+    assert values[0] == {"word": [1, 1]} and values[2] == 2
+    assert isinstance(values[1], ValueError)
+
+
+@pytest.mark.parametrize("data, good", [(b"[1, 2 3]", [1, 2]), (b"[1, {", [1]), (b'[1, "a', [1]), (b"[1,", [1])])
+def test_bad_json_arrays_stop(data, good):
+    values = list(iter_json_values(Trickle(data)))
+    assert values[:-1] == good
+    assert isinstance(values[-1], ValueError)
+
+
+@pytest.mark.parametrize("data", [b'[1, "' + b"x" * 100 + b'"]', b"[1, " + b"9" * 100 + b"]",
+                                  b'1\n"' + b"x" * 100 + b'"\n3'])
+def test_values_over_the_limit_stop(data):
+    values = list(iter_json_values(Trickle(data, 7), max_value=50))
+    assert values[0] == 1
+    assert len(values) == 2 and isinstance(values[1], PayloadTooLarge)
+
+
+def test_chunks_do_not_split_characters():
+    text = "é ∂ a"
+    assert "".join(iter_chunks(Trickle(text.encode(), 1))) == text
+
+
+def test_read_limited_and_read_into():
+    assert read_limited(Trickle(b"x" * 100), 100) == b"x" * 100
+    with pytest.raises(PayloadTooLarge):
+        read_limited(Trickle(b"x" * 101), 100)
+    view = memoryview(bytearray(10))
+    read_into(Trickle(b"0123456789"), view)
+    assert bytes(view) == b"0123456789"
+    with pytest.raises(ValueError):
+        read_into(Trickle(b"012"), view)
+
+
+def test_iter_lines_limits_the_length():
+    assert list(iter_lines(["ab\nc", "d\n", "ef"], max_length=2)) == ["ab", "cd", "ef"]
+    lines = iter_lines(["ab\nc", "def"], max_length=2)
+    assert next(lines) == "ab"
+    with pytest.raises(PayloadTooLarge):
+        next(lines)
@@ -0,0 +1,45 @@
+import random
+import pytest
+from benchmarks import random_word
+from canonical import canonical_word
+from classification import classification_2
+from invariants import invariant_classification
+from words import SignedWord, as_word, compact_labels
+
+# signed words against the CompactSurface they stand for, and their validation
+
+
+@pytest.mark.parametrize("labels", [
+    [],
+    [1, 2, -1],
+    [1, 0, -1, 0],
+    [1, 1, 1, 2],
+    [1, 99999999999, -1, -99999999999],
+    [1, 2 ** 31, -1, -2 ** 31],
+])
+def test_invalid_words_raise_value_error(labels):
+    with pytest.raises(ValueError):
+        SignedWord(labels)
+
+
+def test_round_trip_through_compact_surface():
+    rng = random.Random(3)
+    for _ in range(300):
+        word = random_word(2 * rng.randint(1, 10), rng)
+        surface = SignedWord(word).to_surface()
+        assert SignedWord.from_surface(surface) == SignedWord(word), word
+        assert classification_2(surface) == invariant_classification(word), word
+
+
+def test_equality_up_to_rotation_reflection_and_relabeling():
+    rng = random.Random(5)
+    for _ in range(300):
+        word = random_word(2 * rng.randint(1, 10), rng)
+        k = rng.randrange(len(word))
+        rotated = word[k:] + word[:k]
+        relabeled = compact_labels(rotated)
+        reflected = [-label for label in reversed(word)]
+        assert SignedWord(rotated) == SignedWord(word)
+        assert SignedWord(relabeled) == SignedWord(word)
+        assert SignedWord(reflected) == SignedWord(word)
+        assert canonical_word(as_word(SignedWord(relabeled))) == canonical_word(word)
@@ -0,0 +1,161 @@
+# compact representation of a compact surface as a signed word.
+# Reading the boundary of the polygon from vertex 0 we write, for every edge, the label of its
+# pair with a positive sign if the edge goes from i to i+1 and a negative sign otherwise.
+# For example the torus a b a^-1 b^-1 is stored as [1, 2, -1, -2].
+# The word is kept in a flat array of 32-bit integers, so a surface costs 4 bytes per edge
+# instead of the sets of tuples used by CompactSurface.
+from array import array
+import objects
+from objects import CompactSurface
+from canonical import canonical_word
+
+# labels are stored as 32-bit integers
+MAX_LABEL = 2 ** 31 - 1
+
+
+class SignedWord:
+    __slots__ = ("labels",)
+
+    def __init__(self, labels):
+        try:
+            labels = array("i", labels)
+            # -2^31 fits in the array, but its inverse does not
+            if labels and min(labels) < -MAX_LABEL:
+                raise OverflowError
+        except OverflowError:
+            # callers only expect ValueError for a bad word
+            raise ValueError(f"Label out of range, labels must be at most {MAX_LABEL} in absolute value") from None
+        if len(labels) == 0 or len(labels) % 2 != 0:
+            raise ValueError("A signed word must have an even positive number of letters")
+
+        # each label must appear exactly twice
+        seen = {}
+        for label in labels:
+            if label == 0:
+                raise ValueError("Labels of a signed word must be nonzero integers")
+            seen[abs(label)] = seen.get(abs(label), 0) + 1
+        for label, count in seen.items():
+            if count != 2:
+                raise ValueError(f"Label {label} appears {count} times, each label must appear exactly twice")
+
+        self.labels = labels
+
+    @classmethod
+    def trusted(cls, labels):
+        # same as CompactSurface.trusted: skips the validation unless objects.debug_validation is set
+        if objects.debug_validation:
+            return cls(labels)
+        word = cls.__new__(cls)
+        word.labels = labels if isinstance(labels, array) and labels.typecode == "i" else array("i", labels)
+        return word
+
+    def __str__(self):
+        return " ".join(f"{label}" if label > 0 else f"{-label}^-1" for label in self.labels)
+
+    def __repr__(self):
+        return f"SignedWord({self.labels.tolist()})"
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __iter__(self):
+        return iter(self.labels)
+
+    # same notion of equality as CompactSurface: equal up to rotation, reflection and relabeling
+    def __eq__(self, other):
+        if not isinstance(other, SignedWord):
+            return NotImplemented
+        return self.canonical_form() == other.canonical_form()
+
+    def __hash__(self):
+        return hash(self.canonical_form())
+
+    @property
+    def vertices(self):
+        # the polygon has as many vertices as edges
+        return len(self.labels)
+
+    def canonical_form(self):
+        return canonical_word(self.labels)
+
+    @classmethod
+    def from_surface(cls, surface):
+        if not isinstance(surface, CompactSurface):
+            raise TypeError("Input not a compact surface")
+        return cls(surface.word())
+
+    def to_surface(self):
+        """
+        Returns the CompactSurface with the same polygon: the edge set is recovered exactly and
+        the gluing pairs are listed in order of appearance along the boundary.
+        """
+        n = len(self.labels)
+        edges = [(i, (i + 1) % n) if label > 0 else ((i + 1) % n, i) for i, label in enumerate(self.labels)]
+
+        first = {}
+        gluing = set()
+        for i, label in enumerate(self.labels):
+            if abs(label) in first:
+                gluing.add((edges[first.pop(abs(label))], edges[i]))
+            else:
+                first[abs(label)] = i
+        # the word was validated when it was built, so the polygon is valid too
+        return CompactSurface.trusted(n, set(edges), gluing)
+
+
+# auxiliary function for the engines that work on words: returns the signed labels of
+# a CompactSurface or a SignedWord. Plain sequences of labels are passed through unchecked.
+def as_word(surface):
+    if isinstance(surface, SignedWord):
+        return surface.labels
+    if isinstance(surface, CompactSurface):
+        return surface.word()
+    if isinstance(surface, (array, list, tuple, memoryview)):
+        return surface
+    raise TypeError("Input not a compact surface")
+
+
+def compact_labels(word):
+    # relabels the pairs of a signed word 1, 2, ... in order of first appearance, keeping the signs
+    # (and the zeros of an invalid word, so that validate_batch still finds them)
+    labels = {}
+    return [((label > 0) - (label < 0)) * labels.setdefault(abs(label), len(labels) + 1) for label in word]
+
+
+def as_surface(surface):
+    if isinstance(surface, SignedWord):
+        return surface.to_surface()
+    if isinstance(surface, CompactSurface):
+        return surface
+    if isinstance(surface, (array, list, tuple, memoryview)):
+        return SignedWord(surface).to_surface()
+    raise TypeError("Input not a compact surface")
+
+
+def find_interleaved_pair(sequence):
+    """
+    Looks for two keys that alternate in the sequence, a ... b ... a ... b, where every key
+    that is not None appears exactly twice. Returns the four positions (i1, i2, j1, j2) with
+    i1 < i2 < j1 < j2, where i1, j1 hold one key and i2, j2 the other, or None if the pairs
+    are all nested or disjoint.
+    The sequence can be any iterable, it is read only up to the second occurrence of b.
+    """
+    # sweep with a stack of open keys: when a key closes and it is not on top of the stack,
+    # the key on top was opened after it and is still open, so the two alternate
+    stack = []
+    opened = {}
+    letters = enumerate(sequence)
+    for position, key in letters:
+        if key is None:
+            continue
+        if key not in opened:
+            opened[key] = position
+            stack.append(key)
+        elif stack[-1] == key:
+            stack.pop()
+        else:
+            top = stack[-1]
+            for later, other in letters:
+                if other == top:
+                    return opened[key], opened[top], position, later
+    return None